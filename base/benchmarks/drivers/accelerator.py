@@ -0,0 +1,77 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+import torch
+
+# mthreads torch_musa import
+try:
+    import torch_musa
+except ImportError:
+    pass
+
+
+def _cuda_tf32(enabled):
+    torch.backends.cuda.matmul.allow_tf32 = enabled
+
+
+def _mlu_tf32(enabled):
+    torch.backends.mlu.matmul.allow_tf32 = enabled
+    torch.backends.cnnl.allow_tf32 = enabled
+
+
+def _musa_tf32(enabled):
+    torch.backends.mudnn.allow_tf32 = enabled
+
+
+# vendor: (torch device module, tf32 switch). A vendor matches the first
+# key it contains, unknown vendors use torch.cuda and can't switch tf32.
+VENDORS = {
+    "nvidia": ("cuda", _cuda_tf32),
+    "cambricon": ("cuda", _mlu_tf32),
+    "mthreads": ("musa", _musa_tf32),
+}
+
+_ACCELERATORS = {}
+
+
+class Accelerator:
+    '''Device operations of a vendor, bound once so that timed loops
+       neither compare vendor strings nor import anything.'''
+
+    def __init__(self, vendor):
+        self.vendor = vendor
+        match = [key for key in VENDORS if key in vendor]
+        if match:
+            self.device_type, tf32 = VENDORS[match[0]]
+        else:
+            print("unspecified vendor {}, using default pytorch \"torch.cuda\""
+                  .format(vendor))
+            self.device_type, tf32 = "cuda", None
+        module = getattr(torch, self.device_type)
+        self.module = module
+        self.synchronize = module.synchronize
+        self.barrier = torch.distributed.barrier
+        self.event = module.Event
+        self.memory_stats = getattr(module, "memory_stats", dict)
+        self.tf32 = tf32
+
+    def device(self, index=None):
+        '''Return the torch.device of the device index.'''
+        return torch.device(self.device_type, index)
+
+    def set_tf32(self, enabled):
+        '''Allow tf32 in matmul and conv if enabled.'''
+        if self.tf32 is None:
+            print("unspecified vendor {}, do nothing".format(self.vendor))
+            return
+        self.tf32(enabled)
+
+
+def get_accelerator(vendor):
+    '''Return the Accelerator of vendor, created on first use.'''
+    accelerator = _ACCELERATORS.get(vendor)
+    if accelerator is None:
+        accelerator = _ACCELERATORS[vendor] = Accelerator(vendor)
+    return accelerator
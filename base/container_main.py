@@ -10,6 +10,11 @@ import sys
 from argparse import ArgumentParser
 import subprocess
 
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+# utils/ of FlagPerf is mounted next to the perf path in the container.
+sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../utils")))
+from task_status import write_status_file
+
 
 def parse_args():
     parser = ArgumentParser(description=" ")
@@ -89,7 +94,7 @@ def write_pid_file(pid_file_path, pid_file):
     file_d = open(pid_file_path, "w")
     file_d.write("%s\n" % os.getpid())
     file_d.close()
-    
+
 
 if __name__ == "__main__":
     config = parse_args()
@@ -101,6 +106,9 @@ if __name__ == "__main__":
     
     logger.info(config)
     write_pid_file(config.log_dir, "start_base_task.pid")
+    start_time = time.time()
+    write_status_file(config.log_dir, "start_base_task.status", "running",
+                      start_time=start_time)
     logger.info("Success Writing PID file at " + os.path.join(config.log_dir, "start_base_task.pid"))
     if ':' not in config.case_name:
         case_name = config.case_name
@@ -130,6 +138,9 @@ if __name__ == "__main__":
         script_log_file = os.path.join(os.path.dirname(logfile), "toolkit.log.txt") 
     else:
         logger.error("Invalid BENCHMARKS_OR_TOOLKITS CONFIG, STOPPED TEST!")
+        write_status_file(config.log_dir, "start_base_task.status",
+                          "finished", start_time=start_time,
+                          end_time=time.time(), returncode=1)
         exit(1)
     
     logger.info(start_cmd)
@@ -143,4 +154,10 @@ if __name__ == "__main__":
     p.wait()
     f.close() 
     logger.info("Task Finish")    
+    end_time = time.time()
+    write_status_file(config.log_dir, "start_base_task.status", "finished",
+                      start_time=start_time, end_time=end_time,
+                      returncode=p.returncode)
+    logger.info("Task finished in {} seconds".format(
+        round(end_time - start_time, 2)))
   
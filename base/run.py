@@ -13,15 +13,18 @@ import yaml
 from argparse import Namespace, ArgumentParser
 import importlib
 import json
-import numpy as np
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../")))
 from utils import cluster_manager
 from utils import flagperf_logger
 from utils import image_manager
+from utils import monitor_store
+from utils import task_status
 
 VERSION = "v0.1"
+# Max seconds that a host blocks on the task status in one ssh command.
+WAIT_ROUND_TIMEOUT = 600
 RUN_LOGGER = flagperf_logger.FlagPerfLogger()
 CLUSTER_MGR = cluster_manager.ClusterManager()
 
@@ -67,7 +70,9 @@ def check_cluster_deploy_path(dp_path):
 
 
 def prepare_docker_image_cluster(dp_path, image_mgr, framework, nnodes, config):
-    '''Prepare docker image in registry and in the cluster.
+    '''Prepare docker image in the cluster. The image is built on the first
+       host if it doesn't have it, and streamed to the other hosts that
+       don't have it.
     '''
     vendor = config.VENDOR
     image_vendor_dir = os.path.join(dp_path, "vendors", vendor, framework)
@@ -79,12 +84,29 @@ def prepare_docker_image_cluster(dp_path, image_mgr, framework, nnodes, config):
                         + image_mgr.repository + " -t " + image_mgr.tag \
                         + " -d " + image_vendor_dir + " -f " + framework
     timeout = 1200
-    RUN_LOGGER.debug("Run cmd in the cluster to prepare docker image: " +
-                     prepare_image_cmd + " timeout=" + str(timeout))
-    bad_hosts = CLUSTER_MGR.run_command_some_hosts(prepare_image_cmd, nnodes,
-                                                   timeout)
+    exist_cmd = "cd " + dp_path + " && " + sys.executable \
+                + " ../utils/image_manager.py -o exist -i " \
+                + image_mgr.repository + " -t " + image_mgr.tag
+    missing_hosts = CLUSTER_MGR.run_command_some_hosts(exist_cmd, nnodes, 60)
+    first_host = CLUSTER_MGR.get_hosts_list()[0]
+    if first_host in missing_hosts:
+        RUN_LOGGER.debug("Run cmd on " + first_host +
+                         " to build docker image: " + prepare_image_cmd +
+                         " timeout=" + str(timeout))
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(
+            prepare_image_cmd, 1, timeout)
+        if len(bad_hosts) != 0:
+            RUN_LOGGER.error("Host that can't build image: " +
+                             ",".join(bad_hosts.keys()))
+            return False
+
+    # Other hosts load the image built once on the first host.
+    other_hosts = [host for host in missing_hosts if host != first_host]
+    bad_hosts = CLUSTER_MGR.distribute_image_some_hosts(
+        image_name, other_hosts, 1800,
+        getattr(config, "IMAGE_COMPRESSOR", "zstd"))
     if len(bad_hosts) != 0:
-        RUN_LOGGER.error("Hosts that can't pull image: " +
+        RUN_LOGGER.error("Hosts that can't load image: " +
                          ",".join(bad_hosts.keys()))
         return False
     return True
@@ -267,28 +289,48 @@ def start_tasks_in_cluster(dp_path, container_name, config, base_args,
 
     RUN_LOGGER.debug("Run cmd in the cluster to start tasks, cmd=" + start_cmd)
     CLUSTER_MGR.run_command_some_hosts_distribution_info(start_cmd, nnodes, 15, "base")
-    # Wait a moment for starting tasks.
-    time.sleep(60)
+
+
+def clear_task_status_in_cluster(dp_path, pid_file_path, nnodes):
+    '''Remove pid file and status file of the last task, so that waiting
+       for the new task won't see them.'''
+    clear_cmd = "cd " + dp_path + " && rm -f " + pid_file_path + " " \
+                + task_status.status_file_of(pid_file_path)
+    RUN_LOGGER.debug("Run cmd in the cluster to clear task status: " +
+                     clear_cmd)
+    CLUSTER_MGR.run_command_some_hosts(clear_cmd, nnodes, 30)
 
 
 def wait_for_finish(dp_path, container_name, pid_file_path, nnodes):
     '''wait all the processes of start_xxx_task.py finished.
+       Each host blocks on the status file written by container_main.py, and
+       checks the pid only as a fallback, so the end of the task is found in
+       a second. Return whether the tasks finished on all the hosts.
     '''
-    # Aussme pid of start_xxx_task.py won't loop in a short time.
     check_cmd = "cd " + dp_path + "; " + sys.executable \
-                + " ../utils/container_manager.py -o pidrunning -c " \
-                + container_name + " -f " + pid_file_path
+                + " ../utils/container_manager.py -o waitfinish -c " \
+                + container_name + " -f " + pid_file_path \
+                + " -t " + str(WAIT_ROUND_TIMEOUT)
 
     RUN_LOGGER.debug(
-        "Run cmd to check whether the training tasks is running: " + check_cmd)
+        "Run cmd to wait for the training tasks finished: " + check_cmd)
+    failed_hosts = {}
     while True:
-        bad_hosts = CLUSTER_MGR.run_command_some_hosts(check_cmd,
-                                                       nnodes,
-                                                       no_log=True)
-        if len(bad_hosts) == nnodes:
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(
+            check_cmd, nnodes, WAIT_ROUND_TIMEOUT + 60, no_log=True)
+        # ssh errors, bad invocations and tasks that never started
+        for host, ret in bad_hosts.items():
+            if ret != task_status.STILL_RUNNING:
+                failed_hosts[host] = ret
+        if task_status.STILL_RUNNING not in bad_hosts.values():
             break
-        time.sleep(10)
-        
+    if len(failed_hosts) != 0:
+        RUN_LOGGER.error("Hosts that failed waiting for the tasks: " +
+                         ",".join(host + "(exit code " + str(ret) + ")"
+                                  for host, ret in failed_hosts.items()))
+        return False
+    return True
+
 
 def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
                                    image_name, nnodes, config, custom_docker_cmd=None):
@@ -315,7 +357,10 @@ def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
                                + " -w " + config.FLAGPERF_PATH \
                                + " --shm-size=" + config.SHM_SIZE \
                                + " -v " + dp_path + ":" \
-                               + config.FLAGPERF_PATH
+                               + config.FLAGPERF_PATH \
+                               + " -v " + os.path.join(dp_path, "../utils") \
+                               + ":" + os.path.join(config.FLAGPERF_PATH,
+                                                    "../utils")
 
         if config.ACCE_CONTAINER_OPT is not None:
             container_start_args += " " + config.ACCE_CONTAINER_OPT
@@ -394,46 +439,93 @@ def collect_and_merge_logs(curr_log_path, cases, nnodes):
                            
 
 def summary_logs(config, case_log_dir):
-    analysis_module_path = os.path.join("vendors",
-                                        config.VENDOR,
+    '''Load monitor logs of all the hosts as columns, and summarize all the
+       series of all the hosts and devices in one vectorized pass. The
+       columns are kept in monitor_store/ of each host's log dir.
+       Since the columnar store, every series of detail_result.json is a
+       dict of summary stats(count, mean, max, min, std, p50, p90, p99 and
+       energy) instead of the list of raw samples. max_mem is None if the
+       vendor doesn't report the memory capacity.'''
+    analysis_module_path = os.path.join("vendors", config.VENDOR,
                                         config.VENDOR + "_analysis")
     analysis_module_path = analysis_module_path.replace("/", ".")
     analysis_module = importlib.import_module(analysis_module_path)
     analysis_log = getattr(analysis_module, 'analysis_log', None)
 
     result = {}
+    series = []
+    series_keys = []
     noderank = 0
     for host in config.HOSTS:
-        result[host] = {}
+        result[host] = {"vendor": {}}
         monitor_log_dir = os.path.join(case_log_dir,
                                        host + "_noderank" + str(noderank))
-        
-        # vendor monitor results like temp/power        
-        vendor_monitor_path = os.path.join(monitor_log_dir,
-                                           config.VENDOR + "_monitor.log")
-        vendor_log = analysis_log(vendor_monitor_path, config)
-        result[host]["vendor"] = vendor_log
-        
-        
+
+        # vendor monitor results like temp/power
+        vendor_columns = monitor_store.vendor_columns(monitor_log_dir,
+                                                      config.VENDOR)
+        if vendor_columns is not None:
+            for index in monitor_store.VENDOR_CHANNELS:
+                device_series = monitor_store.split_devices(
+                    vendor_columns, index, config.NPROC_PER_NODE)
+                for node, item in enumerate(device_series):
+                    series.append(item)
+                    series_keys.append((host, index, node))
+            mem_total = monitor_store.split_devices(vendor_columns,
+                                                    "mem_total", 1)[0][1]
+            max_mem = float(mem_total[0]) if len(mem_total) else None
+        else:
+            vendor_monitor_path = os.path.join(monitor_log_dir,
+                                               config.VENDOR + "_monitor.log")
+            vendor_log = analysis_log(vendor_monitor_path, config)
+            for index in monitor_store.VENDOR_CHANNELS:
+                for node, values in vendor_log[index].items():
+                    series.append((None, values))
+                    series_keys.append((host, index, node))
+            max_mem = vendor_log.get("max_mem")
+        result[host]["vendor"]["max_mem"] = max_mem
+
         # system monitor results like CPU/MEM/POWER
-        for index in ["cpu", "mem", "pwr"]:
-            monitor_path = os.path.join(monitor_log_dir, index + "_monitor.log")
-            with open(monitor_path, 'r') as file:
-                sys_log = [float(line.split("\t")[1][:-1]) for line in file if "\t" in line]
-            result[host][index] = sys_log
-        
+        sys_columns = monitor_store.sys_columns(monitor_log_dir)
+        for index in monitor_store.SYS_CHANNELS:
+            series.append(
+                (sys_columns[index + "_timestamp"], sys_columns[index]))
+            series_keys.append((host, index, None))
+
         # FlagPerf Result
-        flagperf_result_path = os.path.join(monitor_log_dir, config.BENCHMARKS_OR_TOOLKITS.lower() + ".log.txt")
+        flagperf_result_path = os.path.join(monitor_log_dir,
+                                            config.BENCHMARKS_OR_TOOLKITS.lower() + ".log.txt")
         with open(flagperf_result_path, 'r') as file:
-            key_lines = [line.strip() for line in file if 'FlagPerf Result' in line]
+            key_lines = [
+                line.strip() for line in file if 'FlagPerf Result' in line
+            ]
         result[host]["flagperf"] = key_lines
-        
+
         noderank += 1
-        
 
+    summary = monitor_store.summarize(series)
+    for i, (host, index, node) in enumerate(series_keys):
+        stats = monitor_store.summary_row(summary, i)
+        if node is None:
+            result[host][index] = stats
+        else:
+            result[host]["vendor"].setdefault(index, {})[node] = stats
     return result
 
 
+def format_stats(stats, unit, scale=1.0, ndigits=2, energy=False):
+    '''Return summary stats of a series as a line of the report.'''
+    items = [("AVERAGE", "mean"), ("MAX", "max"), ("STD DEVIATION", "std")]
+    items += [("P" + str(q), "p" + str(q))
+              for q in monitor_store.PERCENTILES]
+    line = ", ".join("{}: {} {}".format(name, round(stats[key] * scale,
+                                                    ndigits), unit)
+                     for name, key in items)
+    if energy and stats["energy"] == stats["energy"]:
+        line += ", ENERGY: {} Joules".format(round(stats["energy"], 2))
+    return line
+
+
 def analysis_log(key_logs):
     noderank = 0
     for host in key_logs:
@@ -446,65 +538,41 @@ def analysis_log(key_logs):
 
         RUN_LOGGER.info("2) POWER:")
         RUN_LOGGER.info("  2.1) SYSTEM POWER:")
-        pwr_series = key_logs[host]["pwr"]
         RUN_LOGGER.info(
-            "    AVERAGE: {} Watts, MAX: {} Watts, STD DEVIATION: {} Watts".
-            format(round(np.mean(pwr_series), 2), round(np.max(pwr_series), 2),
-                   round(np.std(pwr_series), 2)))
+            "    " + format_stats(key_logs[host]["pwr"], "Watts", energy=True))
 
         RUN_LOGGER.info("  2.2) AI-chip POWER:")
-        for node in key_logs[host]["vendor"]["power"].keys():
-            pwr_series = key_logs[host]["vendor"]["power"][node]
-            RUN_LOGGER.info(
-                "    RANK {}'s AVERAGE: {} Watts, MAX: {} Watts, STD DEVIATION: {} Watts"
-                .format(node, round(np.mean(pwr_series), 2),
-                        round(np.max(pwr_series), 2),
-                        round(np.std(pwr_series), 2)))
+        for node, stats in key_logs[host]["vendor"]["power"].items():
+            RUN_LOGGER.info("    RANK {}'s ".format(node) +
+                            format_stats(stats, "Watts", energy=True))
 
         RUN_LOGGER.info("  2.3) AI-chip TEMPERATURE:")
-        for node in key_logs[host]["vendor"]["temp"].keys():
-            temp_series = key_logs[host]["vendor"]["temp"][node]
-            RUN_LOGGER.info(
-                u"    RANK {}'s AVERAGE: {} \u00b0C, MAX: {} \u00b0C, STD DEVIATION: {} \u00b0C"
-                .format(node, round(np.mean(temp_series), 2),
-                        round(np.max(temp_series), 2),
-                        round(np.std(temp_series), 2)))
+        for node, stats in key_logs[host]["vendor"]["temp"].items():
+            RUN_LOGGER.info("    RANK {}'s ".format(node) +
+                            format_stats(stats, u"\u00b0C"))
 
         RUN_LOGGER.info("3) Utilization:")
         RUN_LOGGER.info("  3.1) SYSTEM CPU:")
-        cpu_series = key_logs[host]["cpu"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".format(
-                round(np.mean(cpu_series) * 100, 3),
-                round(np.max(cpu_series) * 100, 3),
-                round(np.std(cpu_series) * 100, 3)))
+        RUN_LOGGER.info("    " + format_stats(
+            key_logs[host]["cpu"], "%", scale=100, ndigits=3))
 
         RUN_LOGGER.info("  3.2) SYSTEM MEMORY:")
-        mem_series = key_logs[host]["mem"]
-        RUN_LOGGER.info(
-            "    AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".format(
-                round(np.mean(mem_series) * 100, 3),
-                round(np.max(mem_series) * 100, 3),
-                round(np.std(mem_series) * 100, 3)))
+        RUN_LOGGER.info("    " + format_stats(
+            key_logs[host]["mem"], "%", scale=100, ndigits=3))
 
         RUN_LOGGER.info("  3.3) AI-chip MEMORY:")
-        for node in key_logs[host]["vendor"]["mem"].keys():
-            mem_series = key_logs[host]["vendor"]["mem"][node]
-            RUN_LOGGER.info(
-                "    RANK {}'s AVERAGE: {} %, MAX: {} %, STD DEVIATION: {} %".
-                format(
-                    node,
-                    round(
-                        np.mean(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3),
-                    round(
-                        np.max(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3),
-                    round(
-                        np.std(mem_series) * 100 /
-                        key_logs[host]["vendor"]["max_mem"], 3)))
+        max_mem = key_logs[host]["vendor"]["max_mem"]
+        if not max_mem:
+            RUN_LOGGER.warning("    Memory capacity of AI-chip is unknown, "
+                               "usage is shown in MiB")
+        for node, stats in key_logs[host]["vendor"]["mem"].items():
+            if max_mem:
+                line = format_stats(stats, "%", scale=100.0 / max_mem,
+                                    ndigits=3)
+            else:
+                line = format_stats(stats, "MiB")
+            RUN_LOGGER.info("    RANK {}'s ".format(node) + line)
         noderank += 1
-    
 
 
 def print_welcome_msg():
@@ -570,7 +638,9 @@ def main():
     CLUSTER_MGR.init(config.HOSTS,
                      config.SSH_PORT,
                      getpass.getuser(),
-                     logger=RUN_LOGGER)
+                     logger=RUN_LOGGER,
+                     fanout=getattr(config, "SSH_FANOUT", 16),
+                     multiplex=getattr(config, "SSH_MULTIPLEX", True))
     check_cluster_health()
     dp_path = os.path.abspath(config.FLAGPERF_PATH)
     check_cluster_deploy_path(dp_path)
@@ -585,8 +655,12 @@ def main():
         framework = config.CASES[case]
 
         # Prepare docker image.
+        image_vendor_dir = os.path.join(dp_path, "vendors", config.VENDOR,
+                                        framework)
         image_mgr = image_manager.ImageManager(
-            "flagperf-base-" + config.VENDOR + "-" + framework, "t_" + VERSION)
+            "flagperf-base-" + config.VENDOR + "-" + framework,
+            image_manager.content_tag(image_vendor_dir, framework,
+                                      "t_" + VERSION))
         image_name = image_mgr.repository + ":" + image_mgr.tag
         nnodes = len(config.HOSTS)
         RUN_LOGGER.info("=== 2.1 Prepare docker image:" + image_name + " ===")
@@ -624,15 +698,22 @@ def main():
                              "...[FAILED]. Ignore case " + case)
             continue
         RUN_LOGGER.info("2) Start tasks in the cluster...")
-
+        pid_file_path = os.path.join(
+            log_dir_container, "start_base_task.pid")
+        clear_task_status_in_cluster(dp_path, pid_file_path, nnodes)
+        task_start_time = time.time()
         start_tasks_in_cluster(dp_path, container_name, config,
                                base_args, curr_log_path, case)
 
         # Wait until start_xxx_task.py finished.
         RUN_LOGGER.info("3) Waiting for tasks end in the cluster...")
-        pid_file_path = os.path.join(
-            log_dir_container, "start_base_task.pid")
-        wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
+        if not wait_for_finish(dp_path, container_name, pid_file_path,
+                               nnodes):
+            RUN_LOGGER.error("3) Waiting for tasks end in the cluster..."
+                             "[FAILED]. Testcase " + case)
+        RUN_LOGGER.info("Testcase " + case + " tasks took " +
+                        str(round(time.time() - task_start_time, 2)) +
+                        " seconds.")
 
         RUN_LOGGER.info("3) Training tasks end in the cluster...")
         RUN_LOGGER.info("4) Clean container environments in cluster...")
@@ -656,4 +737,5 @@ def main():
 
 if __name__ == '__main__':
     main()
+    CLUSTER_MGR.close_connections()
     RUN_LOGGER.stop()
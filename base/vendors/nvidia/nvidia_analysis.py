@@ -1,4 +1,15 @@
+import os
+
+from utils import telemetry
+
+
 def analysis_log(logpath, config):
+    telemetry_file = telemetry.telemetry_file_of(os.path.dirname(logpath),
+                                                 "nvidia")
+    if os.path.exists(telemetry_file):
+        return telemetry.analysis_result(telemetry_file,
+                                         config.NPROC_PER_NODE)
+
     logfile = open(logpath)
 
     result = {"temp": {}, "power": {}, "mem": {}}
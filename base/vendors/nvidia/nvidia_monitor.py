@@ -4,6 +4,8 @@
 Usage:  python3 sys-monitor.py -o operation -l [log_path]
             -o, --operation     start|stop|restart|status
             -l, --log           log path , ./logs/ default
+            -b, --backend       auto|nvml|nvidia-smi|replay, auto default
+            -i, --input         replay file of the replay backend
 '''
 
 import os
@@ -13,9 +15,35 @@ import signal
 import atexit
 import argparse
 import datetime
-from multiprocessing import Process
-import subprocess
-import schedule
+
+# Max seconds that stop() waits for the daemon to write its last records.
+STOP_TIMEOUT = 60
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../../../utils")))
+import telemetry
+
+
+def append_text_log(gpu_log, records, last_timestamp=None):
+    '''Append records, a flat array of telemetry.RECORD_SIZE values per
+       record, to gpu_log in the format of the former "nvidia-smi | grep
+       Default" monitor: a timestamp line, then a line per device sampled
+       at it. last_timestamp is the one of the records appended before.
+       Return the timestamp of the last record.'''
+    lines = []
+    for i in range(0, len(records), telemetry.RECORD_SIZE):
+        timestamp, _, temp, power, mem, mem_total, util = \
+            records[i:i + telemetry.RECORD_SIZE]
+        if timestamp != last_timestamp:
+            lines.append(
+                datetime.datetime.fromtimestamp(timestamp).strftime(
+                    '%Y-%m-%d-%H:%M:%S') + "\n")
+            last_timestamp = timestamp
+        lines.append("%.0fC %.0fW %.0fMiB %.0fMiB %.0f%%\n" %
+                     (temp, power, mem, mem_total, util))
+    with open(gpu_log, "a") as f:
+        f.writelines(lines)
+    return last_timestamp
 
 
 class Daemon:
@@ -32,7 +60,9 @@ class Daemon:
                  err_file,
                  gpu_log,
                  log_path,
-                 rate=5,
+                 rate=0.5,
+                 backend="auto",
+                 replay_file=None,
                  stdin=os.devnull,
                  stdout=os.devnull,
                  stderr=os.devnull,
@@ -50,6 +80,9 @@ class Daemon:
         self.gpufile = gpu_log
         self.logpath = log_path
         self.rate = rate
+        self.backend = backend
+        self.replay_file = replay_file
+        self.telemetry_file = telemetry.telemetry_file_of(log_path, "nvidia")
         self.umask = umask
         self.verbose = verbose
         self.daemon_alive = True
@@ -70,37 +103,32 @@ class Daemon:
 
     def run(self):
         '''
-        NOTE: override the method in subclass
+        Record telemetry of all the gpus with one query session of the
+        backend. The text log is appended each time the recorder flushes
+        records to the telemetry file.
         '''
+        if self.backend == telemetry.ReplayBackend.name:
+            backend = telemetry.ReplayBackend(self.replay_file, realtime=True)
+        else:
+            backend = telemetry.create_backend(self.backend,
+                                               "nvidia",
+                                               interval=self.rate)
+        state = {"timestamp": None}
 
-        def gpu_mon(file):
-            TIMESTAMP = datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S')
-            cmd = "nvidia-smi |grep 'Default'|awk '{print $3,$5,$9,$11,$13}'"
-            process = subprocess.Popen(cmd,
-                                       shell=True,
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.STDOUT,
-                                       encoding='utf-8')
-            try:
-                out = process.communicate(timeout=10)
-            except subprocess.TimeoutExpired:
-                process.kill()
-                out = process.communicate()
+        def on_flush(records):
+            state["timestamp"] = append_text_log(self.gpufile, records,
+                                                 state["timestamp"])
 
-            if process.returncode != 0:
-                result = "error"
-            result = TIMESTAMP + "\n" + out[0] + "\n"
-            with open(file, 'a') as f:
-                f.write(result)
+        recorder = telemetry.TelemetryRecorder(backend,
+                                               self.telemetry_file,
+                                               on_flush=on_flush)
 
-        def timer_gpu_mon():
-            gpu_process = Process(target=gpu_mon, args=(self.gpufile, ))
-            gpu_process.start()
+        def on_term(signum, frame):
+            recorder.stop()
 
-        schedule.every(self.rate).seconds.do(timer_gpu_mon)
-        while True:
-            schedule.run_pending()
-            time.sleep(5)
+        signal.signal(signal.SIGTERM, on_term)
+        recorder.run()
+        sys.exit(0)
 
     def daemonize(self):
         if self.verbose >= 1:
@@ -143,8 +171,10 @@ class Daemon:
     def start(self):
         if not os.path.exists(self.logpath):
             os.makedirs(self.logpath)
-        elif os.path.exists(self.gpufile):
-            os.remove(self.gpufile)
+        else:
+            for i in self.gpufile, self.telemetry_file:
+                if os.path.exists(i):
+                    os.remove(i)
         if self.verbose >= 1:
             print('ready to start ......')
         # check for a pid file to see if the daemon already runs
@@ -167,15 +197,19 @@ class Daemon:
             if os.path.exists(self.pidfile):
                 os.remove(self.pidfile)
             return
-        # try to kill the daemon process
+        # try to kill the daemon process. It writes its last records when
+        # terminated, so it is killed only if it doesn't exit in time.
         try:
-            i = 0
+            os.kill(pid, signal.SIGTERM)
+            deadline = time.time() + STOP_TIMEOUT
             while 1:
-                os.kill(pid, signal.SIGTERM)
-                time.sleep(1)
-                i = i + 1
-                if i % 10 == 0:
-                    os.kill(pid, signal.SIGHUP)
+                time.sleep(0.1)
+                if time.time() >= deadline:
+                    sys.stderr.write('daemon process [%d] did not exit in %d '
+                                     'seconds, killing it\n' %
+                                     (pid, STOP_TIMEOUT))
+                    os.kill(pid, signal.SIGKILL)
+                os.kill(pid, 0)
         except OSError as err:
             err = str(err)
             if err.find('No such process') > 0:
@@ -213,12 +247,24 @@ def parse_args():
                        required=False,
                        default='./logs/',
                        help='log path')
+    parse.add_argument('-b',
+                       type=str,
+                       metavar='[backend]',
+                       required=False,
+                       default='auto',
+                       help='auto|nvml|nvidia-smi|replay')
+    parse.add_argument('-i',
+                       type=str,
+                       metavar='[replay_file]',
+                       required=False,
+                       default=None,
+                       help='replay file of the replay backend')
     args = parse.parse_args()
     return args
 
 
 def main():
-    sample_rate1 = 5
+    sample_rate1 = 0.5
     args = parse_args()
     operation = args.o
     log_path = args.l
@@ -234,7 +280,9 @@ def main():
                        gpu_fn,
                        log_path,
                        verbose=1,
-                       rate=sample_rate1)
+                       rate=sample_rate1,
+                       backend=args.b,
+                       replay_file=args.i)
     if operation == 'start':
         subdaemon.start()
     elif operation == 'stop':
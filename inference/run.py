@@ -622,7 +622,9 @@ def main(config, custom_docker_cmd=None):
     check_test_host_config(config)
 
     # Check test environment and configs from host.yaml.
-    CLUSTER_MGR.init(config.HOSTS, config.SSH_PORT, getpass.getuser(), logger)
+    CLUSTER_MGR.init(config.HOSTS, config.SSH_PORT, getpass.getuser(), logger,
+                     getattr(config, "SSH_FANOUT", 16),
+                     getattr(config, "SSH_MULTIPLEX", True))
     check_cluster_health()
     dp_path = _get_deploy_path(config)
     check_cluster_deploy_path(dp_path)
@@ -694,3 +696,4 @@ if __name__ == '__main__':
     config = DefaultMunch.fromDict(data)
 
     main(config, custom_docker_cmd)
+    CLUSTER_MGR.close_connections()
@@ -1,16 +1,19 @@
 import torch
 
 
+def _no_sync():
+    # xpu/zixiao sync already finsh after InferModel.__call__
+    pass
+
+
+# vendor: sync function, other vendors don't sync.
+SYNC_FUNCS = {
+    "nvidia": torch.cuda.synchronize,
+    "iluvatar": torch.cuda.synchronize,
+    "kunlunxin": _no_sync,
+    "zixiao": _no_sync,
+}
+
+
 def torch_sync(config):
-    if config.vendor == "nvidia":
-        torch.cuda.synchronize()
-    if config.vendor == "iluvatar":
-        torch.cuda.synchronize()
-    if config.vendor == "kunlunxin":
-        # kunlunxin case
-        # xpu sync already finsh after InferModel.__call__
-        pass
-    if config.vendor == "zixiao":
-        # zixiao case
-        # zixiao sync already finsh after InferModel.__call__
-        pass
\ No newline at end of file
+    SYNC_FUNCS.get(config.vendor, _no_sync)()
@@ -14,6 +14,7 @@ import subprocess
 sys.path.append("..")
 from drivers.utils import *
 from drivers.calculate import *
+from drivers.roofline import *
 
 
 def parse_args():
@@ -34,12 +35,13 @@ def parse_args():
 
     parser.add_argument("--dataformat",
                         type=str,
-                        required=True,
-                        help="like FP32,FP16")
+                        default=None,
+                        help="like FP32,FP16, DATAFORMAT of case_config.yaml"
+                        " if not set")
 
     parser.add_argument("--oplib",
                         type=str,
-                        required=True,
+                        default="flaggems",
                         help="impl like pytorch/flaggems/cpp")
 
     parser.add_argument("--chip",
@@ -47,13 +49,24 @@ def parse_args():
                         required=True,
                         help="chip like A100_40_SXM")
 
+    parser.add_argument("--log_dir",
+                        type=str,
+                        default=".",
+                        help="abs log dir")
+
+    parser.add_argument("--flaggems_path",
+                        type=str,
+                        required=False,
+                        help="path to FlagGems repository")
+
     args, unknown_args = parser.parse_known_args()
     args.unknown_args = unknown_args
     return args
 
 
 def main(config, case_config):
-    correctness = do_correctness(config.case_name)
+    correctness = do_correctness(config.case_name, config.log_dir,
+                                 config.flaggems_path)
     correctness = correctness == 0
     dtype = {
         "FP32": torch.float32,
@@ -68,6 +81,13 @@ def main(config, case_config):
 
     m = case_config.Melements
 
+    if hasattr(case_config, "SHAPE_SWEEP"):
+        run_shape_sweep(
+            torch.abs, lambda point: (make_tensor(
+                point["shape"], dtype[config.dataformat], point["layout"]), ),
+            lambda args: args[0].numel(), elementwise_bytes,
+            host_device_sync, config, case_config)
+        return
 
     a = torch.randn(m, 1024, 1024, dtype=dtype[config.dataformat]).to(0)
 
@@ -75,11 +95,14 @@ def main(config, case_config):
         torch.abs, (a, ), host_device_sync, config, case_config)
 
     op2flops = lambda x: x * m * 1024 * 1024
+    op2bytes = lambda x: x * elementwise_bytes((a, ))
 
     perf_result = cal_perf(cputime, kerneltime, op2flops,
                            config.spectflops)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
+    print_point_roofline(config, case_config, kerneltime, op2flops, op2bytes,
+                         (m, 1024, 1024))
 
 
 if __name__ == "__main__":
@@ -92,6 +115,8 @@ if __name__ == "__main__":
         case_config_vendor = yaml.safe_load(file)
     case_config.update(case_config_vendor)
     case_config = Namespace(**case_config)
+    if config.dataformat is None:
+        config.dataformat = case_config.DATAFORMAT
 
     if config.oplib == "flaggems":
         import flag_gems
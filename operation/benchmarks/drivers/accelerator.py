@@ -0,0 +1,71 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+import torch
+
+
+def _cuda_tf32(enabled):
+    torch.backends.cuda.matmul.allow_tf32 = enabled
+
+
+def _adapt_cambricon():
+    from torch_mlu.utils.model_transfer import transfer
+
+
+# vendor: (torch device module, tf32 switch, torch adaption run once).
+# Unknown vendors use torch.cuda and can't switch tf32.
+VENDORS = {
+    "nvidia": ("cuda", _cuda_tf32, None),
+    "cambricon": ("cuda", None, _adapt_cambricon),
+}
+
+_ACCELERATORS = {}
+
+
+class Accelerator:
+    '''Device operations of a vendor, bound once so that timed loops
+       neither compare vendor strings nor import anything.'''
+
+    def __init__(self, vendor):
+        self.vendor = vendor
+        if vendor in VENDORS:
+            self.device_type, tf32, adapt = VENDORS[vendor]
+        else:
+            print("unspecified vendor {}, using default pytorch \"torch.cuda\""
+                  .format(vendor))
+            self.device_type, tf32, adapt = "cuda", None, None
+        if adapt is not None:
+            adapt()
+        module = getattr(torch, self.device_type)
+        self.module = module
+        self.synchronize = module.synchronize
+        self.barrier = torch.distributed.barrier
+        self.event = module.Event
+        self.memory_stats = getattr(module, "memory_stats", dict)
+        # Captured launches, None if the device has no graphs.
+        self.graph = getattr(module, "CUDAGraph", None)
+        self.graph_capture = getattr(module, "graph", None)
+        self.stream = getattr(module, "Stream", None)
+        self.current_stream = getattr(module, "current_stream", None)
+        self.tf32 = tf32
+
+    def device(self, index=None):
+        '''Return the torch.device of the device index.'''
+        return torch.device(self.device_type, index)
+
+    def set_tf32(self, enabled):
+        '''Allow tf32 in matmul if enabled.'''
+        if self.tf32 is None:
+            print("unspecified vendor {}, do nothing".format(self.vendor))
+            return
+        self.tf32(enabled)
+
+
+def get_accelerator(vendor):
+    '''Return the Accelerator of vendor, created on first use.'''
+    accelerator = _ACCELERATORS.get(vendor)
+    if accelerator is None:
+        accelerator = _ACCELERATORS[vendor] = Accelerator(vendor)
+    return accelerator
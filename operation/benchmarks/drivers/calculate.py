@@ -8,6 +8,8 @@ from triton.testing import do_bench as kernel_bench
 import os
 import subprocess
 
+from .accelerator import get_accelerator
+
 
 def do_correctness(operation, result_log_dir, flaggems_path=None):
     print(f"=== do_correctness called with operation={operation}, result_log_dir={result_log_dir} ===")
@@ -139,22 +141,56 @@ def do_performance(operation, mode, warmup, result_log_dir, flaggems_path=None):
         print(f"Error during performance test: {e}")
         return 1  # Return error code
 
-grad_outputs = None
 
-def do(exec_func, exec_args, bp=False):
-    global grad_outputs
-    if bp:
+def prepare_backward(exec_func, exec_args):
+    '''Return the inputs requiring grad and grad_outputs of the real
+       output shape of exec_func, computed once for all the backward runs.'''
+    import torch
+    inputs = [
+        arg for arg in exec_args
+        if isinstance(arg, torch.Tensor) and arg.requires_grad
+    ]
+    with torch.no_grad():
+        grad_outputs = torch.ones_like(exec_func(*exec_args))
+    return inputs, grad_outputs
+
+
+def do(exec_func, exec_args, backward=None):
+    '''Run the op, and its backward with the (inputs, grad_outputs) of
+       prepare_backward if backward is set.'''
+    _tensor = exec_func(*exec_args)
+    if backward is not None:
         import torch
-        _tensor = exec_func(*exec_args).sum()
-        if grad_outputs is None:
-            grad_outputs = torch.zeros_like(_tensor)
-        inputs = list(filter(lambda x: x.requires_grad, [*exec_args]))
-        _grad = torch.autograd.grad(outputs=_tensor, inputs=inputs, grad_outputs=grad_outputs)
-    else:
-        _tensor = exec_func(*exec_args)
+        inputs, grad_outputs = backward
+        _grad = torch.autograd.grad(outputs=_tensor,
+                                    inputs=inputs,
+                                    grad_outputs=grad_outputs)
+
+
+def do_backward_test(exec_func, exec_args, backward, case_config):
+    '''Return the forward and the backward kernel time in seconds. The
+       backward runs on one retained graph, so no forward is in it.'''
+    import torch
+    inputs, grad_outputs = backward
+    forwardtime = kernel_bench(lambda: exec_func(*exec_args),
+                               warmup=case_config.KERNELWARMUP,
+                               rep=case_config.KERNELITERS,
+                               return_mode="median")
+    output = exec_func(*exec_args)
+    backwardtime = kernel_bench(
+        lambda: torch.autograd.grad(outputs=output,
+                                    inputs=inputs,
+                                    grad_outputs=grad_outputs,
+                                    retain_graph=True),
+        warmup=case_config.KERNELWARMUP,
+        rep=case_config.KERNELITERS,
+        return_mode="median")
+    del output
+    return forwardtime / 1000.0, backwardtime / 1000.0  # ms to s
 
 
 def do_test(exec_func, exec_args, sync_func, config, case_config, bp=False):
+    backward = prepare_backward(exec_func, exec_args) if bp else None
     sync_func(config.vendor)
     start_latency_nowarm = time.perf_counter_ns()
     _tensor = exec_func(*exec_args)
@@ -163,7 +199,7 @@ def do_test(exec_func, exec_args, sync_func, config, case_config, bp=False):
     latency_nowarm = time.perf_counter_ns() - start_latency_nowarm
 
     for _ in range(case_config.WARMUP):
-        do(exec_func, exec_args, bp)
+        do(exec_func, exec_args, backward)
 
     sync_func(config.vendor)
     start_latency_warm = time.perf_counter_ns()
@@ -174,24 +210,94 @@ def do_test(exec_func, exec_args, sync_func, config, case_config, bp=False):
 
     start_time = time.perf_counter()
     for _ in range(case_config.ITERS):
-        do(exec_func, exec_args, bp)
+        do(exec_func, exec_args, backward)
 
     sync_func(config.vendor)
     end_time = time.perf_counter()
 
     cputime_raw = end_time - start_time
 
-    kerneltime_raw = kernel_bench(lambda: do(exec_func, exec_args, bp),
+    kerneltime_raw = kernel_bench(lambda: do(exec_func, exec_args, backward),
                                   warmup=case_config.KERNELWARMUP,
                                   rep=case_config.KERNELITERS,
                                   return_mode="median")
     cputime = cputime_raw / case_config.ITERS
     kerneltime = kerneltime_raw / 1000.0  # ms to s
+    if bp:
+        forwardtime, backwardtime = do_backward_test(exec_func, exec_args,
+                                                     backward, case_config)
+        print(r"[FlagPerf Result]kerneltime of forward={} us, backward={} us"
+              .format(round(forwardtime * 1E6, 2),
+                      round(backwardtime * 1E6, 2)))
+    if getattr(case_config, "GRAPH_MODE", False):
+        print_launch_result(config, cputime,
+                            *do_launch_test(exec_func, exec_args, sync_func,
+                                            config, case_config, bp))
     return round(latency_nowarm / 1000.0, 2), round(latency_warm / 1000.0,
                                                     2), cputime, kerneltime
 
 
-def cal_perf(cputime, kerneltime, op2flops, spectflops, bp=False):
+def do_launch_test(exec_func, exec_args, sync_func, config, case_config,
+                   bp=False):
+    '''Return the dispatcher latency and the graph replay latency of an op
+       in seconds. The dispatcher latency is the host time of calling the op
+       without the python loop of do(), the device running behind. The
+       graph replay latency is the time of a call out of GRAPH_ITERS calls
+       captured into one device graph, without launch overheads. It's None
+       if the device has no graphs or for backward.'''
+    iters = getattr(case_config, "GRAPH_ITERS", 100)
+    replays = getattr(case_config, "GRAPH_REPLAYS", 10)
+
+    sync_func(config.vendor)
+    start_time = time.perf_counter()
+    for _ in range(iters):
+        exec_func(*exec_args)
+    dispatchtime = (time.perf_counter() - start_time) / iters
+    sync_func(config.vendor)
+
+    accelerator = get_accelerator(config.vendor)
+    if bp or accelerator.graph is None or accelerator.graph_capture is None:
+        return dispatchtime, None
+
+    # Warm up on a side stream before capturing, as graph capture requires.
+    stream = accelerator.stream()
+    stream.wait_stream(accelerator.current_stream())
+    with accelerator.module.stream(stream):
+        for _ in range(3):
+            exec_func(*exec_args)
+    accelerator.current_stream().wait_stream(stream)
+    sync_func(config.vendor)
+
+    graph = accelerator.graph()
+    with accelerator.graph_capture(graph):
+        for _ in range(iters):
+            exec_func(*exec_args)
+    graph.replay()
+    sync_func(config.vendor)
+
+    start_time = time.perf_counter()
+    for _ in range(replays):
+        graph.replay()
+    sync_func(config.vendor)
+    graphtime = (time.perf_counter() - start_time) / (replays * iters)
+    del graph
+    return dispatchtime, graphtime
+
+
+def print_launch_result(config, cputime, dispatchtime, graphtime):
+    '''Print the python loop, dispatcher and graph replay latencies.'''
+    to_us = lambda t: None if t is None else round(t * 1E6, 2)
+    overhead = None if graphtime is None else to_us(cputime - graphtime)
+    print(r"[FlagPerf Result]Launch latency: python loop={} us, "
+          r"dispatcher={} us, graph replay={} us, launch overhead={} us".
+          format(to_us(cputime), to_us(dispatchtime), to_us(graphtime),
+                 overhead))
+
+
+def cal_perf(cputime, kerneltime, op2flops, spectflops, bp=False,
+             op2bwflops=None):
+    '''op2bwflops declares the backward flops like op2flops, twice the
+       forward if it's not set.'''
     spectflops = float(spectflops)
     ctus = round(cputime * 1E6, 2)
     ktus = round(kerneltime * 1E6, 2)
@@ -199,8 +305,14 @@ def cal_perf(cputime, kerneltime, op2flops, spectflops, bp=False):
     cps = 1.0 / cputime
     kps = 1.0 / kerneltime
 
-    cflops = op2flops(cps) * (3.0 if bp else 1.0)
-    kflops = op2flops(kps) * (3.0 if bp else 1.0)
+    if not bp:
+        op2bpflops = op2flops
+    elif op2bwflops is not None:
+        op2bpflops = lambda x: op2flops(x) + op2bwflops(x)
+    else:
+        op2bpflops = lambda x: op2flops(x) * 3.0
+    cflops = op2bpflops(cps)
+    kflops = op2bpflops(kps)
     ctflops = round(cflops / 1E12, 2)
     ktflops = round(kflops / 1E12, 2)
 
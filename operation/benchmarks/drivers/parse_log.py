@@ -9,51 +9,21 @@ import os
 from collections import defaultdict
 from loguru import logger
 
+from .result_log import append_records, result_key
+
 
 def parse_log_file(spectflops, mode, warmup, log_dir, result_log_path):
     performance_log_file = os.path.join(log_dir, "result.log.txt")
     correctness_log_file = os.path.join(log_dir, "correctness.log.txt")
     save_log_path = os.path.join(result_log_path, "result.json")
-    
-    # 统一处理逻辑，避免重复代码
-    def process_and_save_data():
-        res = defaultdict(dict)
-        # 处理性能测试日志
-        result_data = get_result_data(performance_log_file, res, spectflops, mode, warmup)
-        # 处理正确性测试日志
-        result_data = get_correctness_data(correctness_log_file, result_data)
-        return result_data
 
-    if os.path.isfile(save_log_path):
-        with open(save_log_path, 'r+', encoding='utf-8') as file_r:
-            try:
-                file_r_json = file_r.read()
-                if file_r_json.strip():  # 检查文件内容不为空
-                    res = json.loads(file_r_json)
-                else:
-                    print("JSON file is empty, initializing new data")
-                    res = defaultdict(dict)
-
-                # 处理性能测试日志
-                result_data = get_result_data(performance_log_file, res, spectflops, mode, warmup)
-                # 处理正确性测试日志
-                result_data = get_correctness_data(correctness_log_file, result_data)
-
-                file_r.seek(0)
-                file_r.write(json.dumps(result_data, ensure_ascii=False))
-                file_r.truncate()
-
-            except json.decoder.JSONDecodeError as e:
-                print(f"JSONDecodeError: {e}, reinitializing data")
-                # JSON解析失败时，重新处理数据
-                result_data = process_and_save_data()
-                file_r.seek(0)
-                file_r.write(json.dumps(result_data, ensure_ascii=False))
-                file_r.truncate()
-    else:
-        with open(save_log_path, 'w') as file_w:
-            result_data = process_and_save_data()
-            file_w.write(json.dumps(result_data, ensure_ascii=False))
+    # 只解析本次日志，记录追加到result.json，不读取已有结果
+    res = defaultdict(dict)
+    # 处理性能测试日志
+    result_data = get_result_data(performance_log_file, res, spectflops, mode, warmup)
+    # 处理正确性测试日志
+    result_data = get_correctness_data(correctness_log_file, result_data)
+    append_records(save_log_path, result_data.values())
 
 
 """ 参数说明
@@ -61,122 +31,65 @@ def parse_log_file(spectflops, mode, warmup, log_dir, result_log_path):
 # 吞吐率：3 Raw-Throughput原始吞吐：raw_throughput， 4 Core-Throughput是核心吞吐：core_throughput
 # 算力：5 实际算力开销：ctflops， 6 实际算力利用率：cfu， 7 实际算力开销-内核时间：ktflops， 8 实际算力利用率-内核时间：kfu
 """
+# 预热后各模式的字段：时延、吞吐、算力开销、算力利用率
+# cpu/operator在host侧计时，cuda/kernel为内核时间
+WARM_FIELDS = {
+    "cpu": ("warmup_latency", "raw_throughput", "ctflops", "cfu"),
+    "operator": ("warmup_latency", "raw_throughput", "ctflops", "cfu"),
+    "cuda": ("kerneltime", "core_throughput", "ktflops", "kfu"),
+    "kernel": ("kerneltime", "core_throughput", "ktflops", "kfu"),
+}
+# 有无预热时延的模式
+NOWARM_MODES = ("cpu", "operator")
+
+
+def get_result_fields(mode, warmup):
+    """
+    返回mode和warmup下的时延基线字段名和指标字段名，不支持的组合返回None
+    """
+    if warmup == "0":
+        if mode not in NOWARM_MODES:
+            return None
+        return f"latency_base_{mode}_nowarm", ("no_warmup_latency", )
+    if mode not in WARM_FIELDS:
+        return None
+    return f"latency_base_{mode}_warm", WARM_FIELDS[mode]
+
+
 def get_result_data(log_file, res, spectflops, mode, warmup):
-    with open(log_file, 'r') as file_r:
-        lines = file_r.readlines()
-        for line in lines:
-            if line.startswith("[INFO]"):
-                json_data = line[6:].strip()
-                try:
-                    data = json.loads(json_data)
-                    op_name = data.get("op_name")
-                    dtype = data.get("dtype")
-                    results = data.get("result")
-                    for result in results:
-                        shape_detail = result.get("shape_detail")
-                        latency_base = result.get("latency_base")
-                        if mode == "cpu" and warmup == "0":
-                            no_warmup_latency = result.get("latency")
-                            parse_data = {
-                                "op_name": op_name,
-                                "dtype": dtype,
-                                "shape_detail": shape_detail,
-                                "latency_base_cpu_nowarm": latency_base,
-                                "no_warmup_latency": no_warmup_latency
-                            }
-                            res[f"{op_name}_{dtype}_{shape_detail}"].update(parse_data)
-                        elif mode == "operator" and warmup == "0":
-                            # 处理operator模式无预热情况，类似于cpu模式
-                            no_warmup_latency = result.get("latency")
-                            parse_data = {
-                                "op_name": op_name,
-                                "dtype": dtype,
-                                "shape_detail": shape_detail,
-                                "latency_base_operator_nowarm": latency_base,
-                                "no_warmup_latency": no_warmup_latency
-                            }
-                            res[f"{op_name}_{dtype}_{shape_detail}"].update(parse_data)
-                        elif mode == "cpu" and warmup != "0":
-                            warmup_latency = result.get("latency")
-                            raw_throughput = 1 / float(warmup_latency)
-                            ctflops = result.get("tflops")
-                            if ctflops is None:
-                                cfu = None
-                            else:
-                                cfu = round(100.0 * float(ctflops) / 1e12 / float(spectflops), 2)
-                            parse_data = {
-                                "op_name": op_name,
-                                "dtype": dtype,
-                                "shape_detail": shape_detail,
-                                "latency_base_cpu_warm": latency_base,
-                                "warmup_latency": warmup_latency,
-                                "raw_throughput": raw_throughput,
-                                "ctflops": ctflops,
-                                "cfu": cfu
-                            }
-                            res[f"{op_name}_{dtype}_{shape_detail}"].update(parse_data)
-                        elif mode == "cuda" and warmup != "0":
-                            kerneltime = result.get("latency")
-                            core_throughput = 1 / float(kerneltime)
-                            ktflops = result.get("tflops")
-                            if ktflops is None:
-                                kfu = None
-                            else:
-                                kfu = round(100.0 * float(ktflops) / 1E12 / float(spectflops), 2)
-                            parse_data = {
-                                "op_name": op_name,
-                                "dtype": dtype,
-                                "shape_detail": shape_detail,
-                                "latency_base_cuda_warm": latency_base,
-                                "kerneltime": kerneltime,
-                                "core_throughput": core_throughput,
-                                "ktflops": ktflops,
-                                "kfu": kfu
-                            }
-                            res[f"{op_name}_{dtype}_{shape_detail}"].update(parse_data)
-                        elif mode == "operator" and warmup != "0":
-                            # 处理operator模式，类似于cpu模式
-                            warmup_latency = result.get("latency")
-                            raw_throughput = 1 / float(warmup_latency)
-                            ctflops = result.get("tflops")
-                            if ctflops is None:
-                                cfu = None
-                            else:
-                                cfu = round(100.0 * float(ctflops) / 1e12 / float(spectflops), 2)
-                            parse_data = {
-                                "op_name": op_name,
-                                "dtype": dtype,
-                                "shape_detail": shape_detail,
-                                "latency_base_operator_warm": latency_base,
-                                "warmup_latency": warmup_latency,
-                                "raw_throughput": raw_throughput,
-                                "ctflops": ctflops,
-                                "cfu": cfu
-                            }
-                            res[f"{op_name}_{dtype}_{shape_detail}"].update(parse_data)
-                        elif mode == "kernel" and warmup != "0":
-                            # 处理kernel模式，类似于cuda模式
-                            kerneltime = result.get("latency")
-                            core_throughput = 1 / float(kerneltime)
-                            ktflops = result.get("tflops")
-                            if ktflops is None:
-                                kfu = None
-                            else:
-                                kfu = round(100.0 * float(ktflops) / 1E12 / float(spectflops), 2)
-                            parse_data = {
-                                "op_name": op_name,
-                                "dtype": dtype,
-                                "shape_detail": shape_detail,
-                                "latency_base_kernel_warm": latency_base,
-                                "kerneltime": kerneltime,
-                                "core_throughput": core_throughput,
-                                "ktflops": ktflops,
-                                "kfu": kfu
-                            }
-                            res[f"{op_name}_{dtype}_{shape_detail}"].update(parse_data)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error decoding JSON: {e}")
+    fields = get_result_fields(mode, warmup)
+    if fields is None:
+        logger.warning(f"No results parsed for mode {mode} with warmup {warmup}")
         return res
+    base_field, metric_fields = fields
+    with open(log_file, 'r') as file_r:
+        for line in file_r:
+            if not line.startswith("[INFO]"):
+                continue
+            try:
+                data = json.loads(line[6:].strip())
+            except json.JSONDecodeError as e:
+                logger.error(f"Error decoding JSON: {e}")
+                continue
+            op_name = data.get("op_name")
+            dtype = data.get("dtype")
+            for result in data.get("result"):
+                latency = result.get("latency")
+                parse_data = {
+                    "op_name": op_name,
+                    "dtype": dtype,
+                    "shape_detail": result.get("shape_detail"),
+                    base_field: result.get("latency_base"),
+                    metric_fields[0]: latency
+                }
+                if len(metric_fields) > 1:
+                    tflops = result.get("tflops")
+                    parse_data[metric_fields[1]] = 1 / float(latency)
+                    parse_data[metric_fields[2]] = tflops
+                    parse_data[metric_fields[3]] = None if tflops is None else \
+                        round(100.0 * float(tflops) / 1E12 / float(spectflops), 2)
+                res[result_key(parse_data)].update(parse_data)
+    return res
 
 
 def get_correctness_data(correctness_log_file, result_data):
@@ -0,0 +1,127 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+# !/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+'''Append-only result.json of the operation benchmarks.
+
+result.json holds one json record per line, one line per op, dtype and
+shape measured by a run. parse_log appends the records of an op under an
+exclusive fcntl lock, so neither the size of the file nor the ops
+finishing at the same time matter. Readers take a shared lock and stream
+the records, or compact them into the view keyed by {op}_{dtype}_{shape},
+where the later records of a key update the earlier ones. result.json of
+older runs, a single keyed json object, is read as its records.
+Only the standard library is used, so that hosts without torch can read
+the results.
+usage:
+result_log.py [result.json]...    rewrite result.json compacted
+'''
+
+import os
+import sys
+import json
+import fcntl
+
+
+def result_key(record):
+    '''Return the key of a record in the compacted view.'''
+    return "{}_{}_{}".format(record.get("op_name"), record.get("dtype"),
+                             record.get("shape_detail"))
+
+
+def append_records(path, records):
+    '''Append records to the result log at path, all in one locked write.
+       A result.json of older runs has no newline at its end, one is added
+       so that the records start on their own line.'''
+    lines = "".join(
+        json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+    if not lines:
+        return
+    with open(path, "ab+") as file_a:
+        fcntl.flock(file_a, fcntl.LOCK_EX)
+        try:
+            if file_a.seek(0, os.SEEK_END) > 0:
+                file_a.seek(-1, os.SEEK_END)
+                if file_a.read(1) != b"\n":
+                    lines = "\n" + lines
+            file_a.write(lines.encode("utf-8"))
+            file_a.flush()
+            os.fsync(file_a.fileno())
+        finally:
+            fcntl.flock(file_a, fcntl.LOCK_UN)
+
+
+def _records_of(line):
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as e:
+        # a line cut short by a killed run
+        print(f"Skipping invalid result record: {e}")
+        return []
+    if not isinstance(data, dict):
+        return []
+    if "op_name" not in data and all(
+            isinstance(value, dict) for value in data.values()):
+        # keyed result.json of older runs
+        return list(data.values())
+    return [data]
+
+
+def _read_records(file_r):
+    for line in file_r:
+        if line.strip():
+            yield from _records_of(line)
+
+
+def iter_records(path):
+    '''Yield the records of the result log at path in the order they were
+       appended, nothing if it doesn't exist.'''
+    if not os.path.isfile(path):
+        return
+    with open(path, "r", encoding="utf-8") as file_r:
+        fcntl.flock(file_r, fcntl.LOCK_SH)
+        try:
+            yield from _read_records(file_r)
+        finally:
+            fcntl.flock(file_r, fcntl.LOCK_UN)
+
+
+def merge_records(records):
+    '''Return the view of records keyed by {op}_{dtype}_{shape}.'''
+    merged = {}
+    for record in records:
+        merged.setdefault(result_key(record), {}).update(record)
+    return merged
+
+
+def load_results(path):
+    '''Return the compacted view of the result log at path.'''
+    return merge_records(iter_records(path))
+
+
+def compact_results(path):
+    '''Rewrite the result log at path with one record per key, and return
+       the compacted view. The file is rewritten in place under the lock,
+       so appends waiting for it land after the compacted records.'''
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r+", encoding="utf-8") as file_rw:
+        fcntl.flock(file_rw, fcntl.LOCK_EX)
+        try:
+            merged = merge_records(_read_records(file_rw))
+            file_rw.seek(0)
+            for record in merged.values():
+                file_rw.write(json.dumps(record, ensure_ascii=False) + "\n")
+            file_rw.truncate()
+            file_rw.flush()
+            os.fsync(file_rw.fileno())
+        finally:
+            fcntl.flock(file_rw, fcntl.LOCK_UN)
+    return merged
+
+
+if __name__ == "__main__":
+    for result_file in sys.argv[1:]:
+        print("{}: {} records".format(result_file,
+                                      len(compact_results(result_file))))
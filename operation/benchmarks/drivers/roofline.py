@@ -0,0 +1,163 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+#!/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+'''Shape sweep and roofline classification of operator benchmarks.
+
+SHAPE_SWEEP in case_config.yaml declares the points to benchmark, every
+combination of its lists is a point:
+    SHAPE_SWEEP:
+      shapes: [[1024, 1024, 1024], [1, 1073741824], [65536, 16384]]
+      layouts: ["contiguous", "transposed", "strided"]
+      broadcasts: ["none", "row", "column", "scalar"]
+An op builds its args of a point, and declares the flops and the bytes
+moved of its args next to op2flops. Each point is classified as memory or
+compute bound against the spec TFLOPS and SPECTBW(GB/s) of the chip, and
+all the points are printed as a roofline table.
+'''
+import torch
+
+from .calculate import do_test
+
+LAYOUTS = ("contiguous", "transposed", "strided")
+BROADCASTS = ("none", "row", "column", "scalar")
+
+
+def sweep_points(sweep):
+    '''Return the points of a SHAPE_SWEEP, as dicts of shape, layout and
+       broadcast. Transposed layouts of 1-d shapes are left out.'''
+    points = []
+    for shape in sweep["shapes"]:
+        for layout in sweep.get("layouts", ["contiguous"]):
+            if layout not in LAYOUTS:
+                raise ValueError("unknown layout " + layout)
+            if layout == "transposed" and len(shape) < 2:
+                continue
+            for broadcast in sweep.get("broadcasts", ["none"]):
+                if broadcast not in BROADCASTS:
+                    raise ValueError("unknown broadcast " + broadcast)
+                points.append({
+                    "shape": tuple(shape),
+                    "layout": layout,
+                    "broadcast": broadcast
+                })
+    return points
+
+
+def make_tensor(shape, dtype, layout="contiguous", device=0):
+    '''Return a random tensor of shape, as a view of a transposed or a
+       strided storage for non-contiguous layouts.'''
+    shape = tuple(shape)
+    if layout == "transposed":
+        storage_shape = shape[:-2] + (shape[-1], shape[-2])
+    elif layout == "strided":
+        storage_shape = shape[:-1] + (shape[-1] * 2, )
+    else:
+        storage_shape = shape
+    if dtype.is_floating_point:
+        tensor = torch.randn(storage_shape, dtype=dtype).to(device)
+    else:
+        tensor = torch.randint(0, 100, storage_shape, dtype=dtype).to(device)
+    if layout == "transposed":
+        return tensor.transpose(-1, -2)
+    if layout == "strided":
+        return tensor[..., ::2]
+    return tensor
+
+
+def broadcast_shape(shape, broadcast):
+    '''Return the shape of an operand broadcast to shape.'''
+    shape = tuple(shape)
+    if broadcast == "row":
+        return (1, ) * (len(shape) - 1) + shape[-1:]
+    if broadcast == "column":
+        return shape[:-1] + (1, )
+    if broadcast == "scalar":
+        return (1, )
+    return shape
+
+
+def tensor_bytes(tensors):
+    '''Return the bytes of the elements of tensors.'''
+    return sum(t.numel() * t.element_size() for t in tensors
+               if isinstance(t, torch.Tensor))
+
+
+def elementwise_bytes(args):
+    '''Return the bytes an elementwise op moves: all its inputs read once,
+       and an output of the broadcast shape written once.'''
+    tensors = [t for t in args if isinstance(t, torch.Tensor)]
+    numel = max(t.numel() for t in tensors)
+    return tensor_bytes(tensors) + numel * tensors[0].element_size()
+
+
+def classify(flops, nbytes, seconds, spectflops, spectbw):
+    '''Return the roofline row of one call moving nbytes and doing flops in
+       seconds. bound is memory or compute by the arithmetic intensity
+       against the ridge point, unknown if spectbw is not set.'''
+    row = {
+        "intensity": flops / nbytes if nbytes else float("inf"),
+        "time_us": round(seconds * 1E6, 2),
+        "tflops": round(flops / seconds / 1E12, 2),
+        "gbps": round(nbytes / seconds / 1E9, 2),
+        "bound": "unknown",
+        "roofline_pct": None
+    }
+    if spectbw:
+        peak_flops = float(spectflops) * 1E12
+        peak_bytes = float(spectbw) * 1E9
+        row["bound"] = "memory" if row["intensity"] < peak_flops / \
+            peak_bytes else "compute"
+        attainable = min(peak_flops, row["intensity"] * peak_bytes)
+        row["roofline_pct"] = round(100.0 * flops / seconds / attainable, 2)
+    row["intensity"] = round(row["intensity"], 3)
+    return row
+
+
+def print_roofline(config, casename, rows, spectbw):
+    '''Print the roofline table of the points of an op.'''
+    ridge = round(float(config.spectflops) * 1E3 / float(spectbw),
+                  2) if spectbw else None
+    print(r"[FlagPerf Result]Roofline of {} at {}, ridge point {} flop/byte:"
+          .format(casename, config.dataformat, ridge))
+    print(r"[FlagPerf Result]shape | layout | broadcast | flop/byte | bound"
+          r" | kerneltime(us) | TFLOPS | GB/s | % of roofline")
+    for row in rows:
+        print(r"[FlagPerf Result]{} | {} | {} | {} | {} | {} | {} | {} | {}".
+              format("x".join(str(size) for size in row["shape"]),
+                     row["layout"], row["broadcast"], row["intensity"],
+                     row["bound"], row["time_us"], row["tflops"],
+                     row["gbps"], row["roofline_pct"]))
+
+
+def print_point_roofline(config, case_config, kerneltime, op2flops,
+                         op2bytes, shape):
+    '''Print the roofline table of the single shape of an op, op2bytes
+       declared like op2flops.'''
+    spectbw = getattr(case_config, "SPECTBW", None)
+    row = classify(op2flops(1), op2bytes(1), kerneltime, config.spectflops,
+                   spectbw)
+    row.update(shape=tuple(shape), layout="contiguous", broadcast="none")
+    print_roofline(config, config.case_name, [row], spectbw)
+
+
+def run_shape_sweep(exec_func, make_args, flops_of, bytes_of, sync_func,
+                    config, case_config):
+    '''Benchmark exec_func at every point of case_config.SHAPE_SWEEP, with
+       args from make_args(point), and print the roofline table. flops_of
+       and bytes_of return the flops and the bytes moved of one call with
+       the args. Return the rows of the table.'''
+    spectbw = getattr(case_config, "SPECTBW", None)
+    rows = []
+    for point in sweep_points(case_config.SHAPE_SWEEP):
+        args = make_args(point)
+        _, _, _, kerneltime = do_test(exec_func, args, sync_func, config,
+                                      case_config)
+        row = classify(flops_of(args), bytes_of(args), kerneltime,
+                       config.spectflops, spectbw)
+        row.update(point)
+        rows.append(row)
+        del args
+    print_roofline(config, config.case_name, rows, spectbw)
+    return rows
@@ -0,0 +1,150 @@
+# Copyright (c) 2024 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+# !/usr/bin/env python3
+# -*- coding: UTF-8 -*-
+'''Run a sweep of operations in one warm process.
+
+The FlagGems correctness tests and benchmarks of every op in the sweep run
+through pytest.main in this process, instead of one container, one python
+and one pytest process per op. So torch, the device context, FlagGems and
+its triton JIT cache are loaded once and stay warm from one op to the
+next. Each op still gets its own log dir, its own result log and its own
+records in result.json.
+'''
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import contextlib
+import traceback
+
+from .parse_log import parse_log_file
+
+# dtypes of host.yaml to the dtype names of FlagGems benchmarks
+DTYPE_NAMES = {
+    "FP32": "float32",
+    "FP16": "float16",
+    "BF16": "bfloat16",
+    "INT32": "int32",
+    "INT16": "int16",
+    "BOOL": "bool"
+}
+
+
+def load_entries(sweep_file):
+    '''Return the entries of a sweep file, a json list of
+       {"op", "spectflops", "dtypes", "shape_file"}, the last two optional.'''
+    with open(sweep_file, "r") as file_d:
+        return json.load(file_d)
+
+
+def reset_logging():
+    '''Close and drop the handlers of the root logger. The benchmark
+       conftest opens its result log with logging.basicConfig, which does
+       nothing once the root logger has handlers, so without this the
+       records of every later op would go to the log of the first one.'''
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def run_pytest(work_dir, args, log_file):
+    '''Run pytest with args in work_dir in this process, write its output to
+       log_file, and return its exit code.'''
+    import pytest
+    cwd = os.getcwd()
+    with open(log_file, "w") as file_d, \
+            contextlib.redirect_stdout(file_d), \
+            contextlib.redirect_stderr(file_d):
+        os.chdir(work_dir)
+        reset_logging()
+        try:
+            return int(pytest.main(args))
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            # Flush and close the result log of this session.
+            reset_logging()
+            os.chdir(cwd)
+
+
+def result_log_name(args):
+    '''Return the name of the result log the benchmark conftest writes for
+       pytest args, e.g. result-m_abs--level_core--record_log.log, the one
+       do_performance of calculate.py reads.'''
+    cmd_args = [
+        arg.replace(".py", "").replace("=", "_").replace("/", "_")
+        for arg in args
+    ]
+    return "result_{}.log".format("_".join(cmd_args)).replace("_-", "-")
+
+
+def performance_args(entry):
+    '''Return the pytest args of the benchmarks of an entry.'''
+    args = ["-m", entry["op"], "--level", "core", "--record", "log"]
+    dtypes = entry.get("dtypes")
+    if dtypes:
+        args += ["--dtypes"] + [DTYPE_NAMES.get(dtype, dtype)
+                                for dtype in dtypes]
+    if entry.get("shape_file"):
+        args += ["--shape_file", entry["shape_file"]]
+    return args
+
+
+def run_entry(entry, gems_repo, config):
+    '''Test correctness and performance of the op of an entry, and parse
+       the logs into result.json. Return whether both succeeded.'''
+    op = entry["op"]
+    op_log_dir = os.path.join(config.log_dir, op)
+    os.makedirs(op_log_dir, exist_ok=True)
+
+    tests_dir = os.path.join(gems_repo, "tests")
+    correctness = run_pytest(tests_dir, ["-m", op, "--ref", "cpu"],
+                             os.path.join(op_log_dir, "correctness.log.txt"))
+
+    benchmark_dir = os.path.join(gems_repo, "benchmark")
+    args = performance_args(entry)
+    result_log = os.path.join(benchmark_dir, result_log_name(args))
+    if os.path.exists(result_log):
+        os.remove(result_log)
+    performance = run_pytest(benchmark_dir, args,
+                             os.path.join(op_log_dir, "benchmark.log.txt"))
+    if not os.path.exists(result_log):
+        print("Result log of op {} not found: {}".format(op, result_log))
+        return False
+    shutil.copy(result_log, os.path.join(op_log_dir, "result.log.txt"))
+
+    parse_log_file(str(entry["spectflops"]), config.mode, config.warmup,
+                   op_log_dir, config.result_log_path)
+    return correctness == 0 and performance == 0
+
+
+def run_sweep(config):
+    '''Run all the entries of config.sweep_file one after another, and
+       print a result line per op. Return the count of failed ops.'''
+    gems_repo = getattr(config, "flaggems_path", None) or os.getenv(
+        "FLAGGEMS_WORK_DIR", "/workspace/FlagGems")
+    if not os.path.exists(gems_repo):
+        print("FlagGems path not found: {}".format(gems_repo))
+        return 1
+    entries = load_entries(config.sweep_file)
+    failed = 0
+    for entry in entries:
+        start_time = time.time()
+        try:
+            success = run_entry(entry, gems_repo, config)
+        except Exception:
+            traceback.print_exc()
+            success = False
+        failed += 0 if success else 1
+        print(r"[FlagPerf Result]Operation {} sweep: {} in {} s".format(
+            entry["op"], "success" if success else "fail",
+            round(time.time() - start_time, 2)))
+        sys.stdout.flush()
+    return failed
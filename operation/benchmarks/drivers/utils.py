@@ -5,49 +5,25 @@
 # -*- coding: UTF-8 -*-
 import torch
 
+from .accelerator import get_accelerator
+
 
 def adapt_torch(vendor):
-    if vendor == "nvidia":
-        print("nvidia does nothing")
-    elif vendor == "cambricon":
-        from torch_mlu.utils.model_transfer import transfer
-    else:
-        print("unspecified vendor {}, do nothing".format(vendor))
+    '''Apply the torch adaption of vendor, only once per process.'''
+    get_accelerator(vendor)
 
 
 def set_ieee_float32(vendor):
-    adapt_torch(vendor)
-    if vendor == "nvidia":
-        torch.backends.cuda.matmul.allow_tf32 = False
-    else:
-        print("unspecified vendor {}, do nothing".format(vendor))
+    get_accelerator(vendor).set_tf32(False)
 
 
 def unset_ieee_float32(vendor):
-    adapt_torch(vendor)
-    if vendor == "nvidia":
-        torch.backends.cuda.matmul.allow_tf32 = True
-    else:
-        print("unspecified vendor {}, do nothing".format(vendor))
+    get_accelerator(vendor).set_tf32(True)
 
 
 def host_device_sync(vendor):
-    adapt_torch(vendor)
-    if vendor == "nvidia":
-        torch.cuda.synchronize()
-    else:
-        print(
-            "unspecified vendor {}, using default pytorch \"torch.cuda.synchronize\""
-            .format(vendor))
-        torch.cuda.synchronize()
+    get_accelerator(vendor).synchronize()
 
 
 def multi_device_sync(vendor):
-    adapt_torch(vendor)
-    if vendor == "nvidia":
-        torch.distributed.barrier()
-    else:
-        print(
-            "unspecified vendor {}, using default pytorch \"torch.distributed.barrier\""
-            .format(vendor))
-        torch.distributed.barrier()
+    get_accelerator(vendor).barrier()
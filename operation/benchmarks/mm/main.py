@@ -14,6 +14,7 @@ import subprocess
 sys.path.append("..")
 from drivers.utils import *
 from drivers.calculate import *
+from drivers.roofline import *
 
 
 def parse_args():
@@ -36,12 +37,13 @@ def parse_args():
 
     parser.add_argument("--dataformat",
                         type=str,
-                        required=True,
-                        help="like FP32,FP16")
+                        default=None,
+                        help="like FP32,FP16, DATAFORMAT of case_config.yaml"
+                        " if not set")
 
     parser.add_argument("--oplib",
                         type=str,
-                        required=True,
+                        default="flaggems",
                         help="impl like pytorch/flaggems/cpp")
 
     parser.add_argument("--chip",
@@ -49,13 +51,24 @@ def parse_args():
                         required=True,
                         help="chip like A100_40_SXM")
 
+    parser.add_argument("--log_dir",
+                        type=str,
+                        default=".",
+                        help="abs log dir")
+
+    parser.add_argument("--flaggems_path",
+                        type=str,
+                        required=False,
+                        help="path to FlagGems repository")
+
     args, unknown_args = parser.parse_known_args()
     args.unknown_args = unknown_args
     return args
 
 
 def main(config, case_config):
-    correctness = do_correctness(config.case_name)
+    correctness = do_correctness(config.case_name, config.log_dir,
+                                 config.flaggems_path)
     correctness = correctness == 0
 
     m = case_config.M
@@ -72,8 +85,27 @@ def main(config, case_config):
         "BOOL": torch.bool
     }
 
+    # Shapes of the sweep are [m, n, k], a layout applies to both operands.
+    if hasattr(case_config, "SHAPE_SWEEP"):
+        def make_args(point):
+            sweep_m, sweep_n, sweep_k = point["shape"]
+            return (make_tensor((sweep_m, sweep_n), dtype[config.dataformat],
+                                point["layout"]),
+                    make_tensor((sweep_n, sweep_k), dtype[config.dataformat],
+                                point["layout"]))
+
+        run_shape_sweep(
+            torch.mm, make_args,
+            lambda args: 2 * args[0].shape[0] * args[0].shape[1] *
+            args[1].shape[1],
+            lambda args: tensor_bytes(args) + args[0].shape[0] *
+            args[1].shape[1] * args[0].element_size(), host_device_sync,
+            config, case_config)
+        return
+
     a = torch.randn((m, n), dtype=dtype[config.dataformat]).to(0)
     b = torch.randn((n, k), dtype=dtype[config.dataformat]).to(0)
+    op2bytes = lambda x: x * (m * n + n * k + m * k) * a.element_size()
 
     latency_nowarm, latency_warm, cputime, kerneltime = do_test(
         torch.mm, (a, b), host_device_sync, config, case_config)
@@ -82,6 +114,8 @@ def main(config, case_config):
                            config.spectflops)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
+    print_point_roofline(config, case_config, kerneltime, op2flops, op2bytes,
+                         (m, n, k))
 
 
 if __name__ == "__main__":
@@ -94,6 +128,8 @@ if __name__ == "__main__":
         case_config_vendor = yaml.safe_load(file)
     case_config.update(case_config_vendor)
     case_config = Namespace(**case_config)
+    if config.dataformat is None:
+        config.dataformat = case_config.DATAFORMAT
 
     if config.oplib == "flaggems":
         import flag_gems
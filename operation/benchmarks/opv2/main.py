@@ -15,6 +15,7 @@ sys.path.append("..")
 from drivers.utils import *
 from drivers.calculate import *
 from drivers.parse_log import *
+from drivers.sweep import run_sweep
 
 
 def parse_args():
@@ -65,6 +66,11 @@ def parse_args():
                         required=False,
                         help="path to FlagGems repository")
 
+    parser.add_argument("--sweep_file",
+                        type=str,
+                        required=False,
+                        help="json list of ops to run in this process")
+
     args, unknown_args = parser.parse_known_args()
     args.unknown_args = unknown_args
     return args
@@ -152,8 +158,13 @@ if __name__ == "__main__":
         print("=== Arguments parsed successfully ===")
         print(f"Arguments received: {config}")
         
-        print("=== Calling main function ===")
-        main(config)
+        if config.sweep_file:
+            print("=== Calling sweep of " + config.sweep_file + " ===")
+            if run_sweep(config) != 0:
+                sys.exit(1)
+        else:
+            print("=== Calling main function ===")
+            main(config)
         print("=== Program completed successfully ===")
         
     except Exception as e:
@@ -84,9 +84,12 @@ def main(config, case_config):
         f, (a, ), host_device_sync, config, case_config, bp=True) 
 
     op2flops = lambda x: x * 4 * math.prod(shape)
+    # grad * sigmoid(x) * (1 + x * (1 - sigmoid(x))), sigmoid recomputed
+    op2bwflops = lambda x: x * 8 * math.prod(shape)
 
     perf_result = cal_perf(cputime, kerneltime, op2flops,
-                           config.spectflops, bp=True)
+                           config.spectflops, bp=True,
+                           op2bwflops=op2bwflops)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
 
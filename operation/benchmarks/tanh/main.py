@@ -75,9 +75,12 @@ def main(config, case_config):
         torch.tanh, (a, ), host_device_sync, config, case_config, bp=True)
 
     op2flops = lambda x: x * m * 1024 * 1024
+    # grad * (1 - out^2)
+    op2bwflops = lambda x: x * 3 * m * 1024 * 1024
 
     perf_result = cal_perf(cputime, kerneltime, op2flops,
-                           config.spectflops, bp=True)
+                           config.spectflops, bp=True,
+                           op2bwflops=op2bwflops)
     print_result(config, config.case_name, *perf_result, correctness,
                  latency_nowarm, latency_warm)
 
@@ -4,11 +4,18 @@
 #!/usr/bin/env python3
 # -*- coding: UTF-8 -*-
 import time
+import json
 from loguru import logger
 import os
 import sys
 from argparse import ArgumentParser
 import subprocess
+import yaml
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+# utils/ of FlagPerf is mounted next to the perf path in the container.
+sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../utils")))
+from task_status import write_status_file
 
 
 def parse_args():
@@ -83,6 +90,11 @@ def parse_args():
                         required=False,
                         help="path to FlagGems repository")
 
+    parser.add_argument("--sweep_cases",
+                        type=str,
+                        required=False,
+                        help="comma separated cases to run in one process")
+
     args, unknown_args = parser.parse_known_args()
     args.unknown_args = unknown_args
     return args
@@ -100,6 +112,25 @@ def write_pid_file(pid_file_path, pid_file):
     file_d.close()
 
 
+def write_sweep_file(config, sweep_file):
+    '''Write the ops of the sweep cases, with their dtypes and shape files
+       from SWEEP_OPS of configs/host.yaml, as the json list that
+       drivers/sweep.py runs.
+    '''
+    with open(os.path.join(config.perf_path, "configs", "host.yaml"),
+              "r") as file_d:
+        sweep_ops = yaml.safe_load(file_d).get("SWEEP_OPS") or {}
+    entries = []
+    for case in config.sweep_cases.split(","):
+        _, op, spectflops, _ = case.split(":")
+        entry = {"op": op, "spectflops": spectflops}
+        entry.update(sweep_ops.get(op) or {})
+        entries.append(entry)
+    with open(sweep_file, "w") as file_d:
+        json.dump(entries, file_d, indent=2)
+    return entries
+
+
 if __name__ == "__main__":
     config = parse_args()
 
@@ -113,6 +144,9 @@ if __name__ == "__main__":
 
     logger.info(config)
     write_pid_file(config.log_dir, "start_base_task.pid")
+    start_time = time.time()
+    write_status_file(config.log_dir, "start_base_task.status", "running",
+                      start_time=start_time)
     logger.info("Success Writing PID file at " +
                 os.path.join(config.log_dir, "start_base_task.pid"))
 
@@ -136,6 +170,15 @@ if __name__ == "__main__":
     script_log_file = os.path.join(os.path.dirname(logfile),
                                    "operation.log.txt")
 
+    # All the ops of a sweep run in the one process started below, only the
+    # main.py of opv2 runs a sweep file.
+    if config.sweep_cases and test_file == "opv2":
+        sweep_file = os.path.join(os.path.dirname(logfile), "sweep.json")
+        entries = write_sweep_file(config, sweep_file)
+        logger.info("Sweep of {} ops: {}".format(
+            len(entries), ",".join(entry["op"] for entry in entries)))
+        start_cmd += " --sweep_file=" + sweep_file
+
     logger.info(start_cmd)
     logger.info(script_log_file)
 
@@ -147,3 +190,9 @@ if __name__ == "__main__":
     p.wait()
     f.close()
     logger.info("Task Finish")
+    end_time = time.time()
+    write_status_file(config.log_dir, "start_base_task.status", "finished",
+                      start_time=start_time, end_time=end_time,
+                      returncode=p.returncode)
+    logger.info("Task finished in {} seconds".format(
+        round(end_time - start_time, 2)))
@@ -3,18 +3,19 @@ import re
 
 
 def render(extracted_values, readme_file_path, vendor, shm_size, chip):
-    json_data = []
-    for key, value in extracted_values.items():
-        json_data.append(value)
+    # extracted_values为合并后的结果字典，或逐条读取的结果记录，如result_log.iter_records
+    if isinstance(extracted_values, dict):
+        extracted_values = extracted_values.values()
     dest_file_path = os.path.join(readme_file_path, "README.md")
 
     # 直接使用parse_correctness_log从文件解析正确性结果
     correctness_result = parse_correctness_log(readme_file_path)
 
-    # 生成Markdown内容
-    markdown_content = create_markdown_content(json_data, vendor, shm_size, chip, correctness_result)
+    # 生成Markdown内容，评测结果逐行写入
     with open(dest_file_path, 'w') as file:
-        file.write(markdown_content)
+        file.write(create_markdown_content([], vendor, shm_size, chip, correctness_result))
+        for row in extracted_values:
+            file.write(format_row(row))
 
 
 def create_markdown_content(data, vendor, shm_size, chip, correctness_result):
@@ -46,11 +47,18 @@ def create_markdown_content(data, vendor, shm_size, chip, correctness_result):
     content += "| --- | ---| --- | ---| --- | ---| --- | ---| --- | ---| --- |\n"
 
     for row in data:
-        content += f"| {row.get('op_name', 'N/A')} | {row.get('dtype', 'N/A')} | {row.get('shape_detail', 'N/A')} | {row.get('no_warmup_latency', 'N/A')} | {row.get('warmup_latency', 'N/A')} | {row.get('raw_throughput', 'N/A')} | {row.get('core_throughput', 'N/A')} | {row.get('ctflops', 'N/A')} | {row.get('cfu', 'N/A')} | {row.get('ktflops', 'N/A')} | {row.get('kfu', 'N/A')} |\n"
+        content += format_row(row)
 
     return content
 
 
+def format_row(row):
+    """
+    返回一条评测结果的表格行
+    """
+    return f"| {row.get('op_name', 'N/A')} | {row.get('dtype', 'N/A')} | {row.get('shape_detail', 'N/A')} | {row.get('no_warmup_latency', 'N/A')} | {row.get('warmup_latency', 'N/A')} | {row.get('raw_throughput', 'N/A')} | {row.get('core_throughput', 'N/A')} | {row.get('ctflops', 'N/A')} | {row.get('cfu', 'N/A')} | {row.get('ktflops', 'N/A')} | {row.get('kfu', 'N/A')} |\n"
+
+
 def parse_correctness_log(result_path):
     """
     解析correctness.log.txt文件，提取pytest测试结果
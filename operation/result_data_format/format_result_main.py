@@ -14,7 +14,9 @@ import ast
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../")))
 OP_PATH = os.path.abspath(os.path.join(CURR_PATH, "../"))
+sys.path.append(os.path.join(OP_PATH, "benchmarks/drivers"))
 from formatMDfile import *
+from result_log import iter_records
 
 
 def extract_arrays_from_shape_detail(shape_detail):
@@ -96,21 +98,15 @@ def find_valid_timestamp_dirs(result_base_dir, max_count=1):
         timestamp_path = os.path.join(result_base_dir, timestamp_dir)
         result_json_path = os.path.join(timestamp_path, "result.json")
         
-        # 检查result.json是否存在且不为空
+        # 检查result.json是否存在且至少有一条记录
         if os.path.exists(result_json_path):
             try:
-                with open(result_json_path, 'r', encoding='utf-8') as f:
-                    content = f.read().strip()
-                    if content:  # 文件不为空
-                        json_data = json.loads(content)
-                        if json_data:  # JSON内容不为空
-                            valid_dirs.append(timestamp_path)
-                            print(f"Found valid result.json in: {timestamp_path}")
-                        else:
-                            print(f"Skipping empty JSON in: {timestamp_path}")
-                    else:
-                        print(f"Skipping empty file: {result_json_path}")
-            except (json.JSONDecodeError, Exception) as e:
+                if next(iter_records(result_json_path), None) is not None:
+                    valid_dirs.append(timestamp_path)
+                    print(f"Found valid result.json in: {timestamp_path}")
+                else:
+                    print(f"Skipping result.json without records in: {timestamp_path}")
+            except Exception as e:
                 print(f"Skipping invalid JSON in {timestamp_path}: {e}")
         else:
             print(f"Skipping directory without result.json: {timestamp_path}")
@@ -121,7 +117,7 @@ def find_valid_timestamp_dirs(result_base_dir, max_count=1):
 def merge_result_json_files(valid_dirs):
     """
     合并多个result.json文件，根据op_name、dtype、shape_detail三个字段进行匹配
-    只有这三个字段完全一样的数据才会合并
+    只有这三个字段完全一样的数据才会合并，记录逐条读取，后追加的记录覆盖先前的字段
     """
     merged_data = defaultdict(dict)
     
@@ -130,35 +126,32 @@ def merge_result_json_files(valid_dirs):
         print(f"Processing: {result_json_path}")
         
         try:
-            with open(result_json_path, 'r', encoding='utf-8') as f:
-                json_data = json.loads(f.read())
+            for value in iter_records(result_json_path):
+                # 提取三个关键字段作为匹配条件
+                op_name = value.get("op_name", "")
+                dtype = value.get("dtype", "")
+                shape_detail_raw = value.get("shape_detail", "")
+                
+                # 从shape_detail中提取数组部分用于匹配
+                arrays_only, display_shape = extract_arrays_from_shape_detail(shape_detail_raw)
+                
+                # 创建唯一标识符：op_name_dtype_arrays_only
+                # 只有算子名、数据类型、数组形状完全一样的数据才会合并
+                unique_key = f"{op_name}_{dtype}_{arrays_only}"
+                
+                # 合并数据到unique_key下
+                if unique_key not in merged_data:
+                    merged_data[unique_key] = {}
+                    print(f"  Creating new entry for: {op_name}_{dtype}_{display_shape}")
+                else:
+                    print(f"  Merging data into existing entry: {op_name}_{dtype}_{display_shape}")
+                
+                # 更新所有字段（相同unique_key的数据会合并字段）
+                merged_data[unique_key].update(value)
+                
+                # 更新shape_detail为只包含数组的显示格式
+                merged_data[unique_key]["shape_detail"] = display_shape
                 
-                for key, value in json_data.items():
-                    # 提取三个关键字段作为匹配条件
-                    op_name = value.get("op_name", "")
-                    dtype = value.get("dtype", "")
-                    shape_detail_raw = value.get("shape_detail", "")
-                    
-                    # 从shape_detail中提取数组部分用于匹配
-                    arrays_only, display_shape = extract_arrays_from_shape_detail(shape_detail_raw)
-                    
-                    # 创建唯一标识符：op_name_dtype_arrays_only
-                    # 只有算子名、数据类型、数组形状完全一样的数据才会合并
-                    unique_key = f"{op_name}_{dtype}_{arrays_only}"
-                    
-                    # 合并数据到unique_key下
-                    if unique_key not in merged_data:
-                        merged_data[unique_key] = {}
-                        print(f"  Creating new entry for: {op_name}_{dtype}_{display_shape}")
-                    else:
-                        print(f"  Merging data into existing entry: {op_name}_{dtype}_{display_shape}")
-                    
-                    # 更新所有字段（相同unique_key的数据会合并字段）
-                    merged_data[unique_key].update(value)
-                    
-                    # 更新shape_detail为只包含数组的显示格式
-                    merged_data[unique_key]["shape_detail"] = display_shape
-                    
         except Exception as e:
             print(f"Error processing {result_json_path}: {e}")
     
@@ -0,0 +1,97 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import time
+import threading
+
+import pytest
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+sys.path.append(os.path.join(CURR_PATH, "../training/utils"))
+import case_scheduler
+import start_task_helper
+
+
+def test_task_file_suffix_shared_with_launchers():
+    assert case_scheduler.task_file_suffix(None) == ""
+    assert case_scheduler.task_file_suffix([2, 3]) == "_dev2-3"
+
+    class TaskArgs:
+        visible_devices = "2,3"
+
+    assert start_task_helper.task_file_suffix(TaskArgs()) == "_dev2-3"
+    assert start_task_helper.task_file_suffix(object()) == ""
+
+
+def test_pool_prefers_aligned_blocks():
+    pool = case_scheduler.DevicePool(2, 8)
+    assert pool.acquire(1, 2) == [0, 1]
+    assert pool.acquire(2, 4) == [4, 5, 6, 7]
+    assert pool.acquire(2, 2) == [2, 3]
+    # devices 0,1 are free on the second host only
+    assert pool.acquire(2, 1) is None
+    assert pool.acquire(1, 1) is None
+
+
+def test_pool_exclusive_waits_for_all_devices():
+    pool = case_scheduler.DevicePool(1, 4)
+    devices = pool.acquire(1, 1)
+    assert pool.acquire(1, 1, exclusive=True) is None
+    assert pool.acquire(1, 8) is None
+    pool.release(1, devices)
+    assert pool.acquire(1, 1, exclusive=True) == [0, 1, 2, 3]
+
+
+def test_pool_rejects_too_many_hosts():
+    pool = case_scheduler.DevicePool(1, 8)
+    with pytest.raises(ValueError):
+        pool.acquire(2, 1)
+
+
+def test_run_concurrently_packs_and_backfills():
+    pool = case_scheduler.DevicePool(1, 4)
+    jobs = [{"name": "a", "nnodes": 1, "nproc": 2},
+            {"name": "big", "nnodes": 1, "nproc": 4},
+            {"name": "b", "nnodes": 1, "nproc": 2}]
+    lock = threading.Lock()
+    started = []
+
+    def _run_job(job, devices):
+        with lock:
+            started.append((job["name"], devices))
+        time.sleep(0.2)
+
+    stats = case_scheduler.run_concurrently(jobs, pool, _run_job)
+    # b fits next to a and is started ahead of big, big gets no mask
+    assert started[0:2] == [("a", [0, 1]), ("b", [2, 3])]
+    assert started[2] == ("big", None)
+    assert set(stats["durations"]) == {"a", "big", "b"}
+    assert stats["makespan"] < stats["busy"]
+    assert stats["saved"] == pytest.approx(stats["busy"] - stats["makespan"])
+    assert all(len(host_free) == 4 for host_free in pool.free)
+
+
+def test_run_concurrently_releases_devices_of_failed_jobs():
+    pool = case_scheduler.DevicePool(1, 2)
+    jobs = [{"name": "fail", "nnodes": 1, "nproc": 2},
+            {"name": "next", "nnodes": 1, "nproc": 2}]
+    ran = []
+
+    def _run_job(job, devices):
+        ran.append(job["name"])
+        if job["name"] == "fail":
+            raise RuntimeError("boom")
+
+    case_scheduler.run_concurrently(jobs, pool, _run_job)
+    assert ran == ["fail", "next"]
+
+
+def test_run_concurrently_rejects_unschedulable_jobs():
+    pool = case_scheduler.DevicePool(1, 2)
+    jobs = [{"name": "huge", "nnodes": 2, "nproc": 1}]
+    with pytest.raises(ValueError):
+        case_scheduler.run_concurrently(jobs, pool, lambda job, devices: None)
@@ -0,0 +1,177 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''ClusterManager against fake hosts.
+
+Fake ssh and scp on PATH run the commands on the local host. The fake ssh
+counts a handshake whenever a command finds no master connection of its
+host, as a real ssh would open one itself.
+'''
+
+import os
+import sys
+import stat
+import logging
+import threading
+
+import pytest
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import cluster_manager
+
+FAKE_SSH = '''\
+#!{python}
+import os, sys, subprocess
+args = sys.argv[1:]
+opts, rest, master, control_path = {{}}, [], False, None
+i = 0
+while i < len(args):
+    arg = args[i]
+    if arg in ("-o", "-l", "-p", "-O"):
+        if arg == "-o" and args[i + 1].startswith("ControlPath="):
+            control_path = args[i + 1].split("=", 1)[1]
+        opts[arg] = args[i + 1]
+        i += 2
+    elif arg == "-fN":
+        master = True
+        i += 1
+    else:
+        rest.append(arg)
+        i += 1
+host, cmd = rest[0], " ".join(rest[1:])
+socket = control_path.replace("%C", host) if control_path else None
+log = open(os.environ["FAKE_SSH_LOG"], "a")
+if "-O" in opts:
+    if socket and os.path.exists(socket):
+        os.remove(socket)
+    sys.exit(0)
+if master:
+    open(socket, "w").close()
+    log.write("handshake " + host + "\\n")
+    sys.exit(0)
+if socket is None or not os.path.exists(socket):
+    log.write("handshake " + host + "\\n")
+log.write("command " + host + "\\n")
+log.close()
+sys.exit(subprocess.call(cmd, shell=True))
+'''
+
+FAKE_SCP = '''\
+#!{python}
+import sys, shutil
+src, dest = [arg for arg in sys.argv[1:] if not arg.startswith("-")
+             and "=" not in arg and arg != "22"][-2:]
+shutil.copy(src, dest.split(":", 1)[1])
+'''
+
+
+def _write_script(path, content):
+    with open(path, "w") as file_d:
+        file_d.write(content.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+
+
+@pytest.fixture
+def fake_hosts(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    _write_script(bin_dir / "ssh", FAKE_SSH)
+    _write_script(bin_dir / "scp", FAKE_SCP)
+    ssh_log = tmp_path / "ssh.log"
+    ssh_log.write_text("")
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+    monkeypatch.setenv("FAKE_SSH_LOG", str(ssh_log))
+    return ssh_log
+
+
+def _handshakes(ssh_log):
+    counts = {}
+    for line in ssh_log.read_text().splitlines():
+        kind, host = line.split()
+        if kind == "handshake":
+            counts[host] = counts.get(host, 0) + 1
+    return counts
+
+
+def _run(tmp_path, multiplex):
+    hosts = ["host1", "host2", "host3"]
+    manager = cluster_manager.ClusterManager()
+    manager.init(hosts, "22", "root", logging.getLogger("test"),
+                 multiplex=multiplex)
+    assert manager.healthcheck() == {}
+
+    remote_dir = tmp_path / "remote"
+    remote_dir.mkdir()
+    (remote_dir / "rank0.log").write_text("log of rank 0\n")
+    config_file = tmp_path / "config.py"
+    config_file.write_text("batch_size = 8\n")
+    assert manager.run_command_some_hosts("mkdir -p " + str(remote_dir),
+                                          len(hosts)) == {}
+    assert manager.sync_file_to_some_hosts(str(config_file),
+                                           str(remote_dir), len(hosts)) == {}
+    collect_dir = tmp_path / "collect"
+    assert manager.collect_files_some_hosts(str(remote_dir),
+                                            str(collect_dir),
+                                            len(hosts)) == {}
+    assert (collect_dir / "rank0.log").read_text() == "log of rank 0\n"
+    stats = manager.get_conn_stats()
+    manager.close_connections()
+    return hosts, stats
+
+
+def test_one_handshake_per_host_in_a_run(tmp_path, fake_hosts):
+    hosts, stats = _run(tmp_path, multiplex=True)
+    assert _handshakes(fake_hosts) == {host: 1 for host in hosts}
+    assert stats["masters"] == len(hosts)
+    assert stats["ssh"] > len(hosts)
+
+
+def test_handshake_per_command_without_multiplex(tmp_path, fake_hosts):
+    hosts, stats = _run(tmp_path, multiplex=False)
+    handshakes = _handshakes(fake_hosts)
+    assert stats["masters"] == 0
+    assert all(handshakes[host] > 1 for host in hosts)
+
+
+def test_concurrent_collects_keep_their_stats(tmp_path, fake_hosts):
+    hosts = ["host1", "host2"]
+    manager = cluster_manager.ClusterManager()
+    manager.init(hosts, "22", "root", logging.getLogger("test"))
+    results = {}
+
+    def _collect(case):
+        remote_dir = tmp_path / case
+        remote_dir.mkdir()
+        (remote_dir / (case + ".log")).write_text(case + "\n")
+        results[case] = manager.collect_files_some_hosts(
+            str(remote_dir), str(tmp_path / ("collect_" + case)), len(hosts))
+
+    threads = [threading.Thread(target=_collect, args=("case" + str(i), ))
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manager.close_connections()
+    assert results == {"case" + str(i): {} for i in range(4)}
+    assert set(manager.get_collect_stats()) == set(hosts)
+
+
+def test_pipe_drains_stderr_of_both_ends():
+    manager = cluster_manager.ClusterManager()
+    # far more stderr than a pipe buffer, before and after the stream
+    sender = sys.executable + " -c \"import sys; sys.stderr.write('e' * " \
+        + "1000000); sys.stdout.write('x' * 100000); sys.stderr.write('!')\""
+    receiver = sys.executable + " -c \"import sys; sys.stderr.write('r' * " \
+        + "1000000); sys.stdin.read(); sys.stderr.write('!')\""
+    stats = {"bytes": 0}
+    ret, outs = manager._pipe_commands(sender, receiver, stats, timeout=20)
+    assert ret == 0 and stats["bytes"] == 100000
+    assert outs[0] == "e" * 1000000 + "!" + "r" * 1000000 + "!"
+
+    stats = {"bytes": 0}
+    results = manager._pipe_command_to_many(sender, [receiver] * 2, stats,
+                                            timeout=20)
+    assert results == [(0, [outs[0], None])] * 2
+    assert stats["bytes"] == 100000
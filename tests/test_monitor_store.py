@@ -0,0 +1,76 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import monitor_store
+
+
+def test_summarize_matches_numpy():
+    rng = np.random.default_rng(0)
+    series = [(None, rng.normal(size=n)) for n in (1, 7, 100)]
+    summary = monitor_store.summarize(series)
+    for i, (_, values) in enumerate(series):
+        stats = monitor_store.summary_row(summary, i)
+        assert stats["count"] == len(values)
+        assert stats["mean"] == pytest.approx(np.mean(values))
+        assert stats["std"] == pytest.approx(np.std(values))
+        assert stats["max"] == np.max(values)
+        assert stats["min"] == np.min(values)
+        for q in monitor_store.PERCENTILES:
+            assert stats["p" + str(q)] == pytest.approx(
+                np.percentile(values, q))
+
+
+def test_summarize_skips_nan_and_empty_series():
+    series = [(None, [1.0, float("nan"), 3.0]), (None, [])]
+    summary = monitor_store.summarize(series)
+    stats = monitor_store.summary_row(summary, 0)
+    assert stats["count"] == 2 and stats["mean"] == 2.0
+    empty = monitor_store.summary_row(summary, 1)
+    assert empty["count"] == 0 and empty["mean"] != empty["mean"]
+
+
+def test_summarize_upper_half_per_series():
+    busy = [0.0, 0.0, 10.0, 10.0]
+    series = [(None, busy), (None, busy)]
+    summary = monitor_store.summarize(series, upper_half=[True, False])
+    assert monitor_store.summary_row(summary, 0)["mean"] == 10.0
+    assert monitor_store.summary_row(summary, 1)["mean"] == 5.0
+
+
+def test_summarize_rejects_flags_of_other_series():
+    series = [(None, [1.0]), (None, [2.0])]
+    with pytest.raises(ValueError):
+        monitor_store.summarize(series, upper_half=[True])
+
+
+def test_summarize_energy_integrates_over_time():
+    timestamps = [0.0, 1.0, 3.0]
+    watts = [100.0, 100.0, 200.0]
+    summary = monitor_store.summarize([(timestamps, watts)])
+    stats = monitor_store.summary_row(summary, 0)
+    assert stats["energy"] == pytest.approx(100.0 + 300.0)
+
+
+def test_store_without_sources_is_stale(tmp_path):
+    log_dir = str(tmp_path)
+    monitor_store.save_columns(log_dir, {"sys_pwr": [1.0]})
+    store = os.path.join(log_dir, monitor_store.STORE_DIR, "sys_pwr.npy")
+    source = str(tmp_path / "pwr_monitor.log")
+    assert not monitor_store._newer_than(store, [source])
+    with open(source, "w") as file_d:
+        file_d.write("")
+    os.utime(source, (0, 0))
+    assert monitor_store._newer_than(store, [source])
+    os.remove(source)
+    # the monitor logs are gone, the old store isn't read as theirs
+    with pytest.raises(OSError):
+        monitor_store.sys_columns(log_dir)
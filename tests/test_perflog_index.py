@@ -0,0 +1,93 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import json
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import perflog_index
+
+
+def _line(event, value=None, step=None):
+    message = {"event": event, "value": value, "metadata": {"step": step}}
+    return "[PerfLog] " + json.dumps(message) + "\n"
+
+
+def _write_log(log_file, lines):
+    with open(log_file, "w", newline="") as file_d:
+        file_d.write("".join(lines))
+
+
+def _steps(index, after=None, before=None):
+    return [message["metadata"]["step"]
+            for message in index.query("STEP_END", after, before)]
+
+
+def test_offsets_point_at_messages(tmp_path):
+    log_file = str(tmp_path / "rank0.out.log")
+    _write_log(log_file, [
+        "loading data\n",
+        _line("INIT_START"),
+        "2024 INFO noise [PerfLog] not json\n",
+        _line("STEP_END", 1.5, 1).replace("\n", "\r\n"),
+        _line("FINISHED", {"e2e_time": 3.0}),
+    ])
+    index = perflog_index.PerfLogIndex(log_file)
+    assert sorted(index.names()) == ["FINISHED", "INIT_START", "STEP_END"]
+    with open(log_file, "rb") as file_d:
+        data = file_d.read()
+    for name in index.names():
+        for offset, length in index.offsets(name):
+            assert json.loads(data[offset:offset + length])["event"] == name
+    assert index.query("FINISHED")[0]["value"] == {"e2e_time": 3.0}
+
+
+def test_query_between_events(tmp_path):
+    log_file = str(tmp_path / "rank0.out.log")
+    lines = [_line("STEP_END", step=0), _line("TRAIN_START")]
+    lines += [_line("STEP_END", step=step) for step in range(1, 4)]
+    lines += [_line("TRAIN_END"), _line("STEP_END", step=9)]
+    _write_log(log_file, lines)
+    index = perflog_index.PerfLogIndex(log_file)
+    assert index.count("STEP_END") == 5
+    assert _steps(index) == [0, 1, 2, 3, 9]
+    assert _steps(index, "TRAIN_START", "TRAIN_END") == [1, 2, 3]
+    assert _steps(index, after="TRAIN_END") == [9]
+    assert _steps(index, after="EVALUATE") == []
+    assert [message["event"] for message in index.messages(
+        ["TRAIN_END", "TRAIN_START"])] == ["TRAIN_START", "TRAIN_END"]
+
+
+def test_growing_log_is_indexed_incrementally(tmp_path):
+    log_file = str(tmp_path / "rank0.out.log")
+    partial = _line("STEP_END", step=2)
+    _write_log(log_file, [_line("STEP_END", step=1), partial[:20]])
+    index = perflog_index.PerfLogIndex(log_file)
+    assert _steps(index) == [1]
+    with open(log_file, "a") as file_d:
+        file_d.write(partial[20:] + _line("STEP_END", step=3))
+    index.update()
+    assert _steps(index) == [1, 2, 3]
+
+    reloaded = perflog_index.PerfLogIndex(log_file)
+    assert reloaded.scanned == os.path.getsize(log_file)
+    assert _steps(reloaded) == [1, 2, 3]
+
+
+def test_index_of_rewritten_log_is_dropped(tmp_path):
+    log_file = str(tmp_path / "rank0.out.log")
+    _write_log(log_file, [_line("STEP_END", step=step) for step in range(5)])
+    perflog_index.PerfLogIndex(log_file)
+    _write_log(log_file, [_line("STEP_END", step=7)])
+    assert _steps(perflog_index.PerfLogIndex(log_file)) == [7]
+
+
+def test_no_sidecar_without_save(tmp_path):
+    log_file = str(tmp_path / "rank0.out.log")
+    _write_log(log_file, [_line("FINISHED")])
+    index = perflog_index.PerfLogIndex(log_file, save=False)
+    assert index.count("FINISHED") == 1
+    assert not os.path.exists(log_file + perflog_index.INDEX_SUFFIX)
@@ -0,0 +1,88 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import json
+
+import numpy as np
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import phase_analyzer
+import sys_monitor
+import telemetry
+
+
+def _perf_line(event, seconds, value=None):
+    message = {"event": event, "value": value,
+               "metadata": {"time_ms": seconds * 1000.0}}
+    return "[PerfLog] " + json.dumps(message) + "\n"
+
+
+def _shared_round(tmp_path):
+    '''A round of a case on devices 2,3 of a host, whose monitors also
+       sampled devices 0,1 running another case, and the time around it.'''
+    host = "10.1.1.1_noderank0"
+    round_dir = tmp_path / "bert" / "round1"
+    (round_dir / host).mkdir(parents=True)
+    (round_dir / host / "rank0.out.log").write_text(
+        _perf_line("INIT_START", 10) + _perf_line("INIT_END", 12) +
+        _perf_line("TRAIN_START", 12) + _perf_line("TRAIN_END", 18) +
+        _perf_line("FINISHED", 19, {"num_trained_samples": 600}))
+    monitor_dir = tmp_path / "concurrent_monitors"
+    (monitor_dir / host).mkdir(parents=True)
+    records = []
+    for second in range(0, 40):
+        for device in range(4):
+            # 100W on the devices of the case in its window, else 500W
+            power = 100.0 if device >= 2 and 5 <= second <= 20 else 500.0
+            records.append([second, device, 40.0, power, 1024.0, 81920.0,
+                            90.0])
+    np.asarray(records, dtype=np.float64).tofile(
+        telemetry.telemetry_file_of(str(monitor_dir / host), "nvidia"))
+    np.asarray([[second, 1.0, 1.0, 1000.0] for second in range(40)],
+               dtype=np.float64).tofile(
+                   str(monitor_dir / host / sys_monitor.BIN_FILE))
+    return str(round_dir), str(monitor_dir), host
+
+
+def test_work_done_prefers_counters():
+    info = {"num_trained_samples": 1000, "throughput(sps)_raw": 5.0}
+    assert phase_analyzer.work_done(info, 10.0) == (1000, None)
+
+
+def test_work_done_images_per_second():
+    info = {
+        "throughput(ips)_pure_compute": 200.0,
+        "throughput(ips)_raw": 100.0,
+        "converged": True
+    }
+    assert phase_analyzer.work_done(info, 10.0) == (1000.0, None)
+
+
+def test_work_done_tokens():
+    info = {"training_tokens_per_second": 50.0}
+    assert phase_analyzer.work_done(info, 4.0) == (None, 200.0)
+
+
+def test_work_done_without_counters():
+    assert phase_analyzer.work_done({"e2e_time": 3.0}, 4.0) == (None, None)
+    assert phase_analyzer.work_done(None, 4.0) == (None, None)
+
+
+def test_shared_monitors_sliced_by_window_and_devices(tmp_path):
+    round_dir, monitor_dir, host = _shared_round(tmp_path)
+    result = phase_analyzer.analyze_round(round_dir, "nvidia", monitor_dir,
+                                          [2, 3], [5.0, 20.0])
+    assert result["phases"]["launch"] == [5.0, 10.0]
+    assert result["phases"]["finish"] == [18.0, 20.0]
+    for phase in result["phases"]:
+        assert result["hosts"][host][phase]["chip_power"]["max"] == 100.0
+    train = result["train"]
+    # 2 devices * 100W * 6s, the shared host power is not charged
+    assert train["chip_power_energy"] == 1200.0
+    assert train["chip_power_energy_per_sample"] == 2.0
+    assert "sys_pwr_energy" not in train
+    assert result["hosts"][host]["train"]["sys_pwr"]["mean"] == 1000.0
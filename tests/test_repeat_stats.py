@@ -0,0 +1,67 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import json
+import math
+
+import pytest
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import repeat_stats
+
+
+@pytest.mark.parametrize("dof, expected", [(1, 12.7062), (4, 2.7764),
+                                           (10, 2.2281), (30, 2.0423)])
+def test_t_critical_matches_table(dof, expected):
+    assert repeat_stats.t_critical(0.95, dof) == pytest.approx(expected,
+                                                                abs=1e-4)
+
+
+def test_aggregate_confidence_interval():
+    values = [10.0, 12.0, 11.0, 13.0, 9.0]
+    stats = repeat_stats.aggregate(values)
+    std = math.sqrt(2.5)
+    half_width = 2.776445 * std / math.sqrt(5)
+    assert stats["mean"] == 11.0
+    assert stats["std"] == pytest.approx(std)
+    assert stats["cv"] == pytest.approx(std / 11.0)
+    assert stats["ci_low"] == pytest.approx(11.0 - half_width, rel=1e-5)
+    assert stats["ci_high"] == pytest.approx(11.0 + half_width, rel=1e-5)
+    assert repeat_stats.ci_relative_width(stats) == pytest.approx(
+        half_width / 11.0, rel=1e-5)
+
+
+def test_aggregate_single_value_has_no_interval():
+    stats = repeat_stats.aggregate([5.0])
+    assert stats["count"] == 1 and stats["std"] is None
+    assert repeat_stats.ci_relative_width(stats) is None
+
+
+def _write_round(case_dir, round_num, result):
+    rank_dir = case_dir / ("round" + str(round_num)) / "10.1.1.1_noderank0"
+    rank_dir.mkdir(parents=True)
+    message = {
+        "event": "FINISHED",
+        "value": result,
+        "metadata": {"time_ms": 1000 * round_num}
+    }
+    (rank_dir / "rank0.out.log").write_text("[PerfLog] " +
+                                            json.dumps(message) + "\n")
+
+
+def test_case_summary_over_finished_rounds(tmp_path):
+    case_dir = tmp_path / "bert:pytorch:A100:1:8:1"
+    for round_num, throughput in [(1, 100.0), (2, 100.0), (10, 130.0)]:
+        _write_round(case_dir, round_num,
+                     {"throughput(ips)_raw": throughput, "converged": True})
+    (case_dir / "round3").mkdir()
+    summary = repeat_stats.case_summary(str(case_dir), cv_threshold=0.1)
+    assert summary["rounds"] == ["round1", "round2", "round10"]
+    stats = summary["metrics"]["throughput(ips)_raw"]
+    assert stats["count"] == 3 and stats["mean"] == 110.0
+    assert stats["unstable"]
+    assert "converged" not in summary["metrics"]
@@ -0,0 +1,82 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import json
+import threading
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH,
+                             "../operation/benchmarks/drivers"))
+import result_log
+
+
+def _record(op, shape, **values):
+    record = {"op_name": op, "dtype": "float16", "shape_detail": shape}
+    record.update(values)
+    return record
+
+
+def test_append_to_legacy_result_json(tmp_path):
+    path = str(tmp_path / "result.json")
+    legacy = _record("abs", "[1024]", warmup_latency=1.0)
+    with open(path, "w", encoding="utf-8") as file_w:
+        # keyed object without a newline at its end, as older runs wrote
+        file_w.write(json.dumps({result_log.result_key(legacy): legacy}))
+    result_log.append_records(path, [_record("mm", "[64, 64]",
+                                             warmup_latency=2.0)])
+    results = result_log.load_results(path)
+    assert sorted(record["op_name"] for record in results.values()) == [
+        "abs", "mm"
+    ]
+
+
+def test_later_records_update_earlier_ones(tmp_path):
+    path = str(tmp_path / "result.json")
+    result_log.append_records(path, [_record("abs", "[1024]", latency=1.0)])
+    result_log.append_records(path, [
+        _record("abs", "[1024]", correctness_status="passed"),
+        _record("abs", "[2048]", latency=2.0)
+    ])
+    result_log.append_records(path, [])
+    records = list(result_log.iter_records(path))
+    assert len(records) == 3
+    merged = result_log.load_results(path)
+    first = merged[result_log.result_key(records[0])]
+    assert first["latency"] == 1.0
+    assert first["correctness_status"] == "passed"
+
+
+def test_compact_keeps_one_record_per_key(tmp_path):
+    path = str(tmp_path / "result.json")
+    for latency in (3.0, 2.0, 1.0):
+        result_log.append_records(path,
+                                  [_record("abs", "[1024]", latency=latency)])
+    with open(path, "a", encoding="utf-8") as file_a:
+        file_a.write('{"op_name": "cut sh')
+    merged = result_log.compact_results(path)
+    assert len(merged) == 1
+    with open(path, "r", encoding="utf-8") as file_r:
+        lines = file_r.read().splitlines()
+    assert len(lines) == 1 and json.loads(lines[0])["latency"] == 1.0
+    assert result_log.load_results(path) == merged
+
+
+def test_concurrent_appends_are_not_interleaved(tmp_path):
+    path = str(tmp_path / "result.json")
+    shapes = ["[{}]".format(size) for size in range(50)]
+
+    def _append(op):
+        result_log.append_records(
+            path, [_record(op, shape, latency=1.0) for shape in shapes])
+
+    threads = [threading.Thread(target=_append, args=("op" + str(i), ))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(result_log.load_results(path)) == 8 * len(shapes)
+    assert result_log.load_results(str(tmp_path / "missing.json")) == {}
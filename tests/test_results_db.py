@@ -0,0 +1,107 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+
+import pytest
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import results_db
+
+
+@pytest.mark.parametrize("metric", [
+    "e2e_time", "raw_train_time", "p_infer_time(s)", "warmup_latency",
+    "latency_base_cpu_warm", "kerneltime", "sys_pwr_mean",
+    "interconnect-P2P_intraserver-latency(us)"
+])
+def test_lower_is_better(metric):
+    assert results_db.lower_is_better(metric)
+
+
+@pytest.mark.parametrize("metric", [
+    "tokens_per_second", "throughput(sps)", "throughput(ips)_raw",
+    "training_sps", "ctflops", "computation-FP16(TFLOPS)",
+    "main_memory-bandwidth(GB/s)", "main_memory-capacity(GiB)",
+    "final_accuracy"
+])
+def test_higher_is_better(metric):
+    assert not results_db.lower_is_better(metric)
+
+
+def _store(tmp_path, samples):
+    conn = results_db.connect(str(tmp_path / "results.db"))
+    rows = []
+    for run_id, values in samples.items():
+        for metric, metric_values in values.items():
+            for sample, value in enumerate(metric_values):
+                rows.append((run_id, "training", "nvidia", None, "bert",
+                             "hash", metric, sample, value))
+    results_db.insert_rows(conn, rows)
+    return conn
+
+
+def test_compare_reports_significant_slowdown(tmp_path):
+    conn = _store(tmp_path, {
+        "base": {
+            "e2e_time": [100.0, 101.0, 99.0],
+            "tokens_per_second": [1000.0, 1010.0, 990.0]
+        },
+        "new": {
+            "e2e_time": [120.0, 121.0, 119.0],
+            "tokens_per_second": [1200.0, 1210.0, 1190.0]
+        }
+    })
+    report = {
+        item["metric"]: item
+        for item in results_db.compare(conn, "run:base", "run:new")
+    }
+    assert report["e2e_time"]["status"] == "regression"
+    assert report["e2e_time"]["change"] == pytest.approx(-0.2)
+    assert report["tokens_per_second"]["status"] == "ok"
+    assert not report["tokens_per_second"]["regression"]
+
+
+def test_compare_single_sample_is_untested(tmp_path):
+    conn = _store(tmp_path, {
+        "base": {"e2e_time": [100.0]},
+        "new": {"e2e_time": [150.0, 151.0]}
+    })
+    item, = results_db.compare(conn, "run:base", "run:new")
+    assert item["p_value"] is None
+    assert item["status"] == "untested"
+    assert not item["regression"]
+
+
+def _operation_log(path, latencies):
+    records = [{"op_name": "abs", "dtype": "float16", "shape_detail": "[1024]",
+                "warmup_latency": latency} for latency in latencies]
+    records.append({"op_name": "abs", "dtype": "float16",
+                    "shape_detail": "[1024]", "correctness_status": "passed"})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    results_db.result_log.append_records(path, records)
+
+
+def test_operation_repeats_and_runs_are_samples(tmp_path):
+    conn = results_db.connect(str(tmp_path / "results.db"))
+    _operation_log(str(tmp_path / "run1" / "result.json"), [10.0, 10.2])
+    rows = results_db.operation_rows(str(tmp_path / "run1" / "result.json"),
+                                     "nvidia")
+    assert [(row[6], row[7], row[8]) for row in rows] == [
+        ("warmup_latency", 0, 10.0), ("warmup_latency", 1, 10.2)
+    ]
+    results_db.insert_rows(conn, rows)
+    for run_id, latency in [("run2", 10.1), ("run3", 15.0), ("run4", 15.2)]:
+        _operation_log(str(tmp_path / run_id / "result.json"), [latency])
+        results_db.ingest(conn, "operation",
+                          str(tmp_path / run_id / "result.json"),
+                          "nvidia" if run_id == "run2" else "other")
+
+    single = results_db.compare(conn, "run:run2", "run:run3")
+    assert [item["status"] for item in single] == ["untested"]
+    pooled = results_db.compare(conn, "vendor:nvidia", "vendor:other")
+    assert len(pooled) == 1
+    assert pooled[0]["base_samples"] == 3 and pooled[0]["new_samples"] == 2
+    assert pooled[0]["status"] == "regression"
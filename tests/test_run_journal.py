@@ -0,0 +1,90 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import run_journal
+
+
+def _journal(log_path):
+    journal = run_journal.RunJournal()
+    journal.init(str(log_path))
+    return journal
+
+
+def test_resume_loads_last_states(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("bert", run_journal.IMAGE_READY)
+    for round_num in (1, 2):
+        journal.record("bert", run_journal.STARTED, round_num)
+        journal.record("bert", run_journal.FINISHED, round_num)
+    journal.record("bert", run_journal.STARTED, 3)
+    journal.record("bert", run_journal.FAILED, 3)
+
+    resumed = _journal(tmp_path)
+    assert resumed.state_of("bert") == run_journal.IMAGE_READY
+    assert resumed.round_finished("bert", 2)
+    assert resumed.state_of("bert", 3) == run_journal.FAILED
+    assert resumed.case_finished("bert", 2)
+    assert not resumed.case_finished("bert", 3)
+    assert not resumed.case_finished("resnet", 1)
+
+
+def test_resume_ignores_truncated_line(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("bert", run_journal.FINISHED, 1)
+    with open(journal.journal_file, "a") as file_d:
+        file_d.write('{"case": "bert", "round": 2, "sta')
+
+    resumed = _journal(tmp_path)
+    assert resumed.round_finished("bert", 1)
+    assert resumed.state_of("bert", 2) is None
+    resumed.record("bert", run_journal.FINISHED, 2)
+
+    again = _journal(tmp_path)
+    assert again.case_finished("bert", 2)
+    assert len(again.entries) == 2
+
+
+def test_summary_by_case_and_round(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("bert", run_journal.LOGS_COLLECTED)
+    journal.record("bert", run_journal.FINISHED, 1, host="10.1.1.1")
+    assert journal.summary() == {
+        "bert": {
+            None: run_journal.LOGS_COLLECTED,
+            1: run_journal.FINISHED
+        }
+    }
+    assert journal.entries[-1]["host"] == "10.1.1.1"
+
+
+def test_last_round(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("bert", run_journal.IMAGE_READY)
+    assert journal.last_round("bert") == 0
+    for round_num in (1, 2, 3):
+        journal.record("bert", run_journal.FINISHED, round_num)
+    journal.record("bert", run_journal.STARTED, 4)
+    journal.record("resnet", run_journal.FINISHED, 7)
+    assert journal.last_round("bert") == 4
+    assert not journal.case_finished("bert", journal.last_round("bert"))
+
+
+def test_last_run_of_round(tmp_path):
+    journal = _journal(tmp_path)
+    assert journal.last_run("bert", 1) is None
+    journal.record("bert", run_journal.CONTAINER_UP, 1, devices=[0, 1])
+    journal.record("bert", run_journal.FAILED, 1)
+    journal.record("bert", run_journal.CONTAINER_UP, 1, devices=[2, 3])
+    container_up, end_time = journal.last_run("bert", 1)
+    assert container_up["devices"] == [2, 3] and end_time is None
+    journal.record("bert", run_journal.STARTED, 1)
+    journal.record("bert", run_journal.FINISHED, 1)
+    container_up, end_time = _journal(tmp_path).last_run("bert", 1)
+    assert end_time == journal.entries[-1]["time"]
+    assert end_time >= container_up["time"]
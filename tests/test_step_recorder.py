@@ -0,0 +1,50 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+
+import numpy as np
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../training/benchmarks/driver"))
+import step_recorder
+
+
+class DeviceLoss:
+    '''A device tensor whose runtime is shut down.'''
+
+    def detach(self):
+        return self
+
+    def __float__(self):
+        raise RuntimeError("CUDA error: driver shutting down")
+
+
+def test_end_without_begin_has_unknown_first_start(tmp_path):
+    record_file = str(tmp_path / "rank0.steps.npy")
+    recorder = step_recorder.StepRecorder(record_file, capacity=2)
+    for step in range(1, 5):
+        recorder.end(step, 1.0, {"num_trained_samples": 8 * step})
+    recorder.flush()
+    records = step_recorder.load_steps(record_file)
+    assert list(records["step"]) == [1, 2, 3, 4]
+    assert records["t_start_ns"][0] == -1
+    assert list(records["t_start_ns"][1:]) == list(records["t_end_ns"][:-1])
+    assert list(records["samples"]) == [8, 8, 8, 8]
+    stats = step_recorder.step_time_stats(records, warmup_steps=0)
+    assert stats["count"] == 3
+
+
+def test_flush_after_device_shutdown(tmp_path):
+    record_file = str(tmp_path / "rank0.steps.npy")
+    recorder = step_recorder.StepRecorder(record_file)
+    recorder.begin()
+    recorder.end(1, DeviceLoss())
+    recorder.begin()
+    recorder.end(2, 0.5)
+    recorder.flush()
+    records = step_recorder.load_steps(record_file)
+    assert np.isnan(records["loss"][0]) and records["loss"][1] == 0.5
+    assert (records["t_start_ns"] > 0).all()
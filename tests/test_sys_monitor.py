@@ -0,0 +1,39 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import math
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import sys_monitor
+
+
+def _hwmon(hwmon_path, index, name, sensors):
+    device = hwmon_path / ("hwmon" + str(index))
+    device.mkdir(parents=True)
+    (device / "name").write_text(name + "\n")
+    for sensor, microwatts in sensors.items():
+        (device / sensor).write_text(str(microwatts) + "\n")
+
+
+def test_power_of_acpi_power_meter_only(tmp_path):
+    _hwmon(tmp_path, 0, "amdgpu", {"power1_average": 900000000})
+    _hwmon(tmp_path, 1, "acpi_power_meter", {
+        "power1_input": 420000000,
+        "power1_average": 400000000
+    })
+    _hwmon(tmp_path, 2, "coretemp", {})
+    sensors = sys_monitor.find_power_sensors(str(tmp_path))
+    assert [os.path.basename(sensor) for sensor in sensors] == [
+        "power1_average", "power1_input"
+    ]
+    assert sys_monitor.read_power(sensors) == 400.0
+
+
+def test_no_acpi_power_meter(tmp_path):
+    _hwmon(tmp_path, 0, "amdgpu", {"power1_average": 900000000})
+    assert sys_monitor.find_power_sensors(str(tmp_path)) == []
+    assert math.isnan(sys_monitor.read_power([]))
@@ -0,0 +1,115 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import threading
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+import task_status
+
+
+def _pid_file(tmp_path):
+    pid_file = tmp_path / "start_base_task.pid"
+    pid_file.write_text(str(os.getpid()) + "\n")
+    return str(pid_file)
+
+
+def test_exit_codes_differ_from_argparse_and_ssh():
+    codes = [task_status.FINISHED, task_status.STILL_RUNNING,
+             task_status.NOT_STARTED]
+    assert len(set(codes)) == len(codes)
+    assert 2 not in codes and 255 not in codes
+
+
+def test_write_status_file_replaces_record(tmp_path):
+    task_status.write_status_file(str(tmp_path), "task.status",
+                                  task_status.STATE_RUNNING, start_time=1.0)
+    task_status.write_status_file(str(tmp_path), "task.status",
+                                  task_status.STATE_FINISHED, ret=0)
+    record = task_status.read_status(str(tmp_path / "task.status"))
+    assert record["state"] == task_status.STATE_FINISHED
+    assert record["ret"] == 0 and "start_time" not in record
+    assert os.listdir(str(tmp_path)) == ["task.status"]
+
+
+def test_wait_returns_on_finished_record(tmp_path):
+    pid_file = _pid_file(tmp_path)
+    timer = threading.Timer(
+        0.2, task_status.write_status_file,
+        (str(tmp_path), "start_base_task.status",
+         task_status.STATE_FINISHED))
+    timer.start()
+    ret, record = task_status.wait_for_finish(pid_file, lambda _: True,
+                                              timeout=5, poll_interval=0.05)
+    timer.join()
+    assert ret == task_status.FINISHED
+    assert record["state"] == task_status.STATE_FINISHED
+
+
+def test_wait_times_out_while_running(tmp_path):
+    pid_file = _pid_file(tmp_path)
+    task_status.write_status_file(str(tmp_path), "start_base_task.status",
+                                  task_status.STATE_RUNNING)
+    ret, record = task_status.wait_for_finish(pid_file, lambda _: True,
+                                              timeout=0.2,
+                                              poll_interval=0.05)
+    assert ret == task_status.STILL_RUNNING
+    assert record["state"] == task_status.STATE_RUNNING
+
+
+def test_wait_falls_back_to_pid(tmp_path):
+    pid_file = _pid_file(tmp_path)
+    ret, record = task_status.wait_for_finish(pid_file, lambda _: False,
+                                              timeout=5, poll_interval=0.05,
+                                              pid_check_interval=0.1)
+    assert ret == task_status.FINISHED
+    assert record is None
+
+
+def test_wait_reports_task_not_started(tmp_path):
+    pid_file = str(tmp_path / "start_base_task.pid")
+    ret, record = task_status.wait_for_finish(pid_file, lambda _: True,
+                                              timeout=5, poll_interval=0.05,
+                                              pid_check_interval=0.1,
+                                              start_timeout=0.2)
+    assert ret == task_status.NOT_STARTED
+    assert record is None
+
+
+def test_wait_reads_files_in_container_view(tmp_path):
+    # The log dir is mounted at another path in the container, the host
+    # never sees the pid file nor the status file at pid_file.
+    host_dir = tmp_path / "host"
+    container_dir = tmp_path / "container"
+    host_dir.mkdir()
+    container_dir.mkdir()
+    pid_file = str(host_dir / "start_base_task.pid")
+    (container_dir / "start_base_task.pid").write_text("1234\n")
+    checks = []
+
+    def read_in_container(path):
+        return task_status.read_text(
+            str(container_dir / os.path.basename(path)))
+
+    def is_running(_):
+        checks.append(True)
+        return len(checks) < 3
+
+    ret, record = task_status.wait_for_finish(
+        pid_file, is_running, timeout=5, poll_interval=0.05,
+        pid_check_interval=0.1, start_timeout=0.1,
+        read_task_file=read_in_container)
+    assert ret == task_status.FINISHED
+    assert record is None and len(checks) == 3
+
+    task_status.write_status_file(str(container_dir),
+                                  "start_base_task.status",
+                                  task_status.STATE_FINISHED, ret=0)
+    ret, record = task_status.wait_for_finish(
+        pid_file, lambda _: True, timeout=5, poll_interval=0.05,
+        pid_check_interval=0.1, start_timeout=0.1,
+        read_task_file=read_in_container)
+    assert ret == task_status.FINISHED and record["ret"] == 0
@@ -0,0 +1,118 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import sys
+import math
+import stat
+import time
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH, "../utils"))
+sys.path.append(os.path.join(CURR_PATH, "../base/vendors/nvidia"))
+import telemetry
+import nvidia_monitor
+
+CSV = '''\
+100.0, 0, 40 C, 250.5 W, 1024 MiB, 81920 MiB, 90 %
+100.0, 1, 41 C, [N/A], 2048 MiB, 81920 MiB, 95 %
+100.5, 0, 42 C, 260.0 W, 1536 MiB, 81920 MiB, 99 %
+truncated, line
+'''
+
+
+FAKE_NVIDIA_SMI = '''\
+#!{python}
+import sys, time
+for sample in range(3):
+    for device in range(2):
+        print("%d, 40, 250.5, 1024, 81920, 90" % device, flush=True)
+        time.sleep(0.02)
+    time.sleep(0.1)
+'''
+
+
+def _csv_file(tmp_path):
+    replay_file = tmp_path / "replay.csv"
+    replay_file.write_text(CSV)
+    return str(replay_file)
+
+
+def test_replay_csv_records(tmp_path):
+    backend = telemetry.create_backend("replay",
+                                       replay_file=_csv_file(tmp_path))
+    records = list(backend.records())
+    assert len(records) == 3
+    assert records[0] == (100.0, 0.0, 40.0, 250.5, 1024.0, 81920.0, 90.0)
+    assert math.isnan(records[1][telemetry.FIELDS.index("power")])
+
+
+def test_replay_round_trips_through_recorder(tmp_path):
+    telemetry_file = str(tmp_path / "nvidia_telemetry.bin")
+    recorder = telemetry.TelemetryRecorder(
+        telemetry.ReplayBackend(_csv_file(tmp_path)), telemetry_file,
+        ring_records=2)
+    recorder.run()
+    replayed = list(telemetry.ReplayBackend(telemetry_file).records())
+    original = list(telemetry.ReplayBackend(_csv_file(tmp_path)).records())
+    assert len(replayed) == len(original)
+    for new, old in zip(replayed, original):
+        assert all(a == b or (math.isnan(a) and math.isnan(b))
+                   for a, b in zip(new, old))
+
+    result = telemetry.analysis_result(telemetry_file, 2)
+    assert result["mem"] == {0: [1024.0, 1536.0], 1: [2048.0]}
+    assert result["power"][1] == []
+    assert result["max_mem"] == 81920.0
+
+
+def test_replay_realtime_and_close(tmp_path):
+    backend = telemetry.ReplayBackend(_csv_file(tmp_path), realtime=True)
+    start = time.time()
+    records = list(backend.records())
+    assert len(records) == 3
+    assert time.time() - start >= 0.45
+
+    backend = telemetry.ReplayBackend(_csv_file(tmp_path))
+    records = backend.records()
+    next(records)
+    backend.close()
+    assert list(records) == []
+
+
+def test_nvidia_smi_devices_share_sample_timestamp(tmp_path, monkeypatch):
+    fake = tmp_path / "nvidia-smi"
+    fake.write_text(FAKE_NVIDIA_SMI.format(python=sys.executable))
+    os.chmod(str(fake), os.stat(str(fake)).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(tmp_path) + os.pathsep + os.environ["PATH"])
+    records = list(telemetry.NvidiaSmiBackend().records())
+    assert [record[1] for record in records] == [0, 1] * 3
+    timestamps = [record[0] for record in records]
+    assert timestamps[0::2] == timestamps[1::2]
+    assert len(set(timestamps)) == 3
+
+
+def test_text_log_appended_at_each_flush(tmp_path):
+    telemetry_file = str(tmp_path / "nvidia_telemetry.bin")
+    gpu_log = str(tmp_path / "nvidia_monitor.log")
+    state = {"timestamp": None, "flushes": 0}
+
+    def on_flush(records):
+        state["flushes"] += 1
+        state["timestamp"] = nvidia_monitor.append_text_log(
+            gpu_log, records, state["timestamp"])
+
+    recorder = telemetry.TelemetryRecorder(
+        telemetry.ReplayBackend(_csv_file(tmp_path)), telemetry_file,
+        ring_records=1, on_flush=on_flush)
+    recorder.run()
+    assert state["flushes"] == 3
+    with open(gpu_log) as file_r:
+        lines = file_r.read().splitlines()
+    # one timestamp line per sample, then a line per device, even if the
+    # devices of a sample are flushed apart
+    assert len(lines) == 5
+    assert lines[1] == "40C 250W 1024MiB 81920MiB 90%"
+    assert lines[2] == "41C nanW 2048MiB 81920MiB 95%"
+    assert "MiB" not in lines[0] and "MiB" not in lines[3]
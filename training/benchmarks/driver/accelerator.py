@@ -0,0 +1,61 @@
+# Copyright © 2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import torch
+
+# vendor: (torch device module, whether torch.distributed.barrier works on
+# its backend). Other vendors use torch.cuda and an all_reduce as barrier.
+VENDORS = {
+    "nvidia": ("cuda", False),
+    "mthreads": ("musa", True),
+    "kunlunxin": ("xpu", True),
+}
+
+_ACCELERATORS = {}
+
+
+class Accelerator:
+    """Device operations of a vendor, bound once so that the training loop
+    neither compares vendor strings nor imports anything."""
+
+    def __init__(self, vendor):
+        self.vendor = vendor
+        self.device_type, native_barrier = VENDORS.get(vendor, ("cuda", False))
+        self.module = getattr(torch, self.device_type, None)
+        self.event = getattr(self.module, "Event", None)
+        self.memory_stats = getattr(self.module, "memory_stats", dict)
+        self.synchronize = getattr(self.module, "synchronize", _no_sync)
+        self.barrier = torch.distributed.barrier if native_barrier \
+            else self._all_reduce_barrier
+        self._dummy = None
+
+    def is_available(self):
+        """Whether the device of the vendor can be used."""
+        if self.module is None or self.event is None:
+            return False
+        is_available = getattr(self.module, "is_available", None)
+        return is_available is None or is_available()
+
+    def device(self, index=None):
+        """Return the torch.device of the device index."""
+        return torch.device(self.device_type, index)
+
+    def _all_reduce_barrier(self):
+        # Pytorch doesn't implement barrier for NCCL backend.
+        if self._dummy is None:
+            self._dummy = torch.cuda.FloatTensor(1)
+        torch.distributed.all_reduce(self._dummy)
+        torch.cuda.synchronize()
+
+
+def _no_sync():
+    pass
+
+
+def get_accelerator(vendor="nvidia"):
+    """Return the Accelerator of vendor, created on first use."""
+    accelerator = _ACCELERATORS.get(vendor)
+    if accelerator is None:
+        accelerator = _ACCELERATORS[vendor] = Accelerator(vendor)
+    return accelerator
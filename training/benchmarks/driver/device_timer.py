@@ -0,0 +1,89 @@
+# Copyright © 2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import time
+from collections import deque
+
+from .accelerator import get_accelerator
+
+
+class CpuEvent:
+    """Host clock with the interface of torch.cuda.Event, for running
+    without an accelerator."""
+
+    def __init__(self, enable_timing=True):
+        self.time_ns = None
+
+    def record(self, stream=None):
+        self.time_ns = time.perf_counter_ns()
+
+    def query(self):
+        return True
+
+    def synchronize(self):
+        pass
+
+    def elapsed_time(self, end_event):
+        """Milliseconds from this event to end_event."""
+        return (end_event.time_ns - self.time_ns) / 1e6
+
+
+def event_class_of(vendor="nvidia"):
+    """Return the device event class of vendor, CpuEvent if the device is
+    not available."""
+    accelerator = get_accelerator(vendor)
+    return accelerator.event if accelerator.is_available() else CpuEvent
+
+
+class DeviceTimer:
+    """Accumulate the device time of code regions without synchronizing.
+
+    start() and stop() only record events on the current stream of the
+    device, so they neither block the host nor involve other ranks. The
+    regions are resolved at elapsed(), e.g. at epoch end, which waits for
+    the last one. Regions already finished on the device are folded in
+    on the way, so at most max_pending pairs of events are kept.
+    """
+
+    def __init__(self, vendor="nvidia", use_cpu=False, max_pending=1024):
+        self.event_class = CpuEvent if use_cpu else event_class_of(vendor)
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.start_event = None
+        self.resolved_ms = 0.0
+
+    def start(self):
+        """Mark the start of a region."""
+        self.start_event = self.event_class(enable_timing=True)
+        self.start_event.record()
+
+    def stop(self):
+        """Mark the end of the region started last."""
+        if self.start_event is None:
+            return
+        end_event = self.event_class(enable_timing=True)
+        end_event.record()
+        self.pending.append((self.start_event, end_event))
+        self.start_event = None
+        if len(self.pending) >= self.max_pending:
+            self._resolve(block=False)
+
+    def _resolve(self, block):
+        while self.pending:
+            start_event, end_event = self.pending[0]
+            if block:
+                end_event.synchronize()
+            elif not end_event.query():
+                break
+            self.resolved_ms += start_event.elapsed_time(end_event)
+            self.pending.popleft()
+
+    def elapsed(self, reset=True):
+        """Return the seconds of all the regions stopped so far, waiting for
+        them to finish on the device. The total restarts if reset."""
+        self._resolve(block=True)
+        seconds = self.resolved_ms / 1000.0
+        if reset:
+            self.resolved_ms = 0.0
+        return seconds
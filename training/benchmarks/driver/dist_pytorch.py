@@ -23,6 +23,8 @@ from contextlib import contextmanager
 import torch
 from torch.nn.parallel.distributed import DistributedDataParallel as DDP
 
+from .accelerator import get_accelerator
+
 
 def generate_seeds(rng, size):
     """
@@ -147,13 +149,7 @@ def barrier(vendor="nvidia"):
     Calls all_reduce on dummy tensor and synchronizes with GPU.
     """
     if torch.distributed.is_available() and torch.distributed.is_initialized():
-        if vendor == "kunlunxin":
-            torch.distributed.barrier()
-        elif vendor == "mthreads":
-            torch.distributed.barrier()
-        else:
-            torch.distributed.all_reduce(torch.cuda.FloatTensor(1))
-            torch.cuda.synchronize()
+        get_accelerator(vendor).barrier()
 
 
 def init_dist_training_env(config):
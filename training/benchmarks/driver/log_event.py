@@ -4,6 +4,7 @@
 
 from .event import Event, EventManager
 from .perf_logger import PerfLogger, LogLevel
+from .step_recorder import StepRecorder
 
 STACKLEVEL = 4
 
@@ -20,6 +21,7 @@ class LogEventManager(EventManager):
         level = LogLevel.INFO if log_freq > 0 else LogLevel.SUBMITTION
         self.logger = logger or PerfLogger.get_default_logger(rank=local_rank,
                                                               level=level)
+        self.step_recorder = StepRecorder.from_env()
 
     def on_launch_training(self):
         """on launch_training"""
@@ -54,6 +56,8 @@ class LogEventManager(EventManager):
 
     def on_train_end(self):
         """on train_end"""
+        if self.step_recorder is not None:
+            self.step_recorder.flush()
         self._log_event(Event.TRAIN_END)
 
     def on_epoch_begin(self, epoch: int):
@@ -63,17 +67,23 @@ class LogEventManager(EventManager):
 
     def on_epoch_end(self, epoch: int):
         """on epoch_end"""
+        if self.step_recorder is not None:
+            self.step_recorder.flush()
         epoch_info = dict(epoch=epoch)
         self._log_event(Event.EPOCH_END, epoch_info)
 
     def on_step_begin(self, step: int = None):
         """on step_begin"""
+        if self.step_recorder is not None:
+            self.step_recorder.begin()
         if (self.log_freq <= 0 or step % self.log_freq != 0) and step != 1:
             return
         self._log_event(Event.STEP_BEGIN, step=step)
 
     def on_step_end(self, step: int = None, loss=None, message=None):
         """step_end event"""
+        if self.step_recorder is not None:
+            self.step_recorder.end(step, loss, message)
         if (self.log_freq <= 0 or step % self.log_freq != 0) and step != 1:
             return
         self._log_event(Event.STEP_END, message=message)
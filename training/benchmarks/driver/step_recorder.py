@@ -0,0 +1,157 @@
+# Copyright © 2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+
+import os
+import time
+import atexit
+
+import numpy as np
+
+# Set by the launcher to the .npy file of the rank, e.g.
+# <task log dir>/rank0.steps.npy. Steps are not recorded if it's not set.
+STEP_RECORD_ENV = "FLAGPERF_STEP_RECORD"
+
+STEP_DTYPE = np.dtype([("step", "<i8"), ("t_start_ns", "<i8"),
+                       ("t_end_ns", "<i8"), ("samples", "<i8"),
+                       ("tokens", "<i8"), ("loss", "<f8")])
+
+# Cumulative counters in the STEP_END message, per-step counts are their
+# differences.
+SAMPLES_KEYS = ("num_trained_samples", "trained_samples")
+TOKENS_KEYS = ("num_trained_tokens", "trained_tokens")
+
+
+def _counter(message, keys):
+    if not isinstance(message, dict):
+        return None
+    for key in keys:
+        value = message.get(key)
+        if isinstance(value, (int, float)):
+            return int(value)
+    return None
+
+
+class StepRecorder:
+    """Record one fixed-width record per training step into a preallocated
+    array, and save the records as a .npy file at epoch end and exit.
+    Losses that are device tensors are kept as they are and converted at
+    flush, so recording a step never synchronizes the device. Unknown
+    start times/samples/tokens are -1, unknown losses NaN."""
+
+    def __init__(self, record_file, capacity=65536):
+        self.record_file = record_file
+        self.records = np.zeros(capacity, dtype=STEP_DTYPE)
+        self.count = 0
+        self.pending_losses = []
+        self.step_start_ns = None
+        self.last_end_ns = None
+        self.last_samples = 0
+        self.last_tokens = 0
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls):
+        """Return a recorder of the file set by the launcher, None if it's
+        not set."""
+        record_file = os.environ.get(STEP_RECORD_ENV)
+        if not record_file:
+            return None
+        return cls(record_file)
+
+    def begin(self):
+        """Mark the start of a step."""
+        self.step_start_ns = time.time_ns()
+
+    def end(self, step, loss=None, message=None):
+        """Append the record of a step. A step without begin() starts where
+        the last one ended, the start of the first one is unknown."""
+        end_ns = time.time_ns()
+        if self.count == len(self.records):
+            self.records = np.resize(self.records, 2 * len(self.records))
+        start_ns = self.step_start_ns or self.last_end_ns or -1
+        samples = _counter(message, SAMPLES_KEYS)
+        tokens = _counter(message, TOKENS_KEYS)
+        record = self.records[self.count]
+        record["step"] = -1 if step is None else step
+        record["t_start_ns"] = start_ns
+        record["t_end_ns"] = end_ns
+        record["samples"] = -1 if samples is None else \
+            samples - self.last_samples
+        record["tokens"] = -1 if tokens is None else \
+            tokens - self.last_tokens
+        if loss is None:
+            record["loss"] = np.nan
+        elif isinstance(loss, (int, float)):
+            record["loss"] = loss
+        else:
+            detach = getattr(loss, "detach", None)
+            self.pending_losses.append(
+                (self.count, detach() if detach else loss))
+        self.last_samples = samples if samples is not None \
+            else self.last_samples
+        self.last_tokens = tokens if tokens is not None else self.last_tokens
+        self.step_start_ns = None
+        self.last_end_ns = end_ns
+        self.count += 1
+
+    def flush(self):
+        """Save all the records as the .npy file."""
+        if self.count == 0:
+            return
+        for index, loss in self.pending_losses:
+            try:
+                self.records[index]["loss"] = float(loss)
+            except (TypeError, ValueError, RuntimeError):
+                # RuntimeError if the device runtime is shut down before
+                # the flush at exit.
+                self.records[index]["loss"] = np.nan
+        self.pending_losses = []
+        tmp_file = self.record_file + ".tmp.npy"
+        np.save(tmp_file, self.records[:self.count])
+        os.replace(tmp_file, self.record_file)
+
+
+def load_steps(record_file):
+    """Return the step records saved by StepRecorder."""
+    return np.load(record_file)
+
+
+def step_time_stats(records, warmup_steps=None):
+    """Return step time statistics in ms of records: count, mean, p50, p90,
+    p99, max and jitter(std). Steps whose start is unknown are left out, and
+    then the steps before warmup_steps, by default the steps before the
+    step time settles(see warmup_steps_of)."""
+    records = records[records["t_start_ns"] >= 0]
+    if warmup_steps is None:
+        warmup_steps = warmup_steps_of(records)
+    times = (records["t_end_ns"] - records["t_start_ns"])[warmup_steps:] / 1e6
+    if len(times) == 0:
+        return {"count": 0, "warmup_steps": warmup_steps}
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {
+        "count": len(times),
+        "warmup_steps": warmup_steps,
+        "mean": float(times.mean()),
+        "p50": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "max": float(times.max()),
+        "jitter": float(times.std())
+    }
+
+
+def warmup_steps_of(records, window=10, tolerance=0.1):
+    """Return how many leading steps are warmup: the first step from which
+    the median of the next window steps is within tolerance of the median
+    of all the later steps. Steps whose start is unknown are left out."""
+    records = records[records["t_start_ns"] >= 0]
+    times = records["t_end_ns"] - records["t_start_ns"]
+    if len(times) < 2 * window:
+        return 0
+    steady = np.median(times[len(times) // 2:])
+    for start in range(0, len(times) - window):
+        if abs(np.median(times[start:start + window]) - steady) <= \
+                tolerance * steady:
+            return start
+    return 0
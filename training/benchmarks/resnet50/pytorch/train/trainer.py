@@ -20,6 +20,7 @@ from train.training_state import TrainingState
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../../")))
 from driver import Driver, Event, dist_pytorch
+from driver.device_timer import DeviceTimer
 
 
 class Trainer:
@@ -33,6 +34,7 @@ class Trainer:
         self.device = device
         self.config = config
         self.evaluator = evaluator
+        self.compute_timer = DeviceTimer(config.vendor)
 
     def init(self):
         torch.set_num_threads(1)
@@ -78,8 +80,7 @@ class Trainer:
 
             batch = self.process_batch(batch, device)
 
-            dist_pytorch.barrier(self.config.vendor)
-            pure_start_time = time.time()
+            self.compute_timer.start()
             optimizer.zero_grad()
 
             loss = self.adapter.train_step(model, batch, optimizer, scaler)
@@ -88,12 +89,16 @@ class Trainer:
                 print("Train Step " + str(step) + "/" + str(len(data_loader)) +
                       ", Loss : " + str(float(loss)))
 
-            dist_pytorch.barrier(self.config.vendor)
-            self.training_state.purecomputetime += time.time(
-            ) - pure_start_time
+            self.compute_timer.stop()
 
+        # Device time of this rank only, resolved once per epoch.
+        epoch_compute_time = self.compute_timer.elapsed()
+        self.training_state.purecomputetime += epoch_compute_time
         self.lr_scheduler.step()
         self.training_state.noevaltime += time.time() - noeval_start_time
+        print("Rank " + str(dist_pytorch.get_rank()) +
+              " pure compute time of epoch " + str(epoch + 1) + ": " +
+              str(epoch_compute_time))
 
         acc1 = self.evaluate(self.model, eval_dataloader, device=self.device)
 
@@ -16,6 +16,7 @@ from train.training_state import TrainingState
 from dataloaders.dataloader import get_coco_api_from_dataset
 import utils.utils
 from driver import Driver, dist_pytorch
+from driver.device_timer import DeviceTimer
 
 
 class Trainer:
@@ -29,6 +30,7 @@ class Trainer:
         self.device = device
         self.config = config
         self.evaluator = evaluator
+        self.compute_timer = DeviceTimer(config.vendor)
 
     def init(self):
         torch.set_num_threads(1)
@@ -80,7 +82,7 @@ class Trainer:
                 for k, v in t.items()
             } for t in targets]
 
-            pure_compute_start_time = time.time()
+            self.compute_timer.start()
             loss_dict = model(images, targets)
 
             losses = sum(loss for loss in loss_dict.values())
@@ -104,9 +106,14 @@ class Trainer:
             metric_logger.update(loss=losses_reduced, **loss_dict_reduced)
             metric_logger.update(lr=optimizer.param_groups[0]["lr"])
 
-            self.training_state.pure_compute_time += time.time(
-            ) - pure_compute_start_time
+            self.compute_timer.stop()
 
+        # Device time of this rank only, resolved once per epoch.
+        epoch_compute_time = self.compute_timer.elapsed()
+        self.training_state.pure_compute_time += epoch_compute_time
+        print("Rank " + str(dist_pytorch.get_rank()) +
+              " pure compute time of epoch " + str(epoch) + ": " +
+              str(epoch_compute_time))
         self.lr_scheduler.step()
         state.num_trained_samples += len(data_loader.dataset)
         self.training_state.no_eval_time += time.time() - noeval_start_time
@@ -11,3 +11,11 @@ MASTER_PORT = "29501"
 
 # ssh connection port
 SSH_PORT = "22"
+
+# Max count of hosts that a cluster command runs on at the same time.
+# Set to 1 to run commands on hosts one by one.
+SSH_FANOUT = 16
+
+# Reuse one persistent ssh connection(ControlMaster) per host for the
+# whole run instead of a new ssh handshake per command.
+SSH_MULTIPLEX = True
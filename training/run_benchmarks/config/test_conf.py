@@ -39,23 +39,72 @@ ACCE_VISIBLE_DEVICE_ENV_NAME = "CUDA_VISIBLE_DEVICES"
 
 # Set pip source, which will be used in preparing envs in container
 PIP_SOURCE = "https://pypi.tuna.tsinghua.edu.cn/simple"
+# Wheel cache dir on the hosts, mounted at the same path in containers.
+# Disabled by default: requirements are installed from PIP_SOURCE.
+# To enable it, set a dir on the hosts, e.g. "/home/FlagPerf/wheel_cache".
+# Requirements and extensions of a case are then built into wheels once
+# per image and requirements content, later installs run offline from it.
+# Fill it on a host with network access for air-gapped clusters.
+WHEEL_CACHE_DIR = None
 
 # The path that flagperf deploy in the cluster.
 # Users must set FLAGPERF_PATH to where flagperf deploy
 # You can assume the preset "/home/FlagPerf/training" points to Null
 FLAGPERF_PATH = "/home/FlagPerf/training"
 
+# Send files of FLAGPERF_PATH that differ from the master's(by content hash)
+# to the other hosts before running. Hosts whose FLAGPERF_PATH still differs
+# from the master's stop the run either way.
+SYNC_DEPLOY_PATH = True
+
 # Set log path on the host here.
 FLAGPERF_LOG_PATH = FLAGPERF_PATH + "/result/"
 
+# Sqlite result store that the results of every run are added to, see
+# utils/results_db.py for querying and comparing runs. None to disable.
+RESULTS_DB = None
+
 # Set log level. It should be 'debug', 'info', 'warning', or 'error'.
 FLAGPERF_LOG_LEVEL = 'debug'
 
 # System config
 # Share memory size
 SHM_SIZE = "32G"
+# Compressor of the docker image streamed from the first host to the
+# others, "zstd" or "gzip" if zstd isn't installed on the hosts.
+IMAGE_COMPRESSOR = "zstd"
 # Clear cache config. Clean system cache before running testcase.
 CLEAR_CACHES = True
+# Keep containers alive across repeats and cases that need the same
+# container environment(image, nnodes, data dir, and the model's
+# requirements/extensions). Only processes, monitors and caches are reset
+# between rounds instead of restarting containers and reinstalling.
+WARM_CONTAINER = False
+# Run cases concurrently, packed onto disjoint accelerators of the hosts by
+# their nnodes:nproc, e.g. eight nproc=1 cases at once. Each packed case
+# gets its own container that only sees its accelerators through
+# ACCE_VISIBLE_DEVICE_ENV_NAME. Monitors and caches are left alone while
+# hosts are shared, so packed cases have no monitor logs.
+# WARM_CONTAINER is ignored when it's set.
+CONCURRENT_CASES = False
+# Accelerators of each host that cases are packed onto.
+ACCE_PER_HOST = 8
+# Cases that need their hosts for themselves, e.g. to measure bandwidth.
+# Cases of frameworks other than pytorch are always exclusive.
+EXCLUSIVE_CASES = []
+
+# Statistics of the repeated rounds of a case: confidence of the interval
+# of the mean, and the coefficient of variation above which a metric is
+# flagged unstable.
+REPEAT_CONFIDENCE = 0.95
+REPEAT_CV_THRESHOLD = 0.05
+# Keep repeating a case after its repeat count until the confidence
+# interval of AUTO_REPEAT_METRIC is within AUTO_REPEAT_CI of its mean,
+# AUTO_REPEAT_MAX rounds at most.
+AUTO_REPEAT = False
+AUTO_REPEAT_METRIC = "throughput(ips)_raw"
+AUTO_REPEAT_CI = 0.02
+AUTO_REPEAT_MAX = 10
 
 # Set the case dict you want to run here.
 '''
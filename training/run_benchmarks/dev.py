@@ -601,7 +601,9 @@ def main(stdout, nullout):
     CLUSTER_MGR.init(cc.HOSTS,
                      cc.SSH_PORT,
                      getpass.getuser(),
-                     logger=RUN_LOGGER)
+                     logger=RUN_LOGGER,
+                     fanout=getattr(cc, "SSH_FANOUT", 16),
+                     multiplex=getattr(cc, "SSH_MULTIPLEX", True))
     check_cluster_health()
     dp_path = _get_deploy_path()
     check_cluster_deploy_path(dp_path)
@@ -697,4 +699,5 @@ if __name__ == '__main__':
         usage()
     main(stdout, nullout)
     sys.stdout = stdout
+    CLUSTER_MGR.close_connections()
     RUN_LOGGER.stop()
@@ -4,13 +4,17 @@
 '''
 import os
 import sys
+import glob
+import json
 import shutil
+import hashlib
 from argparse import ArgumentParser
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../")))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../../")))
 from utils import run_cmd
+from utils import deploy_sync
 
 
 def parse_args():
@@ -33,11 +37,76 @@ def parse_args():
                         type=str,
                         default="https://pypi.tuna.tsinghua.edu.cn/simple",
                         help="pip source.")
+    parser.add_argument("--wheel_cache",
+                        type=str,
+                        default=None,
+                        help="Dir of the wheel cache mounted from the host.")
+    parser.add_argument("--image",
+                        type=str,
+                        default="",
+                        help="Image of the container, part of cache keys.")
     args = parser.parse_args()
     return args
 
 
-def install_requriements(vendor, model, framework, pipsource):
+def cache_key_dir(wheel_cache, kind, image, files):
+    '''Return the cache dir of wheels built for image from files. Any
+       change of the image or the content of files gives a new dir.'''
+    key = [image]
+    for file_path in files:
+        if os.path.isdir(file_path):
+            key.append(sorted(deploy_sync.build_manifest(file_path).items()))
+        elif os.path.isfile(file_path):
+            key.append(deploy_sync.file_hash(file_path))
+    digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()[0:16]
+    return os.path.join(wheel_cache, kind + "-" + digest)
+
+
+def _cache_ready(key_dir):
+    return os.path.isfile(os.path.join(key_dir, ".complete"))
+
+
+def _publish_cache(tmp_dir, key_dir):
+    '''Mark tmp_dir complete and move it to key_dir in one rename.'''
+    open(os.path.join(tmp_dir, ".complete"), "w").close()
+    try:
+        os.rename(tmp_dir, key_dir)
+    except OSError:
+        # Filled by another run at the same time, keep that one.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def install_requriements_cached(req_file, env_file, pipsource, wheel_cache,
+                                image):
+    '''Install requirements from the wheel cache without network. On a
+       cache miss, wheels are downloaded or built into the cache first.
+       Return None if the cache can't be filled, to install as before.
+    '''
+    key_dir = cache_key_dir(wheel_cache, "req", image, [req_file, env_file])
+    if not _cache_ready(key_dir):
+        tmp_dir = key_dir + ".tmp" + str(os.getpid())
+        wheel_cmd = "source " + env_file + "; pip3 wheel -r " + req_file \
+                    + " -w " + tmp_dir + " -i " + pipsource
+        print(wheel_cmd)
+        ret, outs = run_cmd.run_cmd_wait(wheel_cmd, 1200)
+        print(ret, outs[0])
+        if ret != 0:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return None
+        _publish_cache(tmp_dir, key_dir)
+    else:
+        print("Wheel cache hit: " + key_dir)
+
+    pip_install_cmd = "source " + env_file + "; pip3 install --no-index " \
+                      + "--find-links " + key_dir + " -r " + req_file
+    print(pip_install_cmd)
+    ret, outs = run_cmd.run_cmd_wait(pip_install_cmd, 1200)
+    print(ret, outs[0])
+    return ret
+
+
+def install_requriements(vendor, model, framework, pipsource,
+                         wheel_cache=None, image=""):
     '''Install required python packages in vendor's path.'''
     # framework: DL framework, may include version info. e.g. pytorch_1.13
     framework_name = framework.split("_")[0]
@@ -50,6 +119,13 @@ def install_requriements(vendor, model, framework, pipsource):
         print("requirenments file ", req_file, " doesn't exist. Do nothing.")
         return 0
 
+    if wheel_cache is not None:
+        ret = install_requriements_cached(req_file, env_file, pipsource,
+                                          wheel_cache, image)
+        if ret is not None:
+            return ret
+        print("Can't fill the wheel cache, install from pip source.")
+
     pip_install_cmd = "source " + env_file + "; pip3 install -r " + req_file \
                                 + " -i " + pipsource
     print(pip_install_cmd)
@@ -58,8 +134,10 @@ def install_requriements(vendor, model, framework, pipsource):
     return ret
 
 
-def install_extensions(vendor, model, framework):
-    '''Install vendor's extensions with setup.py script.'''
+def install_extensions(vendor, model, framework, wheel_cache=None, image=""):
+    '''Install vendor's extensions with setup.py script. With a wheel
+       cache, the extension is built as a wheel once and installed from the
+       cache afterwards.'''
     vend_path = os.path.abspath(os.path.join(CURR_PATH, "../" + vendor))
     # framework: DL framework, may include version info. e.g. pytorch_1.13
     framework_name = framework.split("_")[0]
@@ -72,10 +150,34 @@ def install_extensions(vendor, model, framework):
         print("extensioin code ", source_path, " doesn't exist. Do nothing.")
         return 0
 
+    key_dir = None
+    if wheel_cache is not None:
+        key_dir = cache_key_dir(wheel_cache, "ext", image,
+                                [source_path, env_file])
+    if key_dir is not None and _cache_ready(key_dir):
+        print("Wheel cache hit: " + key_dir)
+        return _install_wheels(key_dir)
+
     sandbox_dir = os.path.join(vend_path, 'sandbox', "extension")
     if os.path.exists(sandbox_dir):
         shutil.rmtree(sandbox_dir)
 
+    if key_dir is not None:
+        tmp_dir = key_dir + ".tmp" + str(os.getpid())
+        cmd = "source " + env_file + "; export EXTENSION_SOURCE_DIR=" \
+              + source_path + " ;" + " mkdir -p " + sandbox_dir + "; cd " \
+              + sandbox_dir + "; " + sys.executable + " " + source_path \
+              + "/setup.py bdist_wheel -d " + tmp_dir + "; ret=$?; rm -rf " \
+              + sandbox_dir + "; exit $ret"
+        print(cmd)
+        ret, outs = run_cmd.run_cmd_wait(cmd, 1200)
+        print(ret, outs[0])
+        if ret == 0 and len(glob.glob(os.path.join(tmp_dir, "*.whl"))) != 0:
+            _publish_cache(tmp_dir, key_dir)
+            return _install_wheels(key_dir)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print("Can't build extension wheel, install with setup.py.")
+
     cmd = "source " + env_file + "; export EXTENSION_SOURCE_DIR=" \
           + source_path + " ;" + " mkdir -p " + sandbox_dir + "; cd " \
           + sandbox_dir + "; " + sys.executable + " " + source_path \
@@ -86,14 +188,25 @@ def install_extensions(vendor, model, framework):
     return ret
 
 
+def _install_wheels(key_dir):
+    '''Install all the wheels in key_dir without network.'''
+    cmd = "pip3 install --no-index --no-deps --force-reinstall " \
+          + " ".join(glob.glob(os.path.join(key_dir, "*.whl")))
+    print(cmd)
+    ret, outs = run_cmd.run_cmd_wait(cmd, 1200)
+    print(ret, outs[0])
+    return ret
+
+
 def main():
     '''Main process of preparing environment.'''
     args = parse_args()
     ret = install_requriements(args.vendor, args.model, args.framework,
-                               args.pipsource)
+                               args.pipsource, args.wheel_cache, args.image)
     if ret != 0:
         sys.exit(ret)
-    ret = install_extensions(args.vendor, args.model, args.framework)
+    ret = install_extensions(args.vendor, args.model, args.framework,
+                             args.wheel_cache, args.image)
     sys.exit(ret)
 
 
@@ -5,6 +5,7 @@
 '''
 import os
 import sys
+import time
 import subprocess
 from argparse import ArgumentParser
 
@@ -57,6 +58,12 @@ def parse_args():
                         type=str,
                         default=None,
                         help="The accelerator XXX_VISIBLE_DEVICE env name.")
+    parser.add_argument("--visible_devices",
+                        type=str,
+                        default=None,
+                        help="Comma separated accelerator ids of the task, "
+                        "for cases packed on the same host. Default: "
+                        "0..nproc-1")
     parser.add_argument("--case_name",
                         type=str,
                         required=True,
@@ -118,6 +125,8 @@ def _set_common_ddp_envs(task_args):
     # set GPU/MLU device env, TODO other vendor's device
     if task_args.visible_dev_env is not None:
         acce_visible = range(0, task_args.nproc)
+        if task_args.visible_devices is not None:
+            acce_visible = task_args.visible_devices.split(",")
         current_env[task_args.visible_dev_env] = ",".join(
             str(_id) for _id in acce_visible)
     return current_env
@@ -154,8 +163,37 @@ def main():
     task_args.framework = "pytorch"
 
     task_log_dir = helper.init_flagperf_logger(START_LOGGER, task_args)
-    helper.write_pid_file(task_args.log_dir, "start_pytorch_task.pid")
+    task_file = "start_pytorch_task" + helper.task_file_suffix(task_args)
+    helper.write_pid_file(task_args.log_dir, task_file + ".pid")
+    start_time = time.time()
+    helper.write_status_file(task_args.log_dir,
+                             task_file + ".status",
+                             "running",
+                             start_time=start_time)
+    proc = None
+    try:
+        proc = _run_train_processes(task_args, task_log_dir)
+    finally:
+        returncode = 1 if proc is None else proc.returncode
+        end_time = time.time()
+        helper.write_status_file(task_args.log_dir,
+                                 task_file + ".status",
+                                 "finished",
+                                 start_time=start_time,
+                                 end_time=end_time,
+                                 returncode=returncode)
+        START_LOGGER.info("Task finished in " +
+                          str(round(end_time - start_time, 2)) + " seconds.")
+        START_LOGGER.stop()
+    # check the return code of each process
+    if proc.returncode != 0:
+        raise Exception("Exception! process {0} returncode != 0, please check relevant issue".format(str(proc.pid)))
+
 
+def _run_train_processes(task_args, task_log_dir):
+    '''Start all the training processes in container, wait for them and
+       return the last one.
+    '''
     # Check and get train script & its basic args.
     basic_train_script_args = _get_basic_train_script_args(task_args)
     if basic_train_script_args is None:
@@ -175,6 +213,9 @@ def main():
         dist_rank = task_args.nproc * task_args.node_rank + local_rank
         current_env["RANK"] = str(dist_rank)
         current_env["LOCAL_RANK"] = str(local_rank)
+        # Per-step records of the driver, see driver/step_recorder.py
+        current_env["FLAGPERF_STEP_RECORD"] = task_log_dir + "/rank" \
+            + str(dist_rank) + ".steps.npy"
 
         start_cmd = sys.executable + " -u " + train_script_path + " " \
                                    + basic_train_script_args + " 2>&1 | tee " \
@@ -192,11 +233,7 @@ def main():
 
     for proc in processes:
         proc.wait()
-
-    START_LOGGER.stop()
-    # check the return code of each process
-    if proc.returncode != 0:
-        raise Exception("Exception! process {0} returncode != 0, please check relevant issue".format(str(proc.pid)))
+    return proc
 
 
 if __name__ == '__main__':
@@ -8,6 +8,8 @@
 import os
 import sys
 import time
+import json
+import hashlib
 import getpass
 from argparse import ArgumentParser
 from config import cluster_conf as cc
@@ -16,13 +18,28 @@ from config import test_conf as tc
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../")))
 sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../../")))
+from utils import case_scheduler
 from utils import cluster_manager
+from utils import deploy_sync
 from utils import flagperf_logger
 from utils import image_manager
+from utils import phase_analyzer
+from utils import repeat_stats
+from utils import results_db
+from utils import run_journal
+from utils import task_status
 
 VERSION = "v0.1"
+# Max seconds that a host blocks on the task status in one ssh command.
+WAIT_ROUND_TIMEOUT = 600
+# Frameworks whose launcher takes --visible_devices, so that their cases can
+# be packed onto part of the accelerators of a host.
+PACKABLE_FRAMEWORKS = ["pytorch"]
+# Monitors shared by concurrent cases log here, in the log dir of the run.
+CONCURRENT_MONITOR_DIR = "concurrent_monitors"
 RUN_LOGGER = flagperf_logger.FlagPerfLogger()
 CLUSTER_MGR = cluster_manager.ClusterManager()
+RUN_JOURNAL = run_journal.RunJournal()
 
 
 def usage():
@@ -31,6 +48,7 @@ def usage():
     print("Edit config file test_conf.py & cluster_conf.py in "
           "training/run_benchmarks/config and run.")
     print("Optional: --custom-docker-cmd 'your complete docker run command'")
+    print("Optional: --resume <log dir of an interrupted run>")
     sys.exit(0)
 
 
@@ -40,6 +58,11 @@ def parse_args():
     parser.add_argument('--custom-docker-cmd',
                        type=str,
                        help='Complete docker run command to use instead of default assembly')
+    parser.add_argument('--resume',
+                        type=str,
+                        default=None,
+                        help='Log dir of an interrupted run. Rerun the rounds '
+                        'that did not finish in it and skip the others')
     return parser.parse_args()
 
 
@@ -70,7 +93,8 @@ def _get_deploy_path():
 
 
 def check_cluster_deploy_path(dp_path):
-    '''Make sure that flagperf is deployed on all the hosts
+    '''Make sure that flagperf is deployed on all the hosts, and is the same
+       as the master's.
     '''
     RUN_LOGGER.debug("Check flagperf deployment path: " + dp_path)
     bad_hosts = CLUSTER_MGR.run_command_all_hosts("cd " + dp_path)
@@ -83,6 +107,32 @@ def check_cluster_deploy_path(dp_path):
     RUN_LOGGER.info("Check flagperf deployment path: " + dp_path +
                     "...[SUCCESS]")
 
+    host_count = CLUSTER_MGR.get_hosts_count()
+    sync = getattr(tc, "SYNC_DEPLOY_PATH", True)
+    if sync:
+        RUN_LOGGER.debug("Sync changed files of deployment path: " + dp_path)
+        bad_hosts = CLUSTER_MGR.sync_dir_to_some_hosts(dp_path, host_count)
+        if len(bad_hosts) != 0:
+            RUN_LOGGER.error("Hosts that sync deployment path failed: " +
+                             ",".join(bad_hosts.keys()))
+    bad_hosts_files = CLUSTER_MGR.check_dir_some_hosts(dp_path, host_count)
+    if len(bad_hosts_files) != 0 and sync:
+        # Files may change on a host between the sync and the check, sync
+        # once more before giving up. Only the differing files are sent.
+        RUN_LOGGER.warning("Resync deployment path to hosts that differ: " +
+                           ",".join(bad_hosts_files.keys()))
+        CLUSTER_MGR.sync_dir_to_some_hosts(dp_path, host_count)
+        bad_hosts_files = CLUSTER_MGR.check_dir_some_hosts(dp_path, host_count)
+    if len(bad_hosts_files) != 0:
+        for bad_host, files in bad_hosts_files.items():
+            RUN_LOGGER.error("Deployment path on " + bad_host +
+                             " differs from master: " + ",".join(files[0:20]) +
+                             (" ..." if len(files) > 20 else ""))
+        RUN_LOGGER.error("Check deployment path consistency......"
+                         "[FAILED] [EXIT]")
+        sys.exit(3)
+    RUN_LOGGER.info("Check deployment path consistency......[SUCCESS]")
+
 
 def check_testconf():
     ''' Check test config.
@@ -142,7 +192,9 @@ def check_case_config(case, case_config, vendor):
 
 
 def prepare_docker_image_cluster(dp_path, image_mgr, framework, nnodes):
-    '''Prepare docker image in registry and in the cluster.
+    '''Prepare docker image in the cluster. The image is built on the first
+       host if it doesn't have it, and streamed to the other hosts that
+       don't have it.
     '''
     vendor = tc.VENDOR
     image_vendor_dir = os.path.join(
@@ -155,18 +207,35 @@ def prepare_docker_image_cluster(dp_path, image_mgr, framework, nnodes):
                         + image_mgr.repository + " -t " + image_mgr.tag \
                         + " -d " + image_vendor_dir + " -f " + framework
     timeout = 1200
-    RUN_LOGGER.debug("Run cmd in the cluster to prepare docker image: " +
-                     prepare_image_cmd + " timeout=" + str(timeout))
-    bad_hosts = CLUSTER_MGR.run_command_some_hosts(prepare_image_cmd, nnodes,
-                                                   timeout)
+    exist_cmd = "cd " + dp_path + " && " + sys.executable \
+                + " ../utils/image_manager.py -o exist -i " \
+                + image_mgr.repository + " -t " + image_mgr.tag
+    missing_hosts = CLUSTER_MGR.run_command_some_hosts(exist_cmd, nnodes, 60)
+    first_host = CLUSTER_MGR.get_hosts_list()[0]
+    if first_host in missing_hosts:
+        RUN_LOGGER.debug("Run cmd on " + first_host +
+                         " to build docker image: " + prepare_image_cmd +
+                         " timeout=" + str(timeout))
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(
+            prepare_image_cmd, 1, timeout)
+        if len(bad_hosts) != 0:
+            RUN_LOGGER.error("Host that can't build image: " +
+                             ",".join(bad_hosts.keys()))
+            return False
+
+    # Other hosts load the image built once on the first host.
+    other_hosts = [host for host in missing_hosts if host != first_host]
+    bad_hosts = CLUSTER_MGR.distribute_image_some_hosts(
+        image_name, other_hosts, 1800,
+        getattr(tc, "IMAGE_COMPRESSOR", "zstd"))
     if len(bad_hosts) != 0:
-        RUN_LOGGER.error("Hosts that can't pull image: " +
+        RUN_LOGGER.error("Hosts that can't load image: " +
                          ",".join(bad_hosts.keys()))
         return False
     return True
 
 
-def prepare_running_env(dp_path, container_name, case_config):
+def prepare_running_env(dp_path, container_name, case_config, image_name):
     '''Install extensions and setup env before start task in container.
     '''
     nnodes = case_config["nnodes"]
@@ -178,7 +247,12 @@ def prepare_running_env(dp_path, container_name, case_config):
                   + tc.FLAGPERF_PATH \
                   + "/run_benchmarks/prepare_in_container.py --framework " \
                   + framework + " --model " + model + " --vendor " \
-                  + tc.VENDOR + " --pipsource " + tc.PIP_SOURCE + "\""
+                  + tc.VENDOR + " --pipsource " + tc.PIP_SOURCE
+    wheel_cache = getattr(tc, "WHEEL_CACHE_DIR", None)
+    if wheel_cache:
+        prepare_cmd += " --wheel_cache " + wheel_cache + " --image " \
+                       + image_name
+    prepare_cmd += "\""
     timeout = 1800
     RUN_LOGGER.debug(
         "Run cmd in the cluster to prepare running environment: " +
@@ -328,8 +402,9 @@ def stop_monitors_in_cluster(dp_path, nnodes):
 
 
 def start_tasks_in_cluster(dp_path, container_name, case_config, base_args,
-                           count, curr_log_path):
-    '''Start tasks in cluster, and NOT wait.'''
+                           count, curr_log_path, visible_devices=None):
+    '''Start tasks in cluster, and NOT wait. visible_devices is the
+       accelerator ids of a packed case, None for all of them.'''
     nnodes = case_config["nnodes"]
     framework_sub_path = case_config["framework"]
     if "_" in framework_sub_path:
@@ -360,6 +435,9 @@ def start_tasks_in_cluster(dp_path, container_name, case_config, base_args,
     if tc.ACCE_VISIBLE_DEVICE_ENV_NAME is not None:
         start_cmd += " --visible_dev_env " \
                      + tc.ACCE_VISIBLE_DEVICE_ENV_NAME
+    if visible_devices is not None:
+        start_cmd += " --visible_devices " \
+                     + ",".join(str(device) for device in visible_devices)
     start_cmd += " \""
     
     RUN_LOGGER.debug("Run cmd in the cluster to start tasks, cmd=" + start_cmd)
@@ -368,37 +446,59 @@ def start_tasks_in_cluster(dp_path, container_name, case_config, base_args,
     if len(failed_hosts) != 0:
         RUN_LOGGER.error("Hosts that can't start tasks: " +
                          ",".join(failed_hosts.keys()))
-    
-    # Wait a moment for starting tasks.
-    time.sleep(60)
+
+
+def clear_task_status_in_cluster(dp_path, pid_file_path, nnodes):
+    '''Remove pid file and status file of the last task, so that waiting
+       for the new task won't see them.'''
+    clear_cmd = "cd " + dp_path + " && rm -f " + pid_file_path + " " \
+                + task_status.status_file_of(pid_file_path)
+    RUN_LOGGER.debug("Run cmd in the cluster to clear task status: " +
+                     clear_cmd)
+    CLUSTER_MGR.run_command_some_hosts(clear_cmd, nnodes, 30)
 
 
 def wait_for_finish(dp_path, container_name, pid_file_path, nnodes):
     '''wait all the processes of start_xxx_task.py finished.
+       Each host blocks on the status file written by start_xxx_task.py, and
+       checks the pid only as a fallback, so the end of the task is found in
+       a second. Return whether the tasks finished on all the hosts.
     '''
     check_cmd = "cd " + dp_path + "; " + sys.executable \
-                + " ../utils/container_manager.py -o pidrunning -c " \
-                + container_name + " -f " + pid_file_path
-    
-    # 设置较长的超时时间，避免训练过程中的长时间操作（如 evaluation、checkpoint 保存）导致误判进程已死
+                + " ../utils/container_manager.py -o waitfinish -c " \
+                + container_name + " -f " + pid_file_path \
+                + " -t " + str(WAIT_ROUND_TIMEOUT)
 
     RUN_LOGGER.debug(
-        "Run cmd to check whether the training tasks is running: " + check_cmd)
+        "Run cmd to wait for the training tasks finished: " + check_cmd)
+    failed_hosts = {}
     while True:
-        bad_hosts = CLUSTER_MGR.run_command_some_hosts(check_cmd,
-                                                       nnodes,
-                                                       no_log=True)
-
-        if len(bad_hosts) == nnodes:
-            RUN_LOGGER.info("All training processes have finished.")
+        # 设置较长的超时时间，避免训练过程中的长时间操作（如 evaluation、checkpoint 保存）导致误判进程已死
+        bad_hosts = CLUSTER_MGR.run_command_some_hosts(
+            check_cmd, nnodes, WAIT_ROUND_TIMEOUT + 60, no_log=True)
+        # ssh errors, bad invocations and tasks that never started
+        for host, ret in bad_hosts.items():
+            if ret != task_status.STILL_RUNNING:
+                failed_hosts[host] = ret
+        if task_status.STILL_RUNNING not in bad_hosts.values():
             break
-        time.sleep(10)
+    if len(failed_hosts) != 0:
+        RUN_LOGGER.error("Hosts that failed waiting for the tasks: " +
+                         ",".join(host + "(exit code " + str(ret) + ")"
+                                  for host, ret in failed_hosts.items()))
+        return False
+    RUN_LOGGER.info("All training processes have finished.")
+    return True
 
 
 def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
-                                   image_name, case_config, custom_docker_cmd=None):
+                                   image_name, case_config, custom_docker_cmd=None,
+                                   visible_devices=None, monitors=True):
     '''Prepare containers environments in the cluster. It will start
-       containers, setup environments, start monitors, and clear caches.'''
+       containers, setup environments, start monitors, and clear caches.
+       Containers of a case packed on visible_devices only see them, and
+       leave caches alone since the hosts are shared. Monitors are left
+       alone if they are shared by concurrent cases.'''
     nnodes = case_config["nnodes"]
     
     RUN_LOGGER.info("a) Stop old container(s) first.")
@@ -430,6 +530,12 @@ def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
                                + case_config["data_dir_container"]
         if tc.ACCE_CONTAINER_OPT is not None:
             container_start_args += " " + tc.ACCE_CONTAINER_OPT
+        if visible_devices is not None:
+            container_start_args += " -e " + tc.ACCE_VISIBLE_DEVICE_ENV_NAME \
+                + "=" + ",".join(str(device) for device in visible_devices)
+        wheel_cache = getattr(tc, "WHEEL_CACHE_DIR", None)
+        if wheel_cache:
+            container_start_args += " -v " + wheel_cache + ":" + wheel_cache
 
         if not start_container_in_cluster(dp_path, container_start_args,
                                           container_name, image_name, nnodes):
@@ -445,25 +551,80 @@ def prepare_containers_env_cluster(dp_path, case_log_dir, container_name,
         RUN_LOGGER.info("[标准容器成功] FlagPerf默认容器已启动完成")
 
     RUN_LOGGER.info("c) Prepare running environment.")
-    if not prepare_running_env(dp_path, container_name, case_config):
+    if not prepare_running_env(dp_path, container_name, case_config,
+                               image_name):
         RUN_LOGGER.error("c) Prepare running environment......"
                          "[FAILED]. Ignore this round.")
         RUN_LOGGER.info("Stop containers in cluster.")
         stop_container_in_cluster(dp_path, container_name, nnodes)
         return False
     RUN_LOGGER.info("c) Prepare running environment......[SUCCESS]")
-    RUN_LOGGER.info("d) Start monitors......")
-    start_monitors_in_cluster(dp_path, case_log_dir, nnodes)
+    if monitors:
+        RUN_LOGGER.info("d) Start monitors......")
+        start_monitors_in_cluster(dp_path, case_log_dir, nnodes)
+    else:
+        RUN_LOGGER.info("d) Monitors are shared by concurrent cases, skip.")
+    if visible_devices is not None:
+        RUN_LOGGER.info("e) Skip caches of shared hosts.")
+        return True
     RUN_LOGGER.info("e) Clear system caches if it set......")
     clear_caches_cluster(tc.CLEAR_CACHES, nnodes)
     return True
 
 
-def clean_containers_env_cluster(dp_path, container_name, nnodes):
+def container_env_key(dp_path, case_config, image_name, custom_docker_cmd):
+    '''Return a hash of everything a prepared container depends on. Rounds
+       with the same key can run in the same warm container.'''
+    framework_name = case_config["framework"].split("_")[0]
+    vend_model_path = os.path.join(dp_path, tc.VENDOR,
+                                   case_config["model"] + "-" + framework_name)
+    env_files = {}
+    for name in ["config/requirements.txt", "config/environment_variables.sh"]:
+        file_path = os.path.join(vend_model_path, name)
+        if os.path.isfile(file_path):
+            env_files[name] = deploy_sync.file_hash(file_path)
+    source_path = os.path.join(vend_model_path, "csrc")
+    if os.path.isdir(source_path):
+        for name, digest in deploy_sync.build_manifest(source_path).items():
+            env_files["csrc/" + name] = digest
+    key = [
+        image_name, case_config["framework"], case_config["nnodes"],
+        case_config["data_dir_host"], custom_docker_cmd,
+        sorted(env_files.items())
+    ]
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+
+def reset_containers_env_cluster(dp_path, case_log_dir, container_name,
+                                 case_config):
+    '''Reset a warm container for the next round. It will kill processes
+       left by the last task, start monitors, and clear caches.'''
+    nnodes = case_config["nnodes"]
+    RUN_LOGGER.info("a) Kill processes of the last task in container(s).")
+    kill_cmd = "cd " + dp_path + " && " + sys.executable \
+               + " ../utils/container_manager.py -o runcmdin -c " \
+               + container_name + " -t 60 -r \"pkill -9 -f [r]un_pretraining" \
+               + "; true\""
+    bad_hosts = CLUSTER_MGR.run_command_some_hosts(kill_cmd, nnodes, 60)
+    if len(bad_hosts) != 0:
+        RUN_LOGGER.error("Hosts whose warm container can't be reset: " +
+                         ",".join(bad_hosts.keys()))
+        return False
+    RUN_LOGGER.info("b) Start monitors......")
+    start_monitors_in_cluster(dp_path, case_log_dir, nnodes)
+    RUN_LOGGER.info("c) Clear system caches if it set......")
+    clear_caches_cluster(tc.CLEAR_CACHES, nnodes)
+    return True
+
+
+def clean_containers_env_cluster(dp_path, container_name, nnodes,
+                                 monitors=True):
     '''Clean containers environments in the cluster. It will stop containers,
        and stop monitors.'''
     RUN_LOGGER.info("a) Stop containers......")
     stop_container_in_cluster(dp_path, container_name, nnodes)
+    if not monitors:
+        return
     RUN_LOGGER.info("b) Stop monitors......")
     stop_monitors_in_cluster(dp_path, nnodes)
 
@@ -474,8 +635,12 @@ def collect_and_merge_logs(curr_log_path, cases):
     get_all = True
     RUN_LOGGER.info("Collect logs in cluster.")
     for case in cases:
+        if RUN_JOURNAL.state_of(case) == run_journal.LOGS_COLLECTED:
+            RUN_LOGGER.info("Logs of case " + case + " were collected.")
+            continue
         rets, case_config = get_config_from_case(case)
         repeat = case_config["repeat"]
+        case_collected = True
         for i in range(1, repeat + 1):
             case_log_dir = os.path.join(curr_log_path, case, "round" + str(i))
             RUN_LOGGER.debug("Case " + case + ", round " + str(i) +
@@ -491,9 +656,12 @@ def collect_and_merge_logs(curr_log_path, cases):
                                  " collect log failed on hosts: " +
                                  ",".join(failed_hosts))
                 get_all = False
+                case_collected = False
             else:
                 RUN_LOGGER.info("Case " + case + ", round " + str(i) +
                                 ", get all logs in dir: " + case_log_dir)
+        if case_collected:
+            RUN_JOURNAL.record(case, run_journal.LOGS_COLLECTED)
 
     if get_all:
         RUN_LOGGER.info("Congrats! See all logs in " + curr_log_path)
@@ -502,6 +670,165 @@ def collect_and_merge_logs(curr_log_path, cases):
                            curr_log_path)
 
 
+def shared_monitors_of(curr_log_path, case, round_num):
+    '''Return (monitor dir, devices, time window) of a case round run with
+       the monitors shared by concurrent cases, None if it had its own.'''
+    last_run = RUN_JOURNAL.last_run(case, round_num)
+    if last_run is None or "monitor_dir" not in last_run[0]:
+        return None
+    container_up, end_time = last_run
+    window = [container_up["time"],
+              float("inf") if end_time is None else end_time]
+    return (os.path.join(curr_log_path, container_up["monitor_dir"]),
+            container_up["devices"], window)
+
+
+def analysis_phases(curr_log_path, cases):
+    '''Slice monitor logs of every case round by the benchmark phases, and
+       save the summary as phase_summary.json in the round log dir.'''
+    for case in cases:
+        for case_log_dir in repeat_stats.round_dirs(
+                os.path.join(curr_log_path, case)):
+            i = os.path.basename(case_log_dir)[5:]
+            shared = shared_monitors_of(curr_log_path, case, int(i))
+            try:
+                result = phase_analyzer.write_round_summary(
+                    case_log_dir, tc.VENDOR, *(shared or ()))
+            except (OSError, ValueError) as err:
+                RUN_LOGGER.warning("Case " + case + ", round " + str(i) +
+                                   " analysis phases failed: " + str(err))
+                continue
+            if result is None:
+                RUN_LOGGER.warning("Case " + case + ", round " + str(i) +
+                                   " has no PerfLog events, skip phases.")
+                continue
+            for phase, hosts in _phases_of_hosts(result).items():
+                for host, channels in hosts.items():
+                    RUN_LOGGER.info(
+                        "Case " + case + ", round " + str(i) + ", " + host +
+                        ", phase " + phase + ": " + ", ".join(
+                            "{} avg {} max {}".format(
+                                channel, round(stats["mean"], 2),
+                                round(stats["max"], 2))
+                            for channel, stats in channels.items()
+                            if stats["mean"] is not None))
+            if "train" in result:
+                RUN_LOGGER.info("Case " + case + ", round " + str(i) +
+                                ", train phase energy: " +
+                                json.dumps(result["train"]))
+                if result["train"]["samples"] is None and \
+                        result["train"]["tokens"] is None:
+                    RUN_LOGGER.warning(
+                        "Case " + case + ", round " + str(i) +
+                        " reports no trained samples, tokens or throughput"
+                        " in FINISHED, skip energy per sample/token.")
+
+
+def analysis_repeats(curr_log_path, cases):
+    '''Aggregate the FINISHED results of the rounds of every case, save
+       them as repeat_summary.json in the case log dir, and flag unstable
+       metrics.'''
+    confidence = getattr(tc, "REPEAT_CONFIDENCE", repeat_stats.CONFIDENCE)
+    cv_threshold = getattr(tc, "REPEAT_CV_THRESHOLD",
+                           repeat_stats.CV_THRESHOLD)
+    for case in cases:
+        case_dir = os.path.join(curr_log_path, case)
+        if not os.path.isdir(case_dir):
+            continue
+        result = repeat_stats.write_case_summary(case_dir, confidence,
+                                                 cv_threshold)
+        RUN_LOGGER.info("Case " + case + ", " + str(len(result["rounds"])) +
+                        " finished rounds.")
+        for metric, stats in result["metrics"].items():
+            line = "Case " + case + ", " + metric + ": mean " + str(
+                round(stats["mean"], 4)) + ", min " + str(
+                    round(stats["min"], 4)) + ", max " + str(
+                        round(stats["max"], 4))
+            if stats["std"] is not None:
+                line += ", std " + str(round(stats["std"], 4)) \
+                        + ", cv " + str(round(stats["cv"] or 0, 4)) \
+                        + ", " + str(int(confidence * 100)) + "% ci [" \
+                        + str(round(stats["ci_low"], 4)) + ", " \
+                        + str(round(stats["ci_high"], 4)) + "]"
+            if stats["unstable"]:
+                RUN_LOGGER.warning(line + ". UNSTABLE, cv is above " +
+                                   str(cv_threshold))
+            else:
+                RUN_LOGGER.info(line)
+
+
+def max_rounds_of(case_config):
+    '''Return the most rounds that a case may run.'''
+    if getattr(tc, "AUTO_REPEAT", False):
+        return max(case_config["repeat"], getattr(tc, "AUTO_REPEAT_MAX", 10))
+    return case_config["repeat"]
+
+
+def repeat_is_enough(curr_log_path, case, case_config, count):
+    '''Return whether rounds 1..count of a case are enough. Without
+       AUTO_REPEAT it's the repeat count of the case. With it, rounds go on
+       after the repeat count until the confidence interval of
+       AUTO_REPEAT_METRIC is within AUTO_REPEAT_CI of its mean.'''
+    if count >= max_rounds_of(case_config):
+        return True
+    if not getattr(tc, "AUTO_REPEAT", False) or count < max(
+            case_config["repeat"], 2):
+        return False
+    CLUSTER_MGR.collect_files_some_hosts(curr_log_path,
+                                         curr_log_path,
+                                         case_config["nnodes"],
+                                         timeout=600)
+    metric = getattr(tc, "AUTO_REPEAT_METRIC", "throughput(ips)_raw")
+    summary = repeat_stats.case_summary(
+        os.path.join(curr_log_path, case),
+        getattr(tc, "REPEAT_CONFIDENCE", repeat_stats.CONFIDENCE))
+    stats = summary["metrics"].get(metric)
+    if stats is None:
+        RUN_LOGGER.warning("Case " + case + " has no " + metric +
+                           " in its results, stop repeating.")
+        return True
+    width = repeat_stats.ci_relative_width(stats)
+    RUN_LOGGER.info("Case " + case + " " + metric + " after " + str(count) +
+                    " rounds: mean " + str(round(stats["mean"], 4)) +
+                    ", relative ci half width " +
+                    str(None if width is None else round(width, 4)))
+    return width is not None and width <= getattr(tc, "AUTO_REPEAT_CI", 0.02)
+
+
+def case_is_done(curr_log_path, case, case_config):
+    '''Return whether a case of a resumed run needs no more rounds. The
+       rounds up to the last one in the journal must have finished, and
+       be enough by repeat_is_enough, so with AUTO_REPEAT the stopping
+       rule is evaluated again on all of them.'''
+    last_round = RUN_JOURNAL.last_round(case)
+    if last_round == 0 or not RUN_JOURNAL.case_finished(case, last_round):
+        return False
+    return repeat_is_enough(curr_log_path, case, case_config, last_round)
+
+
+def store_results(curr_log_path, db_path):
+    '''Ingest the FINISHED results of all the case rounds into the result
+       store, for comparing with other runs and vendors later.'''
+    try:
+        conn = results_db.connect(db_path)
+        count = results_db.ingest(conn, "training", curr_log_path, tc.VENDOR)
+        conn.close()
+    except Exception as err:
+        RUN_LOGGER.warning("Store results in " + db_path + " failed: " +
+                           str(err))
+        return
+    RUN_LOGGER.info("Stored " + str(count) + " result values in " + db_path)
+
+
+def _phases_of_hosts(result):
+    '''Return {phase: {host: channels}} of a phase_analyzer result.'''
+    phases = {phase: {} for phase in result["phases"]}
+    for host, host_phases in result["hosts"].items():
+        for phase, channels in host_phases.items():
+            phases[phase][host] = channels
+    return phases
+
+
 def get_config_from_case(case):
     '''check case is string'''
     if not isinstance(case, str):
@@ -606,6 +933,172 @@ def log_test_configs(cases, curr_log_path, dp_path):
     RUN_LOGGER.info("--------------------------------------------------")
 
 
+def prepare_case_cluster(dp_path, case, case_config):
+    '''Prepare docker image and case config of a case in the cluster.
+       Return (image_name, container_name), None if it failed.'''
+    image_vendor_dir = os.path.join(
+        CURR_PATH,
+        "../" + tc.VENDOR + "/docker_image/" + case_config["framework"])
+    image_mgr = image_manager.ImageManager(
+        "flagperf-" + tc.VENDOR + "-" + case_config["framework"],
+        image_manager.content_tag(image_vendor_dir, case_config["framework"],
+                                  "t_" + VERSION))
+    image_name = image_mgr.repository + ":" + image_mgr.tag
+    RUN_LOGGER.info("=== 2.1 Prepare docker image:" + image_name + " ===")
+    if not prepare_docker_image_cluster(dp_path, image_mgr,
+                                        case_config["framework"],
+                                        case_config["nnodes"]):
+        RUN_LOGGER.error("=== 2.1 Prepare docker image...[FAILED] " +
+                         "Ignore this case " + case + " ===")
+        return None
+
+    # Set command to start docker container in the cluster
+    container_name = image_mgr.repository + "-" + image_mgr.tag \
+                                          + "-container"
+    RUN_LOGGER.info("=== 2.2 Prepare case config in cluster. ===")
+    if not prepare_case_config_cluster(dp_path, case_config, case):
+        RUN_LOGGER.warning("Prepare case config in cluster...[FAILED]. " +
+                           "Ignore case " + case)
+        return None
+    return image_name, container_name
+
+
+def get_base_args(case, case_config, log_dir_container, master_port):
+    '''Return args of start_xxx_task.py to start train script in container
+       in the cluster.'''
+    return " --vendor " + tc.VENDOR + " --case_name " + case \
+           + " --model_name " + case_config["model"] \
+           + " --train_script " + "run_pretraining.py" \
+           + " --nnodes " + str(case_config["nnodes"]) \
+           + " --nproc " + str(case_config["nproc"]) \
+           + " --hosts " + ",".join(cc.HOSTS) \
+           + " --hosts_ports " + ",".join(cc.HOSTS_PORTS) \
+           + " --data_dir " + case_config["data_dir_container"] \
+           + " --log_dir " + log_dir_container \
+           + " --log_level " + tc.FLAGPERF_LOG_LEVEL \
+           + " --extern_config_file " + case_config["config"] \
+           + ".py" + " --enable_extern_config " \
+           + " --master_port " + master_port
+
+
+def run_packed_case(dp_path, curr_log_path, log_dir_container, case,
+                    case_config, image_name, container_name, devices):
+    '''Run all the rounds of a case on devices of its hosts, None for all
+       the devices. Packed cases get their own container, master port and
+       task files. Monitors of the run are shared, the devices of a round
+       are journaled to slice their telemetry.'''
+    nnodes = case_config["nnodes"]
+    suffix = case_scheduler.task_file_suffix(devices)
+    master_port = cc.MASTER_PORT
+    if devices is not None:
+        container_name += suffix
+        master_port = str(int(cc.MASTER_PORT) + 1 + devices[0])
+    base_args = get_base_args(case, case_config, log_dir_container,
+                              master_port)
+    pid_file_path = os.path.join(
+        log_dir_container, "start_" + case_config["framework"].split("_")[0] +
+        "_task" + suffix + ".pid")
+    for count in range(1, max_rounds_of(case_config) + 1):
+        if RUN_JOURNAL.round_finished(case, count):
+            RUN_LOGGER.info("Testcase " + case + " Round " + str(count) +
+                            " finished before. Skip it.")
+            continue
+        RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
+                        " starts ==-")
+        case_log_dir = os.path.join(curr_log_path, case, "round" + str(count))
+        if not prepare_containers_env_cluster(dp_path,
+                                              case_log_dir,
+                                              container_name,
+                                              image_name,
+                                              case_config,
+                                              visible_devices=devices,
+                                              monitors=False):
+            RUN_LOGGER.error("Prepare container environments in cluster..."
+                             "[FAILED]. Ignore case " + case + " round " +
+                             str(count))
+            RUN_JOURNAL.record(case, run_journal.FAILED, count)
+            continue
+        RUN_JOURNAL.record(case, run_journal.CONTAINER_UP, count,
+                           devices=devices,
+                           monitor_dir=CONCURRENT_MONITOR_DIR)
+        clear_task_status_in_cluster(dp_path, pid_file_path, nnodes)
+        task_start_time = time.time()
+        start_tasks_in_cluster(dp_path, container_name, case_config,
+                               base_args, count, curr_log_path, devices)
+        RUN_JOURNAL.record(case, run_journal.STARTED, count)
+        finished = wait_for_finish(dp_path, container_name, pid_file_path,
+                                   nnodes)
+        RUN_JOURNAL.record(case, run_journal.FINISHED if finished else
+                           run_journal.FAILED, count)
+        RUN_LOGGER.info("Testcase " + case + " Round " + str(count) +
+                        " tasks took " +
+                        str(round(time.time() - task_start_time, 2)) +
+                        " seconds.")
+        clean_containers_env_cluster(dp_path, container_name, nnodes,
+                                     monitors=False)
+        RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
+                        " finished ==-")
+        if repeat_is_enough(curr_log_path, case, case_config, count):
+            break
+
+
+def run_cases_concurrently(dp_path, cases, curr_log_path, log_dir_container):
+    '''Pack cases onto disjoint accelerators of the hosts and run them
+       concurrently, and log the makespan saved. Monitors of all the hosts
+       run once around the cases.'''
+    exclusive_cases = getattr(tc, "EXCLUSIVE_CASES", [])
+    jobs = []
+    prepared_cases = {}
+    for case in cases:
+        RUN_LOGGER.info("======= Testcase: " + case + " =======")
+        rets, case_config = get_config_from_case(case)
+        if case_is_done(curr_log_path, case, case_config):
+            RUN_LOGGER.info("All rounds of case " + case +
+                            " finished before. Skip it.")
+            continue
+        prepared = prepare_case_cluster(dp_path, case, case_config)
+        if prepared is None:
+            continue
+        RUN_JOURNAL.record(case, run_journal.IMAGE_READY)
+        prepared_cases[case] = (case_config, ) + prepared
+        framework = case_config["framework"].split("_")[0]
+        jobs.append({
+            "name": case,
+            "nnodes": case_config["nnodes"],
+            "nproc": case_config["nproc"],
+            "exclusive": case in exclusive_cases
+                         or framework not in PACKABLE_FRAMEWORKS
+        })
+
+    def _run_job(job, devices):
+        case_config, image_name, container_name = prepared_cases[job["name"]]
+        run_packed_case(dp_path, curr_log_path, log_dir_container,
+                        job["name"], case_config, image_name, container_name,
+                        devices)
+
+    RUN_LOGGER.info("=== 2.3 Run testcases concurrently. ===")
+    pool = case_scheduler.DevicePool(len(cc.HOSTS),
+                                     getattr(tc, "ACCE_PER_HOST", 8))
+    RUN_LOGGER.info("Start monitors shared by concurrent cases......")
+    start_monitors_in_cluster(
+        dp_path, os.path.join(curr_log_path, CONCURRENT_MONITOR_DIR),
+        len(cc.HOSTS))
+    try:
+        report = case_scheduler.run_concurrently(jobs, pool, _run_job,
+                                                 RUN_LOGGER)
+    finally:
+        RUN_LOGGER.info("Stop monitors shared by concurrent cases......")
+        stop_monitors_in_cluster(dp_path, len(cc.HOSTS))
+    for case, duration in report["durations"].items():
+        RUN_LOGGER.info("Testcase " + case + " took " +
+                        str(round(duration, 2)) + " seconds.")
+    RUN_LOGGER.info("Concurrent cases took " +
+                    str(round(report["makespan"], 2)) + " seconds, " +
+                    str(round(report["busy"], 2)) + " seconds one by one. " +
+                    "Saved " + str(round(report["saved"], 2)) +
+                    " seconds of makespan.")
+
+
 def main():
     '''Main process to run all the testcases'''
 
@@ -616,8 +1109,18 @@ def main():
     custom_docker_cmd = args.custom_docker_cmd
 
     # Set logger first
-    timestamp_log_dir = "run" + time.strftime("%Y%m%d%H%M%S", time.localtime())
-    curr_log_path = os.path.join(tc.FLAGPERF_LOG_PATH, timestamp_log_dir)
+    if args.resume is not None:
+        timestamp_log_dir = os.path.basename(os.path.normpath(args.resume))
+        curr_log_path = os.path.join(tc.FLAGPERF_LOG_PATH, timestamp_log_dir)
+        if not os.path.isfile(
+                os.path.join(curr_log_path, run_journal.JOURNAL_FILE)):
+            print("No run journal found in " + curr_log_path +
+                  ", can't resume it.")
+            sys.exit(1)
+    else:
+        timestamp_log_dir = "run" + time.strftime("%Y%m%d%H%M%S",
+                                                  time.localtime())
+        curr_log_path = os.path.join(tc.FLAGPERF_LOG_PATH, timestamp_log_dir)
     RUN_LOGGER.init(curr_log_path,
                     "flagperf_run.log",
                     tc.FLAGPERF_LOG_LEVEL,
@@ -636,12 +1139,19 @@ def main():
     RUN_LOGGER.info("======== Step 1: Check environment and configs. ========")
     RUN_LOGGER.info("Initialize logger with log path: " + curr_log_path +
                     "......[SUCCESS]")
+    RUN_JOURNAL.init(curr_log_path)
+    if args.resume is not None:
+        RUN_LOGGER.info("Resume run " + timestamp_log_dir + ", " +
+                        str(len(RUN_JOURNAL.entries)) +
+                        " journal entries loaded.")
 
     # Check test environment and configs of testcases.
     CLUSTER_MGR.init(cc.HOSTS,
                      cc.SSH_PORT,
                      getpass.getuser(),
-                     logger=RUN_LOGGER)
+                     logger=RUN_LOGGER,
+                     fanout=getattr(cc, "SSH_FANOUT", 16),
+                     multiplex=getattr(cc, "SSH_MULTIPLEX", True))
     check_cluster_health()
     dp_path = _get_deploy_path()
     check_cluster_deploy_path(dp_path)
@@ -650,82 +1160,147 @@ def main():
     log_test_configs(cases, curr_log_path, dp_path)
 
     RUN_LOGGER.info("========= Step 2: Prepare and Run test cases. =========")
-
-    for case in cases:
+    log_dir_container = os.path.join(tc.FLAGPERF_LOG_PATH, timestamp_log_dir)
+    concurrent = getattr(tc, "CONCURRENT_CASES", False)
+    if concurrent and custom_docker_cmd is not None:
+        RUN_LOGGER.warning("Custom docker command can't limit the devices "
+                           "of a container. Run cases one by one.")
+        concurrent = False
+    if concurrent and tc.ACCE_VISIBLE_DEVICE_ENV_NAME is None:
+        RUN_LOGGER.warning("ACCE_VISIBLE_DEVICE_ENV_NAME is not set. Run "
+                           "cases one by one.")
+        concurrent = False
+    if concurrent:
+        run_cases_concurrently(dp_path, cases, curr_log_path,
+                               log_dir_container)
+    sequential_cases = [] if concurrent else cases
+    warm = getattr(tc, "WARM_CONTAINER", False) and not concurrent
+    warm_container = {"key": None, "name": None, "nnodes": 0, "setup_time": 0}
+    setup_time_saved = 0.0
+
+    for case in sequential_cases:
         RUN_LOGGER.info("======= Testcase: " + case + " =======")
         rets, case_config = get_config_from_case(case)
-
-        # Prepare docker image.
-        image_mgr = image_manager.ImageManager(
-            "flagperf-" + tc.VENDOR + "-" + case_config["framework"],
-            "t_" + VERSION)
-        image_name = image_mgr.repository + ":" + image_mgr.tag
-        nnodes = case_config["nnodes"]
-        RUN_LOGGER.info("=== 2.1 Prepare docker image:" + image_name + " ===")
-        if not prepare_docker_image_cluster(dp_path, image_mgr,
-                                            case_config["framework"], nnodes):
-            RUN_LOGGER.error("=== 2.1 Prepare docker image...[FAILED] " +
-                             "Ignore this case " + case + " ===")
+        if case_is_done(curr_log_path, case, case_config):
+            RUN_LOGGER.info("All rounds of case " + case +
+                            " finished before. Skip it.")
             continue
 
-        # Set command to start docker container in the cluster
-        container_name = image_mgr.repository + "-" + image_mgr.tag \
-                                              + "-container"
-
-        # Set command to start train script in container in the cluster
-        log_dir_container = os.path.join(tc.FLAGPERF_LOG_PATH,
-                                         timestamp_log_dir)
-        base_args = " --vendor " + tc.VENDOR + " --case_name " + case \
-                    + " --model_name " + case_config["model"] \
-                    + " --train_script " + "run_pretraining.py" \
-                    + " --nnodes " + str(nnodes) \
-                    + " --nproc " + str(case_config["nproc"]) \
-                    + " --hosts " + ",".join(cc.HOSTS) \
-                    + " --hosts_ports " + ",".join(cc.HOSTS_PORTS) \
-                    + " --data_dir " + case_config["data_dir_container"] \
-                    + " --log_dir " + log_dir_container \
-                    + " --log_level " + tc.FLAGPERF_LOG_LEVEL \
-                    + " --extern_config_file " + case_config["config"] \
-                    + ".py" + " --enable_extern_config " \
-                    + " --master_port " + cc.MASTER_PORT
-        RUN_LOGGER.info("=== 2.2 Prepare case config in cluster. ===")
-        if not prepare_case_config_cluster(dp_path, case_config, case):
-            RUN_LOGGER.warning("Prepare case config in cluster...[FAILED]. " +
-                               "Ignore case " + case)
+        prepared = prepare_case_cluster(dp_path, case, case_config)
+        if prepared is None:
             continue
+        RUN_JOURNAL.record(case, run_journal.IMAGE_READY)
+        image_name, container_name = prepared
+        nnodes = case_config["nnodes"]
+        base_args = get_base_args(case, case_config, log_dir_container,
+                                  cc.MASTER_PORT)
         RUN_LOGGER.info("=== 2.3 Setup container and run testcases. ===")
-        for count in range(1, case_config["repeat"] + 1):
+        env_key = container_env_key(dp_path, case_config, image_name,
+                                    custom_docker_cmd) if warm else None
+        for count in range(1, max_rounds_of(case_config) + 1):
+            if RUN_JOURNAL.round_finished(case, count):
+                RUN_LOGGER.info("Testcase " + case + " Round " + str(count) +
+                                " finished before. Skip it.")
+                continue
             RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
                             " starts ==-")
-            RUN_LOGGER.info("1) Prepare container environments in cluster...")
             case_log_dir = os.path.join(curr_log_path, case,
                                         "round" + str(count))
-            if not prepare_containers_env_cluster(dp_path, case_log_dir,
-                                                  container_name, image_name,
-                                                  case_config, custom_docker_cmd):
-                RUN_LOGGER.error("1) Prepare container environments in cluster"
-                                 "...[FAILED]. Ignore case " + case +
-                                 " round " + str(count))
-                continue
+            if warm and warm_container["key"] == env_key:
+                RUN_LOGGER.info("1) Reset warm container environments in "
+                                "cluster...")
+                reset_start_time = time.time()
+                if reset_containers_env_cluster(dp_path, case_log_dir,
+                                                container_name, case_config):
+                    saved = warm_container["setup_time"] - (time.time() -
+                                                            reset_start_time)
+                    setup_time_saved += max(saved, 0)
+                    RUN_LOGGER.info("Reuse warm container " + container_name +
+                                    ", saved " + str(round(saved, 2)) +
+                                    " seconds of setup.")
+                else:
+                    stop_container_in_cluster(dp_path, container_name,
+                                              warm_container["nnodes"])
+                    warm_container["key"] = None
+                    RUN_JOURNAL.record(case, run_journal.FAILED, count)
+                    continue
+            else:
+                if warm_container["key"] is not None:
+                    RUN_LOGGER.info("Stop warm container " +
+                                    warm_container["name"] +
+                                    " that isn't compatible with " + case)
+                    stop_container_in_cluster(dp_path, warm_container["name"],
+                                              warm_container["nnodes"])
+                    warm_container["key"] = None
+                RUN_LOGGER.info("1) Prepare container environments in "
+                                "cluster...")
+                setup_start_time = time.time()
+                if not prepare_containers_env_cluster(
+                        dp_path, case_log_dir, container_name, image_name,
+                        case_config, custom_docker_cmd):
+                    RUN_LOGGER.error("1) Prepare container environments in "
+                                     "cluster...[FAILED]. Ignore case " +
+                                     case + " round " + str(count))
+                    RUN_JOURNAL.record(case, run_journal.FAILED, count)
+                    continue
+                if warm:
+                    warm_container.update(key=env_key,
+                                          name=container_name,
+                                          nnodes=nnodes,
+                                          setup_time=time.time() -
+                                          setup_start_time)
+            RUN_JOURNAL.record(case, run_journal.CONTAINER_UP, count)
             RUN_LOGGER.info("2) Start tasks in the cluster...")
+            pid_file_path = os.path.join(
+                log_dir_container, "start_" +
+                case_config["framework"].split("_")[0] + "_task.pid")
+            clear_task_status_in_cluster(dp_path, pid_file_path, nnodes)
+            task_start_time = time.time()
             start_tasks_in_cluster(dp_path, container_name, case_config,
                                    base_args, count, curr_log_path)
+            RUN_JOURNAL.record(case, run_journal.STARTED, count)
 
             # Wait until start_xxx_task.py finished.
             RUN_LOGGER.info("3) Waiting for tasks end in the cluster...")
-            pid_file_path = os.path.join(
-                log_dir_container, "start_" +
-                case_config["framework"].split("_")[0] + "_task.pid")
-            
-            wait_for_finish(dp_path, container_name, pid_file_path, nnodes)
-            RUN_LOGGER.info("4) Clean container environments in cluster...")
-            clean_containers_env_cluster(dp_path, container_name, nnodes)
+            finished = wait_for_finish(dp_path, container_name,
+                                       pid_file_path, nnodes)
+            RUN_JOURNAL.record(case, run_journal.FINISHED if finished else
+                               run_journal.FAILED, count)
+            RUN_LOGGER.info("Testcase " + case + " Round " + str(count) +
+                            " tasks took " +
+                            str(round(time.time() - task_start_time, 2)) +
+                            " seconds.")
+            if warm:
+                RUN_LOGGER.info("4) Stop monitors, keep warm container(s)...")
+                stop_monitors_in_cluster(dp_path, nnodes)
+            else:
+                RUN_LOGGER.info(
+                    "4) Clean container environments in cluster...")
+                clean_containers_env_cluster(dp_path, container_name, nnodes)
             RUN_LOGGER.info("-== Testcase " + case + " Round " + str(count) +
                             " finished ==-")
+            if repeat_is_enough(curr_log_path, case, case_config, count):
+                break
         RUN_LOGGER.info("=== 2.3 Setup container and run testcases finished."
                         " ===")
+    if warm_container["key"] is not None:
+        RUN_LOGGER.info("Stop warm container " + warm_container["name"])
+        stop_container_in_cluster(dp_path, warm_container["name"],
+                                  warm_container["nnodes"])
+    if warm:
+        RUN_LOGGER.info("Warm containers saved " +
+                        str(round(setup_time_saved, 2)) +
+                        " seconds of setup in total.")
     RUN_LOGGER.info("========= Step 3: Collect logs in the cluster. =========")
     collect_and_merge_logs(curr_log_path, cases)
+    RUN_LOGGER.info("========= Step 4: Analysis monitor logs by phases. =====")
+    analysis_phases(curr_log_path, cases)
+    RUN_LOGGER.info("========= Step 5: Aggregate repeated rounds. =========")
+    analysis_repeats(curr_log_path, cases)
+    db_path = getattr(tc, "RESULTS_DB", None)
+    if db_path is not None:
+        RUN_LOGGER.info("========= Step 6: Store results. =========")
+        store_results(curr_log_path, db_path)
 
 
 if __name__ == '__main__':
@@ -735,4 +1310,5 @@ if __name__ == '__main__':
         RUN_LOGGER.error(f"Training run failed: {e}")
         sys.exit(1)
     finally:
+        CLUSTER_MGR.close_connections()
         RUN_LOGGER.stop()
@@ -1,7 +1,11 @@
 '''Some helper functions for starting tasks in container.'''
 import os
+import sys
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(os.path.join(CURR_PATH, "../../utils")))
+from task_status import write_status_file
+import case_scheduler
 
 
 def _get_model_path(model_name, framework):
@@ -63,6 +67,16 @@ def get_mlu_pid():
     return None
 
 
+def task_file_suffix(task_args):
+    '''Return the suffix of pid/status files of the task, so that tasks
+       packed on the same host don't share them.
+    '''
+    devices = getattr(task_args, "visible_devices", None)
+    if devices is None:
+        return ""
+    return case_scheduler.task_file_suffix(devices.split(","))
+
+
 def write_pid_file(pid_file_path, pid_file):
     '''Write pid file for watching the process later.
        In each round of case, we will write the current pid in the same path.
@@ -0,0 +1,133 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Run independent cases concurrently on disjoint accelerators.
+
+A case needs nproc accelerators on each of the first nnodes hosts, the
+same device ids on every host since they share one start command. Cases
+are started in order as soon as their devices are free, later cases that
+fit are started ahead of a waiting one(backfill). Exclusive cases, and
+cases that need more devices than a host has, take all the devices of
+their hosts and run without a device mask.
+'''
+
+import time
+import threading
+
+
+def task_file_suffix(devices):
+    '''Return the suffix of pid/status files of a task on devices, so that
+       tasks packed on the same host don't share them. The task launchers
+       of the containers name their files with it too.'''
+    if devices is None:
+        return ""
+    return "_dev" + "-".join(str(device) for device in devices)
+
+
+class DevicePool:
+    '''Free device ids of each host, hosts are used from the first one.'''
+
+    def __init__(self, num_hosts, devices_per_host):
+        self.devices_per_host = devices_per_host
+        self.free = [set(range(devices_per_host)) for _ in range(num_hosts)]
+
+    def _common_free(self, nnodes):
+        common = set(self.free[0])
+        for host_free in self.free[1:nnodes]:
+            common &= host_free
+        return common
+
+    def acquire(self, nnodes, nproc, exclusive=False):
+        '''Take devices for a case. Return the sorted device ids, None if
+           they are not free now. Aligned contiguous blocks are preferred,
+           they share the fastest links on most hosts.'''
+        if nnodes > len(self.free):
+            raise ValueError("Case needs " + str(nnodes) + " hosts, " +
+                             str(len(self.free)) + " available")
+        common = self._common_free(nnodes)
+        if exclusive or nproc >= self.devices_per_host:
+            if len(common) != self.devices_per_host:
+                return None
+            devices = sorted(common)
+        elif len(common) < nproc:
+            return None
+        else:
+            devices = None
+            for start in range(0, self.devices_per_host - nproc + 1, nproc):
+                block = set(range(start, start + nproc))
+                if block <= common:
+                    devices = sorted(block)
+                    break
+            if devices is None:
+                devices = sorted(common)[0:nproc]
+        for host_free in self.free[0:nnodes]:
+            host_free -= set(devices)
+        return devices
+
+    def release(self, nnodes, devices):
+        '''Give the devices of a finished case back.'''
+        for host_free in self.free[0:nnodes]:
+            host_free |= set(devices)
+
+
+def run_concurrently(jobs, pool, run_job, logger=None):
+    '''Run jobs on the pool concurrently, one thread per running job.
+       jobs is a list of dicts with name, nnodes, nproc and exclusive.
+       run_job(job, devices) is called with the device ids of the job, or
+       None if the job has all the devices of its hosts.
+       Return {"makespan", "busy", "saved", "durations"}, busy is the sum
+       of the job durations, i.e. the makespan of running them one by one.
+    '''
+    cond = threading.Condition()
+    pending = list(jobs)
+    running = {}
+    durations = {}
+
+    def _worker(job, devices):
+        start = time.time()
+        try:
+            exclusive = job.get("exclusive") or \
+                len(devices) == pool.devices_per_host
+            run_job(job, None if exclusive else devices)
+        except Exception as err:
+            if logger is not None:
+                logger.error("Case " + job["name"] + " failed: " + str(err))
+        finally:
+            with cond:
+                durations[job["name"]] = time.time() - start
+                pool.release(job["nnodes"], devices)
+                del running[job["name"]]
+                cond.notify_all()
+
+    start_time = time.time()
+    with cond:
+        while pending or running:
+            for job in list(pending):
+                devices = pool.acquire(job["nnodes"], job["nproc"],
+                                       job.get("exclusive", False))
+                if devices is None:
+                    continue
+                pending.remove(job)
+                if logger is not None:
+                    logger.info("Schedule case " + job["name"] +
+                                " on devices " +
+                                ",".join(str(d) for d in devices) +
+                                " of the first " + str(job["nnodes"]) +
+                                " host(s).")
+                thread = threading.Thread(target=_worker,
+                                          args=(job, devices),
+                                          daemon=True)
+                running[job["name"]] = thread
+                thread.start()
+            if pending and not running:
+                raise ValueError("Cases can't be scheduled: " +
+                                 ",".join(job["name"] for job in pending))
+            cond.wait()
+    makespan = time.time() - start_time
+    busy = sum(durations.values())
+    return {
+        "makespan": makespan,
+        "busy": busy,
+        "saved": busy - makespan,
+        "durations": durations
+    }
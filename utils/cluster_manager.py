@@ -5,13 +5,45 @@
 
 import os
 import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.join(CURR_PATH))
 import run_cmd
+import task_status
+import deploy_sync
 
 from argparse import ArgumentParser
 
+# Commands to compress/decompress the log archives streamed from hosts.
+COMPRESSORS = {
+    "gzip": ("gzip -1", "gzip -d"),
+    "zstd": ("zstd -1 -q", "zstd -d -q"),
+}
+COLLECT_CHUNK_SIZE = 1024 * 1024
+
+def dir_manifest(root_dir):
+    '''Return a dict of relative path -> (size, mtime in seconds) of all the
+       files under root_dir.
+    '''
+    manifest = {}
+    for dir_path, _, file_names in os.walk(root_dir):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+            manifest[os.path.relpath(file_path, root_dir)] = \
+                (file_stat.st_size, int(file_stat.st_mtime))
+    return manifest
+
 def is_substring(sub_str: str, main_str: str) -> bool:
     """
     Check if a substring is contained within a main string.
@@ -56,6 +88,12 @@ def replace_between_spaces(input, start, end, replacement):
     parts[start:end] = [replacement]
     return ' '.join(parts)
 
+def _read_back(file_d):
+    '''Return the text written to a temp file by a command.'''
+    file_d.seek(0)
+    return file_d.read().decode(errors="replace")
+
+
 class ClusterManager():
     '''A cluster manager that can make healthcheck, distribute files, and run a
        command in the cluster.
@@ -68,18 +106,97 @@ class ClusterManager():
         self.ssh_cmd_head = None
         self.scp_cmd_head = None
         self.logger = None
-
-    def init(self, hosts, port, user, logger):
-        '''Init with all args that ssh needs.'''
+        self.fanout = 1
+        self.hosts_latency = {}
+        self.control_dir = None
+        self.mux_opts = ""
+        self.conn_stats = {"masters": 0, "ssh": 0, "scp": 0}
+        self.stats_lock = threading.Lock()
+        self.collect_stats = {}
+        self.sync_stats = {}
+
+    def init(self, hosts, port, user, logger, fanout=16, multiplex=True):
+        '''Init with all args that ssh needs.
+           fanout is the max count of hosts that a command runs on at the
+           same time. fanout=1 runs the command on hosts one by one.
+           multiplex makes all ssh/scp commands to a host share one
+           persistent ssh connection(ControlMaster) for the whole run.
+        '''
         self.hosts = hosts
         self.ssh_port = port
         self.user = user
         self.logger = logger
+        self.fanout = max(1, int(fanout))
+        if multiplex:
+            # Keep socket path short, unix socket path is limited to 108.
+            self.control_dir = tempfile.mkdtemp(prefix="flagperf_ssh_")
+            self.mux_opts = " -o ControlMaster=no -o ControlPath=" \
+                            + os.path.join(self.control_dir, "%C")
         self.ssh_cmd_head = "ssh -o ConnectTimeout=3" \
                             + " -o StrictHostKeyChecking=no -l " + self.user \
-                            + " -p " + port
+                            + " -p " + port + self.mux_opts
         self.scp_cmd_head = "scp -o  ConnectTimeout=3 " \
-                            + "-o StrictHostKeyChecking=no -P " + port
+                            + "-o StrictHostKeyChecking=no -P " + port \
+                            + self.mux_opts
+
+    def _count_conn(self, kind):
+        '''Count ssh masters and commands sent in this run.'''
+        with self.stats_lock:
+            self.conn_stats[kind] += 1
+
+    def _start_master(self, host, timeout=10):
+        ''' Start a background ssh master connection to host. Later ssh/scp
+            commands reuse it. If the master can't be started, commands
+            still work with their own connections.
+        '''
+        master_cmd = self.ssh_cmd_head.replace(
+            "ControlMaster=no", "ControlMaster=yes") \
+            + " -o ControlPersist=600 -fN " + host + " > /dev/null 2>&1"
+        ret, outs = run_cmd.run_cmd_wait(master_cmd, timeout)
+        if ret == 0:
+            self._count_conn("masters")
+        else:
+            self.logger.warning("Start ssh master connection to " + host +
+                                " failed. Continue without it.")
+        return ret, outs
+
+    def open_connections(self):
+        ''' Open persistent ssh connections to all the hosts if multiplex
+            is enabled. Return the hosts that failed.
+        '''
+        failed_hosts_ret = {}
+        if self.control_dir is None:
+            return failed_hosts_ret
+        hosts_ret = self._run_on_hosts([(host, (host, )) for host in self.hosts],
+                                       self._start_master)
+        for host, (ret, _) in zip(self.hosts, hosts_ret):
+            if ret != 0:
+                failed_hosts_ret[host] = ret
+        return failed_hosts_ret
+
+    def close_connections(self):
+        ''' Close persistent ssh connections and log how many commands they
+            served.
+        '''
+        if self.control_dir is None:
+            return
+        for host in self.hosts:
+            exit_cmd = self.ssh_cmd_head + " -O exit " + host
+            run_cmd.run_cmd_wait(exit_cmd, 10)
+        shutil.rmtree(self.control_dir, ignore_errors=True)
+        self.control_dir = None
+        conn_stats = self.get_conn_stats()
+        self.logger.info("SSH connections closed. masters=" +
+                         str(conn_stats["masters"]) + " ssh commands=" +
+                         str(conn_stats["ssh"]) + " scp commands=" +
+                         str(conn_stats["scp"]))
+
+    def get_conn_stats(self):
+        ''' Return counts of ssh master connections(handshakes) and ssh/scp
+            commands sent in this run.
+        '''
+        with self.stats_lock:
+            return dict(self.conn_stats)
 
     def _run_command_ssh_remote(self, cmd, host, timeout=10):
         ''' Run cmd on host with ssh.
@@ -93,12 +210,62 @@ class ClusterManager():
                 self.logger.debug("replace python3 for ssh_run_cmd: " + ssh_run_cmd)
         self.logger.debug("Run cmd on host with ssh. ssh cmd=" + ssh_run_cmd +
                           " host=" + host + " timeout=" + str(timeout))
+        self._count_conn("ssh")
         ret, outs = run_cmd.run_cmd_wait(ssh_run_cmd, timeout)
         return ret, outs
 
+    def _run_on_hosts(self, host_jobs, func):
+        ''' Run func(*args) for each (host, args) in host_jobs, at most
+            self.fanout hosts at the same time.
+            Return a list of (ret, outs), ordered as host_jobs. The latency
+            of each host is recorded in self.hosts_latency.
+        '''
+        def _timed_call(job):
+            host, args = job
+            start = time.time()
+            ret, outs = func(*args)
+            return host, ret, outs, time.time() - start
+
+        if self.fanout == 1 or len(host_jobs) <= 1:
+            results = [_timed_call(job) for job in host_jobs]
+        else:
+            workers = min(self.fanout, len(host_jobs))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_timed_call, host_jobs))
+
+        hosts_ret = []
+        hosts_latency = {}
+        for host, ret, outs, latency in results:
+            hosts_ret.append((ret, outs))
+            hosts_latency[host] = latency
+        # Concurrent cases share the manager, the stats of a call are only
+        # published when complete.
+        with self.stats_lock:
+            self.hosts_latency = hosts_latency
+        if len(results) > 1:
+            slowest = max(hosts_latency, key=hosts_latency.get)
+            self.logger.debug("Hosts latency(s): " + ",".join(
+                host + "=" + str(round(latency, 3))
+                for host, latency in hosts_latency.items()) +
+                              " slowest host=" + slowest)
+        return hosts_ret
+
+    def _run_command_on_hosts(self, host_cmds, timeout):
+        ''' Run command on each host of host_cmds [(host, cmd), ...] with ssh.
+        '''
+        host_jobs = [(host, (cmd, host, timeout)) for host, cmd in host_cmds]
+        return self._run_on_hosts(host_jobs, self._run_command_ssh_remote)
+
+    def get_hosts_latency(self):
+        '''Return a dict of host -> seconds spent by the last command.'''
+        with self.stats_lock:
+            return dict(self.hosts_latency)
+
     def healthcheck(self):
-        '''Return the hosts not alive.
+        '''Return the hosts not alive. Persistent ssh connections are
+           opened first if multiplex is enabled.
         '''
+        self.open_connections()
         return self.run_command_all_hosts(":")
 
     def get_hosts_list(self):
@@ -114,14 +281,50 @@ class ClusterManager():
         '''Run a command on each host with ssh.
         '''
         failed_hosts_ret = {}
-        for host in self.hosts:
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+        hosts_ret = self._run_command_on_hosts(
+            [(host, command) for host in self.hosts], timeout)
+        for host, (ret, outs) in zip(self.hosts, hosts_ret):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.error("Run cmd on host " + host + " cmd=" +
                                   command + " [FAILED]. Output: " + outs[0])
         return failed_hosts_ret
 
+    def _command_in_container_mode(self, command, host_index):
+        '''Rewrite command when EXEC_IN_CONTAINER is set.
+           Return None if the command should be skipped on the host.
+        '''
+        if is_substring("image_manager.py", command):
+            self.logger.debug(f"Skip running image_manager control in host:{str(host_index)}, \
+                                because EVN 'EXEC_IN_CONTAINER' is set to True")
+            return None
+        elif is_substring("container_manager.py", command):
+            if is_substring("-o pidrunning", command) or \
+               is_substring("-o waitfinish", command):
+                command = command.replace('container_manager.py', 'cluster_manager.py')
+                start_str = "-o pidrunning " if is_substring(
+                    "-o pidrunning", command) else "-o waitfinish "
+                end_str = " -f "
+                start_index = command.find(start_str) + len(start_str)
+                end_index = command.find(end_str)
+                command = command[0:start_index].strip() + ' ' +command[end_index:].strip()
+            else:
+                self.logger.debug(f"Skip running container_manager control in host:{str(host_index)}, \
+                                because EVN 'EXEC_IN_CONTAINER' is set to True")
+                return None
+        elif is_substring("sys_monitor.py", command):
+            command = replace_between_spaces(command, 3, 4, "python3")
+        elif is_substring("docker_images", command):
+            if is_substring("inference", command):
+                if is_substring("stop", command):
+                    command = replace_between_spaces(command, 4, 5, "python3")
+                else:
+                    command = replace_between_spaces(command, 3, 4, "python3") 
+            else:
+                command = replace_between_spaces(command, 3, 4, "python3")
+            self.logger.debug("replace python3 for command: " + command)
+        return command
+
     def run_command_some_hosts(self,
                                command,
                                host_count,
@@ -130,46 +333,24 @@ class ClusterManager():
         '''Run a command on each host with ssh.
         '''
         failed_hosts_ret = {}
+        host_cmds = []
         for i in range(0, host_count):
             self.logger.debug("host number:" + str(i))
             host = self.hosts[i]
+            host_cmd = command
             if os.getenv("EXEC_IN_CONTAINER", False):
-                if is_substring("image_manager.py", 
-                                command):
-                    self.logger.debug(f"Skip running image_manager control in host:{str(i)}, \
-                                        because EVN 'EXEC_IN_CONTAINER' is set to True")
+                host_cmd = self._command_in_container_mode(command, i)
+                if host_cmd is None:
                     continue
-                elif is_substring("container_manager.py",
-                                    command):
-                    if is_substring("-o pidrunning", command):
-                        command = command.replace('container_manager.py', 'cluster_manager.py')
-                        start_str = "-o pidrunning "
-                        end_str = " -f "
-                        start_index = command.find(start_str) + len(start_str)
-                        end_index = command.find(end_str)
-                        command = command[0:start_index].strip() + ' ' +command[end_index:].strip()
-                    else:
-                        self.logger.debug(f"Skip running container_manager control in host:{str(i)}, \
-                                        because EVN 'EXEC_IN_CONTAINER' is set to True")
-                        continue
-                elif is_substring("sys_monitor.py", command):
-                    command = replace_between_spaces(command, 3, 4, "python3")
-                elif is_substring("docker_images", command):
-                    if is_substring("inference", command):
-                        if is_substring("stop", command):
-                            command = replace_between_spaces(command, 4, 5, "python3")
-                        else:
-                            command = replace_between_spaces(command, 3, 4, "python3") 
-                    else:
-                        command = replace_between_spaces(command, 3, 4, "python3")
-                    self.logger.debug("replace python3 for command: " + command)
-
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+            host_cmds.append((host, host_cmd))
+
+        hosts_ret = self._run_command_on_hosts(host_cmds, timeout)
+        for (host, host_cmd), (ret, outs) in zip(host_cmds, hosts_ret):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 if not no_log:
                     self.logger.error("Run cmd on host " + host + " cmd=" +
-                                      command + " [FAILED]. Output: " +
+                                      host_cmd + " [FAILED]. Output: " +
                                       outs[0])
         return failed_hosts_ret
 
@@ -181,6 +362,7 @@ class ClusterManager():
         '''Start monitors on hosts with ssh.
         '''
         failed_hosts_ret = {}
+        host_cmds = []
         for i in range(0, host_count):
             self.logger.debug("host number:" + str(i))
             host = self.hosts[i]
@@ -193,7 +375,10 @@ class ClusterManager():
                 else:
                     command = replace_between_spaces(command, 3, 4, "python3")
                 self.logger.debug("replace python3 for command: " + command)
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+            host_cmds.append((host, command))
+
+        hosts_ret = self._run_command_on_hosts(host_cmds, timeout)
+        for (host, command), (ret, outs) in zip(host_cmds, hosts_ret):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.error("Run cmd on host " + host + " cmd=" +
@@ -212,6 +397,7 @@ class ClusterManager():
         if mode == "training" or mode == "base":
             base_cmd = base_cmd.rstrip("\"")
             command_master_ip = base_cmd + ' --master_addr ' + self.hosts[0]
+        host_cmds = []
         for i in range(0, host_count):
             host = self.hosts[i]
             command = base_cmd
@@ -223,8 +409,11 @@ class ClusterManager():
                 start_index = command.find(start_str) + len(start_str)
                 command = command[start_index:-1].strip()
                 self.logger.debug("replace python3 for command: " + command)
+            host_cmds.append((host, command))
 
-            ret, outs = self._run_command_ssh_remote(command, host, timeout)
+        hosts_ret = self._run_command_on_hosts(host_cmds, timeout)
+        for i, ((host, command), (ret, outs)) in enumerate(
+                zip(host_cmds, hosts_ret)):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.debug("Run cmd on host " + host + " cmd=" +
@@ -242,15 +431,36 @@ class ClusterManager():
         scp_cmd = self.scp_cmd_head + " " + local_file + " " + self.user \
                                     + "@" + host + ":" + remote_dir + "/"
         self.logger.debug("scp command:" + scp_cmd)
+        self._count_conn("scp")
         ret, outs = run_cmd.run_cmd_wait(scp_cmd, timeout)
         return ret, outs
 
+    def _sync_file_to_remote_host(self,
+                                  host,
+                                  local_file,
+                                  remote_dir,
+                                  local_hash,
+                                  timeout=600):
+        ''' Copy local_file to remote_dir unless the remote file has the
+            same content hash.
+        '''
+        remote_file = os.path.join(remote_dir, os.path.basename(local_file))
+        ret, outs = self._run_command_ssh_remote("sha1sum " + remote_file,
+                                                 host, timeout)
+        if ret == 0 and local_hash in outs[0].split():
+            self.logger.debug("Skip scp " + local_file + " to " + host +
+                              ", it is up to date.")
+            return 0, ["", None]
+        return self._scp_file_to_remote_host(host, local_file, remote_dir,
+                                             timeout)
+
     def sync_file_to_some_hosts(self,
                                 local_file,
                                 remote_dir,
                                 host_count,
                                 timeout=600):
-        '''scp local_file to remote_dir on hosts in the cluster .'''
+        '''scp local_file to remote_dir on hosts in the cluster, skip the
+           hosts that already have the same file.'''
         failed_hosts_ret = {}
         if not os.path.exists(local_file):
             self.logger.error("Can't find local file before scp:" + local_file)
@@ -258,12 +468,12 @@ class ClusterManager():
                 failed_hosts_ret[host] = 1
             return failed_hosts_ret
 
-        for i in range(0, host_count):
-            host = self.hosts[i]
-            ret, outs = self._scp_file_to_remote_host(host,
-                                                      local_file,
-                                                      remote_dir,
-                                                      timeout=timeout)
+        local_hash = deploy_sync.file_hash(local_file)
+        hosts = self.hosts[0:host_count]
+        hosts_ret = self._run_on_hosts(
+            [(host, (host, local_file, remote_dir, local_hash, timeout))
+             for host in hosts], self._sync_file_to_remote_host)
+        for host, (ret, outs) in zip(hosts, hosts_ret):
             if ret != 0:
                 failed_hosts_ret[host] = ret
                 self.logger.debug("Scp local file " + local_file + "to " +
@@ -271,52 +481,380 @@ class ClusterManager():
                                   " [FAILED]. Output: " + outs[0])
         return failed_hosts_ret
 
-    def _scp_dir_from_remote_host(self,
-                                  host,
-                                  remote_dir,
-                                  local_dir,
-                                  timeout=600):
-        ''' Run scp command to copy remote_dir to local_dir.
+    def _get_remote_manifest(self, host, remote_dir, timeout=600):
+        ''' Return exit code and content hash manifest of remote_dir on
+            host. The deploy path is the same on all the hosts. The master's
+            deploy_sync.py is sent to python3 of the host through stdin, so
+            the host needs neither the script nor the master's python path.
         '''
-        scp_cmd = self.scp_cmd_head + " -r " + self.user + "@" + host + ":" \
-                                    + remote_dir + "/* " + local_dir + "/"
-        self.logger.debug("scp command:" + scp_cmd)
-        ret, outs = run_cmd.run_cmd_wait(scp_cmd, timeout)
+        manifest_cmd = self.ssh_cmd_head + " " + host \
+                       + " \'python3 - -o manifest -d " + remote_dir \
+                       + "\' < " + os.path.join(CURR_PATH, "deploy_sync.py")
+        self.logger.debug("manifest command:" + manifest_cmd)
+        self._count_conn("ssh")
+        ret, outs = run_cmd.run_cmd_wait(manifest_cmd, timeout)
+        if ret != 0:
+            return ret, None
+        # Skip messages of ssh itself, they are mixed in output.
+        for line in reversed(outs[0].splitlines()):
+            if line.startswith("{"):
+                return 0, json.loads(line)
+        return 1, None
+
+    def _sync_dir_to_remote_host(self,
+                                 host,
+                                 local_dir,
+                                 local_manifest,
+                                 hosts_stats,
+                                 timeout=600):
+        ''' Send the files of local_dir that are changed or missing on host
+            as one compressed tar archive. The files, bytes and seconds sent
+            are put in hosts_stats[host].
+        '''
+        start = time.time()
+        ret, remote_manifest = self._get_remote_manifest(host, local_dir,
+                                                         timeout)
+        if ret != 0:
+            return ret, ["Can't get manifest of " + local_dir, None]
+        changed, missing, _ = deploy_sync.diff_manifest(local_manifest,
+                                                        remote_manifest)
+        files = changed + missing
+        stats = {"files": len(files), "bytes": 0}
+        outs = ["", None]
+        if len(files) != 0:
+            with tempfile.NamedTemporaryFile("w",
+                                             prefix="flagperf_sync_",
+                                             delete=False) as list_file:
+                list_file.write("\0".join(files) + "\0")
+            compress_cmd, decompress_cmd = COMPRESSORS["gzip"]
+            send_cmd = "cd " + local_dir + " && tar --null -T " \
+                       + list_file.name + " -cf - | " + compress_cmd
+            recv_cmd = self.ssh_cmd_head + " " + host + " \'cd " \
+                       + local_dir + " && " + decompress_cmd \
+                       + " | tar -xf -\'"
+            self.logger.debug("sync command:" + send_cmd + " | " + recv_cmd)
+            self._count_conn("ssh")
+            ret, outs = self._pipe_commands(send_cmd, recv_cmd, stats,
+                                            timeout)
+            os.remove(list_file.name)
+        stats["seconds"] = time.time() - start
+        hosts_stats[host] = stats
         return ret, outs
 
+    def sync_dir_to_some_hosts(self, local_dir, host_count, timeout=600):
+        '''Make local_dir on hosts in the cluster the same as the master's
+           by sending only the files whose content hash differs.
+           Files that only exist on hosts are kept.
+        '''
+        failed_hosts_ret = {}
+        local_manifest = deploy_sync.build_manifest(local_dir)
+        hosts = self.hosts[0:host_count]
+        hosts_stats = {}
+        hosts_ret = self._run_on_hosts(
+            [(host, (host, local_dir, local_manifest, hosts_stats, timeout))
+             for host in hosts], self._sync_dir_to_remote_host)
+        with self.stats_lock:
+            self.sync_stats = hosts_stats
+        for host, (ret, outs) in zip(hosts, hosts_ret):
+            if ret != 0:
+                failed_hosts_ret[host] = ret
+                self.logger.error("Sync " + local_dir + " to " + host +
+                                  " [FAILED]. Output: " + outs[0])
+                continue
+            stats = hosts_stats[host]
+            self.logger.info("Sync " + str(stats["files"]) + " files(" +
+                             str(round(stats["bytes"] / 1024 / 1024, 2)) +
+                             " MB) to " + host + " in " +
+                             str(round(stats["seconds"], 2)) + " s")
+        return failed_hosts_ret
+
+    def check_dir_some_hosts(self, local_dir, host_count, timeout=600):
+        '''Compare content hash of local_dir on hosts with the master's.
+           Return a dict of host -> list of changed or missing files, for
+           the hosts that differ or can't be checked.
+        '''
+        bad_hosts_files = {}
+        local_manifest = deploy_sync.build_manifest(local_dir)
+        hosts = self.hosts[0:host_count]
+        hosts_ret = self._run_on_hosts(
+            [(host, (host, local_dir, timeout)) for host in hosts],
+            self._get_remote_manifest)
+        for host, (ret, remote_manifest) in zip(hosts, hosts_ret):
+            if ret != 0:
+                bad_hosts_files[host] = ["<can't get manifest>"]
+                continue
+            changed, missing, extra = deploy_sync.diff_manifest(
+                local_manifest, remote_manifest)
+            if len(extra) != 0:
+                self.logger.debug("Files only on " + host + ": " +
+                                  ",".join(extra))
+            if len(changed) + len(missing) != 0:
+                bad_hosts_files[host] = changed + missing
+        return bad_hosts_files
+
+    def _collect_dir_from_remote_host(self,
+                                      host,
+                                      remote_dir,
+                                      local_dir,
+                                      hosts_stats,
+                                      timeout=600,
+                                      compressor="gzip"):
+        ''' Stream the files of remote_dir that are missing or changed in
+            local_dir as one compressed tar archive, and unpack it into
+            local_dir. Files are compared by size and mtime, tar keeps the
+            mtime so collected files are skipped next time. The files, bytes
+            and seconds collected are put in hosts_stats[host].
+            Return exit code and messages, like run_cmd.run_cmd_wait.
+        '''
+        start = time.time()
+        manifest_cmd = "cd " + remote_dir \
+                       + " && find . -type f -printf \"%P\\t%s\\t%T@\\n\""
+        ret, outs = self._run_command_ssh_remote(manifest_cmd, host, timeout)
+        if ret != 0:
+            return ret, outs
+
+        local_manifest = dir_manifest(local_dir)
+        files = []
+        for line in outs[0].splitlines():
+            # Skip messages of ssh itself, they are mixed in output.
+            items = line.split("\t")
+            if len(items) != 3:
+                continue
+            name, size, mtime = items
+            size, mtime = int(size), int(float(mtime))
+            local_size, local_mtime = local_manifest.get(name, (-1, -1))
+            # Files only grow or get newer, this also keeps the files of the
+            # local host(as one of the hosts) from being rewritten.
+            if mtime > local_mtime or (mtime == local_mtime
+                                       and size > local_size):
+                files.append(name)
+
+        stats = {"files": len(files), "bytes": 0}
+        if len(files) != 0:
+            with tempfile.NamedTemporaryFile("w",
+                                             prefix="flagperf_collect_",
+                                             delete=False) as list_file:
+                list_file.write("\0".join(files) + "\0")
+            compress_cmd, decompress_cmd = COMPRESSORS[compressor]
+            send_cmd = self.ssh_cmd_head + " " + host + " \'cd " \
+                       + remote_dir + " && tar --null -T - -cf - | " \
+                       + compress_cmd + "\' < " + list_file.name
+            recv_cmd = decompress_cmd + " | tar -xf - -C " + local_dir
+            self.logger.debug("collect command:" + send_cmd + " | " +
+                              recv_cmd)
+            self._count_conn("ssh")
+            ret, outs = self._pipe_commands(send_cmd, recv_cmd, stats,
+                                            timeout)
+            os.remove(list_file.name)
+
+        stats["seconds"] = time.time() - start
+        hosts_stats[host] = stats
+        return ret, outs
+
+    def _pipe_commands(self, send_cmd, recv_cmd, stats, timeout):
+        ''' Run "send_cmd | recv_cmd" and count the bytes in the pipe.
+            Both commands are killed after timeout seconds. Their stderr
+            goes to temp files, so that it never blocks them.
+        '''
+        send_err_file = tempfile.TemporaryFile()
+        recv_err_file = tempfile.TemporaryFile()
+        sender = subprocess.Popen(send_cmd,
+                                  shell=True,
+                                  stdout=subprocess.PIPE,
+                                  stderr=send_err_file)
+        receiver = subprocess.Popen(recv_cmd,
+                                    shell=True,
+                                    stdin=subprocess.PIPE,
+                                    stderr=recv_err_file)
+        killer = threading.Timer(timeout,
+                                 lambda: [sender.kill(), receiver.kill()])
+        killer.start()
+        try:
+            while True:
+                chunk = sender.stdout.read(COLLECT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                stats["bytes"] += len(chunk)
+                receiver.stdin.write(chunk)
+            receiver.stdin.close()
+            sender.wait()
+            receiver.wait()
+            send_err = _read_back(send_err_file)
+            recv_err = _read_back(recv_err_file)
+        except OSError as err:
+            sender.kill()
+            receiver.kill()
+            return 1, [str(err), None]
+        finally:
+            killer.cancel()
+            send_err_file.close()
+            recv_err_file.close()
+        ret = sender.returncode if sender.returncode != 0 \
+            else receiver.returncode
+        return ret, [send_err + recv_err, None]
+
+    def _pipe_command_to_many(self, send_cmd, recv_cmds, stats, timeout):
+        ''' Run send_cmd once and write its output to all recv_cmds at the
+            same time. A receiver that breaks is dropped, the others go on.
+            All commands are killed after timeout seconds. Their messages
+            go to temp files, so that they never block them.
+            Return a list of (exit code, messages) of the receivers.
+        '''
+        send_err_file = tempfile.TemporaryFile()
+        recv_out_files = [tempfile.TemporaryFile() for _ in recv_cmds]
+        sender = subprocess.Popen(send_cmd,
+                                  shell=True,
+                                  stdout=subprocess.PIPE,
+                                  stderr=send_err_file)
+        receivers = [
+            subprocess.Popen(recv_cmd,
+                             shell=True,
+                             stdin=subprocess.PIPE,
+                             stdout=recv_out_file,
+                             stderr=subprocess.STDOUT)
+            for recv_cmd, recv_out_file in zip(recv_cmds, recv_out_files)
+        ]
+        broken = [None] * len(receivers)
+        killer = threading.Timer(
+            timeout, lambda: [p.kill() for p in [sender] + receivers])
+        killer.start()
+        try:
+            while True:
+                chunk = sender.stdout.read(COLLECT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                stats["bytes"] += len(chunk)
+                for i, receiver in enumerate(receivers):
+                    if broken[i] is not None:
+                        continue
+                    try:
+                        receiver.stdin.write(chunk)
+                    except OSError as err:
+                        broken[i] = str(err)
+                if None not in broken:
+                    sender.kill()
+                    break
+            for i, receiver in enumerate(receivers):
+                try:
+                    receiver.stdin.close()
+                except OSError as err:
+                    broken[i] = broken[i] or str(err)
+            sender.wait()
+            send_err = _read_back(send_err_file)
+            results = []
+            for i, receiver in enumerate(receivers):
+                receiver.wait()
+                recv_err = _read_back(recv_out_files[i])
+                ret = sender.returncode if sender.returncode != 0 \
+                    else receiver.returncode
+                if broken[i] is not None:
+                    ret = ret or 1
+                    recv_err += broken[i]
+                results.append((ret, [send_err + recv_err, None]))
+        finally:
+            killer.cancel()
+            for file_d in [send_err_file] + recv_out_files:
+                file_d.close()
+        return results
+
+    def distribute_image_some_hosts(self,
+                                    image_name,
+                                    hosts,
+                                    timeout=1800,
+                                    compressor="zstd"):
+        '''Stream a docker image from the first host of the cluster to
+           hosts. "docker save" runs once on the first host, the compressed
+           stream is sent to all the hosts at the same time and loaded by
+           "docker load". Return a dict of failed host -> exit code.
+        '''
+        failed_hosts_ret = {}
+        if len(hosts) == 0:
+            return failed_hosts_ret
+        compress_cmd, decompress_cmd = COMPRESSORS[compressor]
+        send_cmd = self.ssh_cmd_head + " " + self.hosts[0] \
+                   + " \'docker save " + image_name + " | " + compress_cmd \
+                   + "\'"
+        recv_cmds = [
+            self.ssh_cmd_head + " " + host + " \'" + decompress_cmd +
+            " | docker load\'" for host in hosts
+        ]
+        self.logger.debug("distribute image command:" + send_cmd + " | " +
+                          ",".join(recv_cmds))
+        for _ in range(len(hosts) + 1):
+            self._count_conn("ssh")
+        stats = {"bytes": 0}
+        start = time.time()
+        results = self._pipe_command_to_many(send_cmd, recv_cmds, stats,
+                                             timeout)
+        seconds = time.time() - start
+        for host, (ret, outs) in zip(hosts, results):
+            if ret != 0:
+                failed_hosts_ret[host] = ret
+                self.logger.error("Distribute image " + image_name + " to " +
+                                  host + " [FAILED]. Output: " + outs[0])
+        self.logger.info("Distribute image " + image_name + "(" +
+                         str(round(stats["bytes"] / 1024 / 1024, 2)) +
+                         " MB compressed) from " + self.hosts[0] + " to " +
+                         ",".join(hosts) + " in " + str(round(seconds, 2)) +
+                         " s")
+        return failed_hosts_ret
+
     def collect_files_some_hosts(self,
                                  remote_dir,
                                  local_dir,
                                  host_count,
-                                 timeout=600):
-        '''scp remote_dir from hosts in the cluster to <local_dir>/<host>.
+                                 timeout=600,
+                                 compressor="gzip"):
+        '''Collect remote_dir from hosts in the cluster to local_dir. Each
+           host streams only the files local_dir doesn't have as a
+           compressed tar archive, all hosts at the same time.
         '''
         failed_hosts_ret = {}
-        for i in range(0, host_count):
-            host = self.hosts[i]
-            if not os.path.exists(local_dir):
-                self.logger.debug("Make local dir:" + local_dir)
-                os.makedirs(local_dir)
-            ret, outs = self._scp_dir_from_remote_host(host,
-                                                       remote_dir,
-                                                       local_dir,
-                                                       timeout=timeout)
+        if not os.path.exists(local_dir):
+            self.logger.debug("Make local dir:" + local_dir)
+            os.makedirs(local_dir)
+        hosts = self.hosts[0:host_count]
+        hosts_stats = {}
+        hosts_ret = self._run_on_hosts(
+            [(host, (host, remote_dir, local_dir, hosts_stats, timeout,
+                     compressor)) for host in hosts],
+            self._collect_dir_from_remote_host)
+        with self.stats_lock:
+            self.collect_stats = hosts_stats
+        for host, (ret, outs) in zip(hosts, hosts_ret):
             if ret != 0:
                 failed_hosts_ret[host] = ret
-                self.logger.debug("Scp from " + host + ":" + remote_dir +
+                self.logger.debug("Collect from " + host + ":" + remote_dir +
                                   " to " + local_dir + " [FAILED]. Output: " +
                                   outs[0])
+                continue
+            stats = hosts_stats[host]
+            mbytes = stats["bytes"] / 1024 / 1024
+            self.logger.info("Collect " + str(stats["files"]) +
+                             " files from " + host + ": " +
+                             str(round(mbytes, 2)) + " MB in " +
+                             str(round(stats["seconds"], 2)) + " s, " +
+                             str(round(mbytes / max(stats["seconds"], 1e-6),
+                                       2)) + " MB/s")
         return failed_hosts_ret
-    
+
+    def get_collect_stats(self):
+        '''Return a dict of host -> files, bytes and seconds of the last
+           collect_files_some_hosts.'''
+        with self.stats_lock:
+            return dict(self.collect_stats)
+
+
 def _parse_args():
     '''Get command args from input. '''
     parser = ArgumentParser(description="Manage a host. ")
     parser.add_argument("-o",
                         type=str,
                         required=True,
-                        choices=['pidrunning'],
+                        choices=['pidrunning', 'waitfinish'],
                         help="Operation on the host:"
-                        "pidrunning Check wether the process is running.")
+                        "pidrunning Check wether the process is running."
+                        "waitfinish Wait until the process finished.")
 
     args, _ = parser.parse_known_args()
 
@@ -325,6 +863,15 @@ def _parse_args():
                             type=str,
                             required=True,
                             help="pid file path in container.")
+    elif args.o == 'waitfinish':
+        parser.add_argument("-f",
+                            type=str,
+                            required=True,
+                            help="pid file path in container.")
+        parser.add_argument("-t",
+                            type=int,
+                            default=600,
+                            help="max seconds to wait in this call")
     args = parser.parse_args()
     return args
 
@@ -343,6 +890,13 @@ def main():
             sys.exit(0)
         sys.exit(1)
 
+    if operation == "waitfinish":
+        ret, record = task_status.wait_for_finish(args.f,
+                                                  is_pid_running,
+                                                  timeout=args.t)
+        print("Status: ", record)
+        sys.exit(ret)
+
     if ret == 0:
         print("Output: ", outs[0])
         print(operation, "successful.")
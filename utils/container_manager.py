@@ -10,6 +10,7 @@ from argparse import ArgumentParser
 CURR_PATH = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.join(CURR_PATH))
 import run_cmd
+import task_status
 
 
 class ContainerManager():
@@ -96,6 +97,14 @@ class ContainerManager():
                 exists = False
         return exists
 
+    def read_file(self, file_path):
+        '''Return the text of a file in container, None if it can't be
+           read.'''
+        ret, outs = self.run_cmd_in("cat " + file_path, detach=False)
+        if ret != 0:
+            return None
+        return outs[0]
+
     def is_pid_running(self, pid_file_path):
         '''Return whether the process with pid is running in container.
            Return value:
@@ -126,7 +135,7 @@ def _parse_args():
                         required=True,
                         choices=[
                             'start', 'stop', 'rm', 'exists', 'runnew',
-                            'runcmdin', 'pidrunning'
+                            'runcmdin', 'pidrunning', 'waitfinish'
                         ],
                         help="Operation on the container:"
                         "start    Start a stopped container."
@@ -135,7 +144,8 @@ def _parse_args():
                         "exists   Check whether a container exists."
                         "runnew   Start a new container with run args."
                         "runcmdin Run a command in the container."
-                        "pidrunning Check wether the process is running.")
+                        "pidrunning Check wether the process is running."
+                        "waitfinish Wait until the process finished.")
     parser.add_argument("-c", type=str, required=True, help="Container name")
 
     args, _ = parser.parse_known_args()
@@ -167,6 +177,15 @@ def _parse_args():
                             type=str,
                             required=True,
                             help="pid file path in container.")
+    elif args.o == 'waitfinish':
+        parser.add_argument("-f",
+                            type=str,
+                            required=True,
+                            help="pid file path in container.")
+        parser.add_argument("-t",
+                            type=int,
+                            default=600,
+                            help="max seconds to wait in this call")
     args = parser.parse_args()
     return args
 
@@ -192,6 +211,15 @@ def main():
             sys.exit(0)
         sys.exit(1)
 
+    if operation == "waitfinish":
+        ret, record = task_status.wait_for_finish(
+            args.f,
+            container_mgr.is_pid_running,
+            timeout=args.t,
+            read_task_file=container_mgr.read_file)
+        print("Status: ", record)
+        sys.exit(ret)
+
     if operation == "start":
         ret, outs = container_mgr.start()
     elif operation == "stop":
@@ -0,0 +1,118 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Content hash manifests of the deploy path.
+Used by cluster manager to send only changed files to the hosts, and to
+check that every host runs the same code and configs as the master.
+usage:
+deploy_sync.py -o manifest -d [directory]
+'''
+
+import os
+import sys
+import json
+import hashlib
+import tempfile
+from argparse import ArgumentParser
+
+# Dir names that are never synced, logs and results are written there.
+EXCLUDE_DIRS = ["__pycache__", ".git", "result", "results"]
+
+
+def file_hash(file_path, block_size=1024 * 1024):
+    '''Return sha1 hex digest of the file content.'''
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as file_d:
+        while True:
+            block = file_d.read(block_size)
+            if not block:
+                break
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _cache_path(root_dir):
+    '''Return the path of hash cache of root_dir.'''
+    key = hashlib.sha1(os.path.abspath(root_dir).encode()).hexdigest()[0:12]
+    return os.path.join(tempfile.gettempdir(),
+                        "flagperf_manifest_" + key + ".json")
+
+
+def build_manifest(root_dir, exclude_dirs=None):
+    '''Return a dict of relative path -> sha1 of all the files under
+       root_dir. Hashes are cached by (size, mtime), so only changed files
+       are read again.
+    '''
+    if exclude_dirs is None:
+        exclude_dirs = EXCLUDE_DIRS
+    cache_path = _cache_path(root_dir)
+    try:
+        with open(cache_path, "r") as file_d:
+            cache = json.load(file_d)
+    except (OSError, ValueError):
+        cache = {}
+
+    manifest = {}
+    new_cache = {}
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        dir_names[:] = [name for name in dir_names if name not in exclude_dirs]
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            if not os.path.isfile(file_path):
+                continue
+            rel_path = os.path.relpath(file_path, root_dir)
+            file_stat = os.stat(file_path)
+            stamp = [file_stat.st_size, file_stat.st_mtime_ns]
+            cached = cache.get(rel_path)
+            if cached is not None and cached[0:2] == stamp:
+                digest = cached[2]
+            else:
+                digest = file_hash(file_path)
+            manifest[rel_path] = digest
+            new_cache[rel_path] = stamp + [digest]
+
+    try:
+        with open(cache_path, "w") as file_d:
+            json.dump(new_cache, file_d)
+    except OSError:
+        pass
+    return manifest
+
+
+def diff_manifest(master, other):
+    '''Compare manifest of a host with the master's.
+       Return (changed, missing, extra) lists of relative paths.
+    '''
+    changed = [path for path in master
+               if path in other and other[path] != master[path]]
+    missing = [path for path in master if path not in other]
+    extra = [path for path in other if path not in master]
+    return changed, missing, extra
+
+
+def _parse_args():
+    '''Get command args from input. '''
+    parser = ArgumentParser(description="Manifest of the deploy path. ")
+    parser.add_argument("-o",
+                        type=str,
+                        required=True,
+                        choices=['manifest'],
+                        help="Operation:"
+                        "manifest Print content hash manifest of the dir.")
+    parser.add_argument("-d", type=str, required=True, help="directory")
+    return parser.parse_args()
+
+
+def main():
+    '''Support command line for deploy sync. Called by cluster manager.'''
+    args = _parse_args()
+    if args.o == "manifest":
+        if not os.path.isdir(args.d):
+            print("Can't find dir", args.d)
+            sys.exit(1)
+        print(json.dumps(build_manifest(args.d)))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,11 +9,24 @@ image_management.py -o [operation] -i [repository] -t [tag]
 '''
 import os
 import sys
+import json
+import hashlib
 import argparse
 from run_cmd import run_cmd_wait as rcw
 from container_manager import ContainerManager
+import deploy_sync
 import time
 
+
+def content_tag(image_dir, framework, prefix):
+    '''Return an image tag of prefix and the content hash of the build
+       context in image_dir, e.g. Dockerfile and <framework>_install.sh.
+       Any edit of them gives a new tag, so the image is built again.
+    '''
+    manifest = deploy_sync.build_manifest(image_dir)
+    key = json.dumps([framework, sorted(manifest.items())])
+    return prefix + "_" + hashlib.sha1(key.encode()).hexdigest()[0:12]
+
 def _parse_args():
     ''' Check script input parameter. '''
     help_message = '''Operations for docker image:
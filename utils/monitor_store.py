@@ -0,0 +1,244 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Columnar store and vectorized summaries of monitor logs.
+
+The record files of the system monitor(sys_monitor.bin) and the vendor
+telemetry(<vendor>_telemetry.bin) are memory-mapped as columns, older
+text logs are parsed once. Every channel is kept as <channel>.npy in
+monitor_store/ of the log dir, so logs of long runs are not parsed again.
+summarize() computes statistics of many series, e.g. all the channels of
+all the hosts and devices, in one vectorized pass.
+'''
+
+import os
+import sys
+import datetime
+import warnings
+
+import numpy as np
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH))
+import sys_monitor
+import telemetry
+
+STORE_DIR = "monitor_store"
+SYS_CHANNELS = ["cpu", "mem", "pwr"]
+VENDOR_CHANNELS = ["temp", "power", "mem"]
+PERCENTILES = [50, 90, 99]
+
+
+def _memmap_records(record_file, record_size):
+    '''Return records of a float64 record file as a read-only
+       (n, record_size) memory map, an empty array if there is none.'''
+    size = os.path.getsize(record_file) // (8 * record_size)
+    if size == 0:
+        return np.zeros((0, record_size))
+    return np.memmap(record_file,
+                     dtype=np.float64,
+                     mode="r",
+                     shape=(size, record_size))
+
+
+def _parse_text_log(monitor_path):
+    '''Return (timestamps, values) of a text <index>_monitor.log.'''
+    timestamps = []
+    values = []
+    with open(monitor_path, "r") as file_d:
+        for line in file_d:
+            if "\t" not in line:
+                continue
+            stamp, value = line.split("\t", 1)
+            timestamps.append(
+                datetime.datetime.strptime(stamp,
+                                           "%Y-%m-%d-%H:%M:%S").timestamp())
+            values.append(float(value))
+    return np.array(timestamps), np.array(values)
+
+
+def _store_path(log_dir, name):
+    return os.path.join(log_dir, STORE_DIR, name + ".npy")
+
+
+def _newer_than(path, sources):
+    '''Return whether path exists and is newer than all existing sources.
+       A store without any source left is stale, not fresh.'''
+    if not os.path.exists(path):
+        return False
+    mtime = os.path.getmtime(path)
+    existing = [src for src in sources if os.path.exists(src)]
+    return len(existing) != 0 and all(
+        os.path.getmtime(src) <= mtime for src in existing)
+
+
+def save_columns(log_dir, columns):
+    '''Save {name: array} as monitor_store/<name>.npy in log_dir.'''
+    os.makedirs(os.path.join(log_dir, STORE_DIR), exist_ok=True)
+    for name, column in columns.items():
+        np.save(_store_path(log_dir, name), np.asarray(column))
+
+
+def load_columns(log_dir, names):
+    '''Return {name: memory-mapped array} of monitor_store/ in log_dir.'''
+    return {
+        name: np.load(_store_path(log_dir, name), mmap_mode="r")
+        for name in names
+    }
+
+
+def sys_columns(log_dir):
+    '''Return {"<channel>_timestamp": ..., "<channel>": ...} of the system
+       monitor in log_dir, samples without the value are dropped.'''
+    names = []
+    for channel in SYS_CHANNELS:
+        names += [channel + "_timestamp", channel]
+    sources = [os.path.join(log_dir, sys_monitor.BIN_FILE)]
+    sources += [
+        os.path.join(log_dir, channel + "_monitor.log")
+        for channel in SYS_CHANNELS
+    ]
+    if _newer_than(_store_path(log_dir, "sys_" + names[-1]), sources):
+        columns = load_columns(log_dir, ["sys_" + name for name in names])
+        return {name[4:]: column for name, column in columns.items()}
+
+    columns = {}
+    if os.path.exists(sources[0]):
+        records = _memmap_records(sources[0], sys_monitor.RECORD_SIZE)
+        for channel in SYS_CHANNELS:
+            values = records[:, sys_monitor.COLUMNS.index(channel)]
+            valid = ~np.isnan(values)
+            columns[channel + "_timestamp"] = records[valid, 0]
+            columns[channel] = values[valid]
+    else:
+        for channel, source in zip(SYS_CHANNELS, sources[1:]):
+            timestamps, values = _parse_text_log(source)
+            columns[channel + "_timestamp"] = timestamps
+            columns[channel] = values
+    save_columns(log_dir,
+                 {"sys_" + name: column
+                  for name, column in columns.items()})
+    return columns
+
+
+def vendor_columns(log_dir, vendor):
+    '''Return {"timestamp", "device", "temp", "power", "mem", "mem_total"}
+       columns of the vendor telemetry in log_dir, None if the vendor
+       monitor doesn't record telemetry.'''
+    names = ["timestamp", "device"] + VENDOR_CHANNELS + ["mem_total"]
+    telemetry_file = telemetry.telemetry_file_of(log_dir, vendor)
+    if not os.path.exists(telemetry_file):
+        return None
+    if _newer_than(_store_path(log_dir, "vendor_" + names[-1]),
+                   [telemetry_file]):
+        columns = load_columns(log_dir, ["vendor_" + name for name in names])
+        return {name[7:]: column for name, column in columns.items()}
+
+    records = _memmap_records(telemetry_file, telemetry.RECORD_SIZE)
+    columns = {
+        name: records[:, telemetry.FIELDS.index(name)]
+        for name in names
+    }
+    save_columns(log_dir,
+                 {"vendor_" + name: column
+                  for name, column in columns.items()})
+    return columns
+
+
+def split_devices(columns, channel, nproc):
+    '''Return [(timestamps, values), ...] of channel of devices 0..nproc-1
+       in vendor columns.'''
+    device = np.asarray(columns["device"])
+    result = []
+    for index in range(nproc):
+        mask = device == index
+        values = np.asarray(columns[channel])[mask]
+        valid = ~np.isnan(values)
+        result.append((np.asarray(columns["timestamp"])[mask][valid],
+                       values[valid]))
+    return result
+
+
+def summarize(series, upper_half=None, percentiles=PERCENTILES):
+    '''Summarize many series in one vectorized pass.
+       series is a list of (timestamps, values), timestamps can be None.
+       If upper_half[i] is set, only the samples of series i in the upper
+       half of its range are summarized, e.g. power of the busy phase.
+       Return a dict of arrays, one item per series: count, mean, max, min,
+       std, p<percentile> and energy(integral of values over seconds, in
+       joules for power in watts). Empty series get NaN.
+    '''
+    num = len(series)
+    if upper_half is not None and len(upper_half) != num:
+        raise ValueError("upper_half has {} flags for {} series".format(
+            len(upper_half), num))
+    lengths = np.array([len(values) for _, values in series], dtype=np.int64)
+    seg = np.repeat(np.arange(num), lengths)
+    values = np.concatenate([np.asarray(v, dtype=np.float64)
+                             for _, v in series]) if num else np.zeros(0)
+    timestamps = np.concatenate([
+        np.asarray(t, dtype=np.float64) if t is not None else np.full(
+            len(v), np.nan) for t, v in series
+    ]) if num else np.zeros(0)
+    valid = ~np.isnan(values)
+    seg, values, timestamps = seg[valid], values[valid], timestamps[valid]
+
+    def order_stats(seg, values):
+        count = np.bincount(seg, minlength=num)
+        order = np.lexsort((values, seg))
+        ordered = values[order]
+        starts = np.concatenate([[0], np.cumsum(count)[:-1]])
+        return count, ordered, starts
+
+    if upper_half is not None and np.any(upper_half):
+        count, ordered, starts = order_stats(seg, values)
+        last = np.maximum(starts + count - 1, 0)
+        middle = np.full(num, -np.inf)
+        has = count > 0
+        if len(ordered):
+            middle[has] = (ordered[starts[has]] + ordered[last[has]]) / 2
+        middle[~np.asarray(upper_half, dtype=bool)] = -np.inf
+        keep = values >= middle[seg]
+        seg, values, timestamps = seg[keep], values[keep], timestamps[keep]
+
+    count, ordered, starts = order_stats(seg, values)
+    has = count > 0
+    safe_count = np.maximum(count, 1)
+    mean = np.bincount(seg, weights=values, minlength=num) / safe_count
+    std = np.sqrt(
+        np.bincount(seg, weights=(values - mean[seg])**2, minlength=num) /
+        safe_count)
+    result = {"count": count}
+    result["mean"] = np.where(has, mean, np.nan)
+    result["std"] = np.where(has, std, np.nan)
+    result["min"] = np.full(num, np.nan)
+    result["max"] = np.full(num, np.nan)
+    result["min"][has] = ordered[starts[has]]
+    result["max"][has] = ordered[starts[has] + count[has] - 1]
+    for q in percentiles:
+        # Linear interpolation, same as np.percentile.
+        pos = (count - 1) * (q / 100.0)
+        low = np.floor(pos).astype(np.int64)
+        high = np.ceil(pos).astype(np.int64)
+        value = np.full(num, np.nan)
+        lo_v = ordered[starts[has] + low[has]]
+        hi_v = ordered[starts[has] + high[has]]
+        value[has] = lo_v + (hi_v - lo_v) * (pos[has] - low[has])
+        result["p" + str(q)] = value
+
+    # Trapezoid integral over consecutive samples of the same series.
+    same = seg[1:] == seg[:-1]
+    dt = np.diff(timestamps)
+    ok = same & ~np.isnan(dt)
+    area = (values[1:] + values[:-1]) / 2 * dt
+    energy = np.bincount(seg[:-1][ok], weights=area[ok], minlength=num)
+    timed = np.bincount(seg[:-1][ok], minlength=num) > 0
+    result["energy"] = np.where(timed, energy, np.nan)
+    return result
+
+
+def summary_row(summary, index):
+    '''Return {stat: float} of series index in a summarize() result.'''
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return {name: float(stats[index]) for name, stats in summary.items()}
@@ -0,0 +1,204 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Streaming parser and sidecar index of the PerfLog lines in rank logs.
+
+A rank log is scanned once through mmap, jumping from one "[PerfLog] "
+prefix to the next, and only the event name of each matching line is read.
+The byte offsets and lengths of the json messages are kept per event name
+in <rank log>.perfidx next to the log. Later queries decode only the
+lines they return, e.g. the STEP_END events between TRAIN_START and
+TRAIN_END, and a log that grew since is indexed from where the last scan
+stopped.
+usage:
+perflog_index.py -f [rank log] -e STEP_END [-a TRAIN_START] [-b TRAIN_END]
+'''
+
+import os
+import sys
+import json
+import mmap
+import bisect
+from argparse import ArgumentParser
+
+PREFIX = b"[PerfLog] "
+EVENT_HEAD = b'{"event": "'
+INDEX_SUFFIX = ".perfidx"
+INDEX_VERSION = 1
+
+
+def _scan(data, start, end):
+    '''Return {event: [[offset, length], ...]} of the PerfLog messages of
+       the complete lines in data[start:end], and where the scan stopped.'''
+    events = {}
+    pos = start
+    stop = start
+    while True:
+        pos = data.find(PREFIX, pos, end)
+        if pos < 0:
+            # No more messages, skip the complete lines left.
+            stop = max(stop, data.rfind(b"\n", stop, end) + 1)
+            break
+        begin = pos + len(PREFIX)
+        line_end = data.find(b"\n", begin, end)
+        if line_end < 0:
+            # An incomplete last line, scan it again next time.
+            stop = max(stop, data.rfind(b"\n", stop, pos) + 1)
+            break
+        stop = line_end + 1
+        pos = stop
+        length = line_end - begin
+        if data[line_end - 1:line_end] == b"\r":
+            length -= 1
+        if data[begin:begin + len(EVENT_HEAD)] == EVENT_HEAD:
+            name_begin = begin + len(EVENT_HEAD)
+            name_end = data.find(b'"', name_begin, line_end)
+            if name_end < 0:
+                continue
+            name = data[name_begin:name_end].decode("utf-8", "replace")
+        else:
+            # Not written by PerfLogger._encode_message, decode it.
+            try:
+                name = json.loads(data[begin:begin + length])["event"]
+            except (ValueError, KeyError, TypeError):
+                continue
+        events.setdefault(name, []).append([begin, length])
+    return events, stop
+
+
+class PerfLogIndex:
+    '''Index of the PerfLog messages of a rank log.'''
+
+    def __init__(self, log_file, save=True):
+        self.log_file = log_file
+        self.index_file = log_file + INDEX_SUFFIX
+        self.save = save
+        self.events = {}
+        self.scanned = 0
+        self.update()
+
+    def _load(self):
+        try:
+            with open(self.index_file, "r") as file_d:
+                index = json.load(file_d)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != INDEX_VERSION or \
+                index.get("scanned", 0) > os.path.getsize(self.log_file):
+            return
+        self.events = index["events"]
+        self.scanned = index["scanned"]
+
+    def _dump(self):
+        tmp_file = self.index_file + ".tmp"
+        try:
+            with open(tmp_file, "w") as file_d:
+                json.dump(
+                    {
+                        "version": INDEX_VERSION,
+                        "scanned": self.scanned,
+                        "events": self.events
+                    }, file_d)
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            # The index is only a cache, logs may be read-only.
+            pass
+
+    def update(self):
+        '''Load the sidecar index, and scan the part of the log after it.'''
+        if self.scanned == 0:
+            self._load()
+        size = os.path.getsize(self.log_file)
+        if size <= self.scanned:
+            return
+        with open(self.log_file, "rb") as file_d:
+            with mmap.mmap(file_d.fileno(), 0,
+                           access=mmap.ACCESS_READ) as data:
+                events, stop = _scan(data, self.scanned, size)
+        if stop == self.scanned:
+            return
+        for name, items in events.items():
+            self.events.setdefault(name, []).extend(items)
+        self.scanned = stop
+        if self.save:
+            self._dump()
+
+    def names(self):
+        '''Return the event names in the log.'''
+        return list(self.events.keys())
+
+    def count(self, name):
+        '''Return how many times event name is in the log.'''
+        return len(self.events.get(name, []))
+
+    def offsets(self, name, after=None, before=None):
+        '''Return [[offset, length], ...] of event name, only the ones after
+           the first event after and before the last event before if set.'''
+        items = self.events.get(name, [])
+        low, high = 0, len(items)
+        if after is not None:
+            if after not in self.events:
+                return []
+            low = bisect.bisect_left(items, [self.events[after][0][0], 0])
+        if before is not None:
+            if before not in self.events:
+                return []
+            high = bisect.bisect_left(items, [self.events[before][-1][0], 0])
+        return items[low:high]
+
+    def read(self, items):
+        '''Yield decoded messages at [[offset, length], ...].'''
+        if len(items) == 0:
+            return
+        with open(self.log_file, "rb") as file_d:
+            with mmap.mmap(file_d.fileno(), 0,
+                           access=mmap.ACCESS_READ) as data:
+                for offset, length in items:
+                    try:
+                        yield json.loads(data[offset:offset + length])
+                    except ValueError:
+                        continue
+
+    def query(self, name, after=None, before=None):
+        '''Return decoded messages of event name, see offsets().'''
+        return list(self.read(self.offsets(name, after, before)))
+
+    def messages(self, names=None):
+        '''Return decoded messages of names, all events if None, in the
+           order of the log.'''
+        names = self.names() if names is None else names
+        items = []
+        for name in names:
+            items += self.events.get(name, [])
+        items.sort()
+        return list(self.read(items))
+
+
+def _parse_args():
+    '''Get command args from input. '''
+    parser = ArgumentParser(description="Query PerfLog events of a log. ")
+    parser.add_argument("-f", type=str, required=True, help="rank log file")
+    parser.add_argument("-e",
+                        type=str,
+                        default=None,
+                        help="event name, print counts of all if not set")
+    parser.add_argument("-a", type=str, default=None, help="after event")
+    parser.add_argument("-b", type=str, default=None, help="before event")
+    return parser.parse_args()
+
+
+def main():
+    '''Print the event counts or the messages of an event.'''
+    args = _parse_args()
+    index = PerfLogIndex(args.f)
+    if args.e is None:
+        for name in index.names():
+            print(name + "\t" + str(index.count(name)))
+    else:
+        for message in index.read(index.offsets(args.e, args.a, args.b)):
+            print(json.dumps(message))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Phase-aware analysis of the monitor logs of a training case round.
+
+Phase windows are cut from the PerfLog events in the rank logs:
+    launch    container start, monitors start ... INIT_START
+    init      INIT_START ... INIT_END
+    prepare   INIT_END ... TRAIN_START, e.g. data loading, init evaluation
+    train     TRAIN_START ... TRAIN_END
+    finish    TRAIN_END ... monitors stop, e.g. final evaluation
+Monitor samples of every host are sliced by the windows and summarized per
+phase. Energy per sample/token is reported for the train phase only.
+Rounds of concurrent cases share the monitors of the run: their samples
+are read from the shared monitor dir, sliced by the time window of the
+round and by the devices of the case. The system power of a shared host
+is summarized, but not charged to the samples/tokens of one case.
+usage:
+phase_analyzer.py -d [case round log dir] -v [vendor]
+                  [-m [shared monitor dir] -w [start,end] -g [devices]]
+'''
+
+import os
+import sys
+import glob
+import json
+import warnings
+from argparse import ArgumentParser
+
+import numpy as np
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH))
+import monitor_store
+import perflog_index
+
+# Events that cut the phase windows.
+PHASE_EVENTS = ["INIT_START", "INIT_END", "TRAIN_START", "TRAIN_END",
+                "FINISHED"]
+PHASES = ["launch", "init", "prepare", "train", "finish"]
+PHASE_FILE = "phase_summary.json"
+# Channels in watts, their energy is reported.
+POWER_CHANNELS = ["chip_power", "sys_pwr"]
+# Samples(sps) or images(ips) per second in FINISHED, by preference. The
+# raw rate is over the whole train phase.
+SAMPLE_RATE_KEYS = [
+    prefix + suffix for suffix in ["_raw", "_no_eval", "_pure_compute", ""]
+    for prefix in ["throughput(sps)", "throughput(ips)"]
+]
+
+
+def parse_perf_events(log_file, names=None):
+    '''Return [(time in seconds, event name, value), ...] of the PerfLog
+       lines of names in a rank log, all of them if names is None. Only
+       the lines of names are decoded, through the sidecar index.'''
+    events = []
+    for message in perflog_index.PerfLogIndex(log_file).messages(names):
+        try:
+            time_ms = message["metadata"]["time_ms"]
+        except (KeyError, TypeError):
+            continue
+        events.append(
+            (time_ms / 1000.0, message.get("event"), message.get("value")))
+    return events
+
+
+def phase_windows(events):
+    '''Return {phase: [start, end]} in seconds cut from events of all the
+       ranks. Phases whose events are missing are left out.'''
+    first = {}
+    last = {}
+    for timestamp, name, _ in events:
+        first[name] = min(first.get(name, timestamp), timestamp)
+        last[name] = max(last.get(name, timestamp), timestamp)
+
+    train_end = last.get("TRAIN_END", last.get("FINISHED"))
+    bounds = {
+        "launch": (-np.inf, first.get("INIT_START")),
+        "init": (first.get("INIT_START"), last.get("INIT_END")),
+        "prepare": (last.get("INIT_END"), first.get("TRAIN_START")),
+        "train": (first.get("TRAIN_START"), train_end),
+        "finish": (train_end, np.inf),
+    }
+    return {
+        phase: [bounds[phase][0], bounds[phase][1]]
+        for phase in PHASES
+        if None not in bounds[phase] and bounds[phase][0] < bounds[phase][1]
+    }
+
+
+def clip_windows(windows, window):
+    '''Return phase windows clipped to window [start, end], phases out of
+       it are left out.'''
+    clipped = {}
+    for phase, (start, end) in windows.items():
+        start, end = max(start, window[0]), min(end, window[1])
+        if start < end:
+            clipped[phase] = [start, end]
+    return clipped
+
+
+def work_done(finished_info, train_seconds):
+    '''Return (samples, tokens) trained by the whole cluster according to
+       the FINISHED message, None for what is not reported. Counters are
+       preferred, else the rates of SAMPLE_RATE_KEYS over train_seconds.'''
+    samples = None
+    tokens = None
+    if not isinstance(finished_info, dict):
+        return samples, tokens
+    numbers = {
+        key: value
+        for key, value in finished_info.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+    for key in ["num_trained_samples", "trained_samples"]:
+        if samples is None and key in numbers:
+            samples = numbers[key]
+    for key in SAMPLE_RATE_KEYS:
+        if samples is None and key in numbers:
+            samples = numbers[key] * train_seconds
+    for key in ["num_trained_tokens", "trained_tokens"]:
+        if tokens is None and key in numbers:
+            tokens = numbers[key]
+    for key, value in numbers.items():
+        if tokens is None and "tokens_per_second" in key:
+            tokens = value * train_seconds
+    return samples, tokens
+
+
+def _slice(timestamps, values, window):
+    timestamps = np.asarray(timestamps)
+    mask = (timestamps >= window[0]) & (timestamps <= window[1])
+    return timestamps[mask], np.asarray(values)[mask]
+
+
+def analyze_round(round_dir, vendor, monitor_dir=None, devices=None,
+                  window=None):
+    '''Return phase windows, per-host per-phase summaries and train phase
+       energy of a case round log dir. None if no PerfLog events found.
+       Monitor logs of a host are read from monitor_dir if it is set, only
+       the chips in devices and the samples in window [start, end] count.'''
+    events = []
+    for log_file in sorted(glob.glob(os.path.join(round_dir, "*",
+                                                  "rank*.out.log"))):
+        events += parse_perf_events(log_file, PHASE_EVENTS)
+    windows = phase_windows(events)
+    if window is not None:
+        windows = clip_windows(windows, window)
+    if len(windows) == 0:
+        return None
+
+    series = []
+    series_keys = []
+    for host_dir in sorted(glob.glob(os.path.join(round_dir,
+                                                  "*_noderank*"))):
+        host = os.path.basename(host_dir)
+        if monitor_dir is not None:
+            host_dir = os.path.join(monitor_dir, host)
+        columns = monitor_store.vendor_columns(host_dir, vendor)
+        device_series = {}
+        if columns is not None:
+            nproc = int(np.asarray(columns["device"]).max()) + 1
+            for channel in monitor_store.VENDOR_CHANNELS:
+                items = monitor_store.split_devices(columns, channel, nproc)
+                if devices is not None:
+                    items = [items[i] for i in devices if i < nproc]
+                device_series["chip_" + channel] = items
+        try:
+            sys_columns = monitor_store.sys_columns(host_dir)
+            device_series["sys_pwr"] = [(sys_columns["pwr_timestamp"],
+                                         sys_columns["pwr"])]
+        except OSError:
+            pass
+        for phase, window in windows.items():
+            for channel, items in device_series.items():
+                for timestamps, values in items:
+                    series.append(_slice(timestamps, values, window))
+                    series_keys.append((host, phase, channel))
+
+    # Devices of a host are summarized together, energy is their sum.
+    summary = monitor_store.summarize(series)
+    key_indexes = {}
+    for i, key in enumerate(series_keys):
+        key_indexes.setdefault(key, []).append(i)
+    hosts = {}
+    for (host, phase, channel), index in key_indexes.items():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            stats = {
+                "mean": np.nanmean(summary["mean"][index]),
+                "max": np.nanmax(summary["max"][index]),
+            }
+            if channel in POWER_CHANNELS:
+                energy = summary["energy"][index]
+                stats["energy"] = np.nansum(energy) if np.any(
+                    np.isfinite(energy)) else np.nan
+        # Unknown values are saved as null.
+        hosts.setdefault(host, {}).setdefault(phase, {})[channel] = {
+            name: float(value) if np.isfinite(value) else None
+            for name, value in stats.items()
+        }
+
+    result = {
+        "phases": {
+            phase: [bound if np.isfinite(bound) else None for bound in window]
+            for phase, window in windows.items()
+        },
+        "hosts": hosts
+    }
+    if "train" in windows:
+        train_seconds = windows["train"][1] - windows["train"][0]
+        finished = [value for _, name, value in events if name == "FINISHED"]
+        samples, tokens = work_done(finished[-1] if finished else None,
+                                    train_seconds)
+        train = {"seconds": train_seconds, "samples": samples,
+                 "tokens": tokens}
+        for channel in POWER_CHANNELS:
+            if channel.startswith("sys_") and devices is not None:
+                continue
+            energies = [
+                phases["train"][channel]["energy"]
+                for phases in hosts.values()
+                if channel in phases.get("train", {})
+                and phases["train"][channel]["energy"] is not None
+            ]
+            if len(energies) == 0:
+                continue
+            energy = sum(energies)
+            train[channel + "_energy"] = energy
+            if samples:
+                train[channel + "_energy_per_sample"] = energy / samples
+            if tokens:
+                train[channel + "_energy_per_token"] = energy / tokens
+        result["train"] = train
+    return result
+
+
+def write_round_summary(round_dir, vendor, monitor_dir=None, devices=None,
+                        window=None):
+    '''Analyze a case round and save the result as phase_summary.json in
+       round_dir. Return the result, None if there is nothing to analyze.'''
+    result = analyze_round(round_dir, vendor, monitor_dir, devices, window)
+    if result is not None:
+        with open(os.path.join(round_dir, PHASE_FILE), "w") as file_d:
+            json.dump(result, file_d, indent=2)
+    return result
+
+
+def _parse_args():
+    '''Get command args from input. '''
+    parser = ArgumentParser(description="Phase-aware monitor analysis. ")
+    parser.add_argument("-d",
+                        type=str,
+                        required=True,
+                        help="log dir of a case round")
+    parser.add_argument("-v", type=str, default="nvidia", help="vendor")
+    parser.add_argument("-m",
+                        type=str,
+                        default=None,
+                        help="shared monitor dir of concurrent cases")
+    parser.add_argument("-w",
+                        type=str,
+                        default=None,
+                        help="time window of the round, as start,end")
+    parser.add_argument("-g",
+                        type=str,
+                        default=None,
+                        help="devices of the case, as 0,1,...")
+    return parser.parse_args()
+
+
+def main():
+    '''Print the phase summary of a case round.'''
+    args = _parse_args()
+    window = None if args.w is None else [
+        float(bound) for bound in args.w.split(",")
+    ]
+    devices = None if args.g is None else [
+        int(device) for device in args.g.split(",")
+    ]
+    result = write_round_summary(args.d, args.v, args.m, devices, window)
+    if result is None:
+        print("Can't find PerfLog events in", args.d)
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Statistics of the repeated rounds of a training case.
+
+The FINISHED PerfLog record of every round, e.g. throughput(ips)_raw,
+e2e_time, is read from the rank logs of noderank 0. For each metric the
+mean, sample std, min, max, coefficient of variation(CV) and a Student's t
+confidence interval of the mean are reported. Metrics whose CV is above a
+threshold are flagged unstable.
+usage:
+repeat_stats.py -d [case log dir] [-c 0.95] [-t 0.05]
+'''
+
+import os
+import sys
+import glob
+import json
+import math
+from argparse import ArgumentParser
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH))
+import phase_analyzer
+import results_db
+
+SUMMARY_FILE = "repeat_summary.json"
+CONFIDENCE = 0.95
+CV_THRESHOLD = 0.05
+
+
+def round_dirs(case_dir):
+    '''Return the round log dirs of a case, ordered by round.'''
+    rounds = glob.glob(os.path.join(case_dir, "round*"))
+    return sorted((path for path in rounds
+                   if os.path.basename(path)[5:].isdigit()),
+                  key=lambda path: int(os.path.basename(path)[5:]))
+
+
+def round_result(round_dir):
+    '''Return {metric: value} of the FINISHED record of a round, None if
+       the round didn't finish.'''
+    log_files = sorted(glob.glob(
+        os.path.join(round_dir, "*_noderank0", "rank*.out.log")))
+    for log_file in log_files:
+        for _, _, value in phase_analyzer.parse_perf_events(
+                log_file, ["FINISHED"]):
+            if isinstance(value, dict):
+                return dict(results_db.numeric_items(value))
+    return None
+
+
+def t_critical(confidence, dof):
+    '''Return t such that the two-sided tail of Student's t distribution
+       with dof is 1 - confidence.'''
+    alpha = 1.0 - confidence
+    low, high = 0.0, 1.0
+    while results_db.t_pvalue(high, dof) > alpha:
+        high *= 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        if results_db.t_pvalue(middle, dof) > alpha:
+            low = middle
+        else:
+            high = middle
+    return high
+
+
+def aggregate(values, confidence=CONFIDENCE):
+    '''Return count, mean, std, min, max, cv, ci_low, ci_high of values.
+       std, cv and the interval are None with less than 2 values.'''
+    count = len(values)
+    mean = sum(values) / count
+    stats = {
+        "count": count,
+        "mean": mean,
+        "std": None,
+        "min": min(values),
+        "max": max(values),
+        "cv": None,
+        "ci_low": None,
+        "ci_high": None
+    }
+    if count < 2:
+        return stats
+    std = math.sqrt(sum((v - mean)**2 for v in values) / (count - 1))
+    half_width = t_critical(confidence, count - 1) * std / math.sqrt(count)
+    stats.update(std=std,
+                 cv=std / abs(mean) if mean != 0 else None,
+                 ci_low=mean - half_width,
+                 ci_high=mean + half_width)
+    return stats
+
+
+def ci_relative_width(stats):
+    '''Return the half width of the confidence interval relative to the
+       mean, None if it's unknown.'''
+    if stats["ci_high"] is None or stats["mean"] == 0:
+        return None
+    return (stats["ci_high"] - stats["mean"]) / abs(stats["mean"])
+
+
+def case_summary(case_dir, confidence=CONFIDENCE, cv_threshold=CV_THRESHOLD):
+    '''Return {"rounds": [...], "metrics": {metric: stats}} of all the
+       finished rounds of a case. stats has "unstable" set if its CV is
+       above cv_threshold.'''
+    rounds = []
+    values = {}
+    for round_dir in round_dirs(case_dir):
+        result = round_result(round_dir)
+        if result is None:
+            continue
+        rounds.append(os.path.basename(round_dir))
+        for metric, value in result.items():
+            values.setdefault(metric, []).append(value)
+    metrics = {}
+    for metric, metric_values in values.items():
+        stats = aggregate(metric_values, confidence)
+        stats["unstable"] = stats["cv"] is not None and \
+            stats["cv"] > cv_threshold
+        metrics[metric] = stats
+    return {"rounds": rounds, "confidence": confidence, "metrics": metrics}
+
+
+def write_case_summary(case_dir,
+                       confidence=CONFIDENCE,
+                       cv_threshold=CV_THRESHOLD):
+    '''Summarize the rounds of a case and save the result as
+       repeat_summary.json in case_dir. Return the result.'''
+    result = case_summary(case_dir, confidence, cv_threshold)
+    with open(os.path.join(case_dir, SUMMARY_FILE), "w") as file_d:
+        json.dump(result, file_d, indent=2)
+    return result
+
+
+def _parse_args():
+    '''Get command args from input. '''
+    parser = ArgumentParser(description="Statistics of repeated rounds. ")
+    parser.add_argument("-d", type=str, required=True, help="case log dir")
+    parser.add_argument("-c",
+                        type=float,
+                        default=CONFIDENCE,
+                        help="confidence of the interval")
+    parser.add_argument("-t",
+                        type=float,
+                        default=CV_THRESHOLD,
+                        help="CV above which a metric is unstable")
+    return parser.parse_args()
+
+
+def main():
+    '''Print the repeat statistics of a case.'''
+    args = _parse_args()
+    result = write_case_summary(args.d, args.c, args.t)
+    if len(result["rounds"]) == 0:
+        print("No finished rounds found in", args.d)
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
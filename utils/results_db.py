@@ -0,0 +1,468 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Local result store of all the benchmarks, and regression detection.
+
+Results of every runner are ingested into one sqlite table, one row per
+value: run id, source, vendor, chip, case, config hash, metric, sample and
+value. Samples are the ranks, rounds or repeats that measured a metric in
+a run, so that runs can be compared with a significance test.
+An operation result log has one latency per op, dtype and shape, unless
+the op was run again into the same log. To compare operations, ingest
+several runs and compare vendor selectors, which pool all the runs of a
+vendor; a run selector leaves them untested.
+Ingestors:
+    training   PerfLog FINISHED events in <run>/<case>/round*/*/rank*.log
+    base       detail_result.json of base/run.py
+    operation  result.json of operation/benchmarks/drivers/result_log.py
+    inference  "Finish Info" lines in <run>/<case>/*/container.out.log
+usage:
+results_db.py -o ingest -s training -p [run log dir] -v nvidia [-c A100]
+results_db.py -o query [-r run id] [-k case]
+results_db.py -o compare -b run:[run id]|vendor:[vendor] -n run:...|vendor:...
+'''
+
+import os
+import re
+import ast
+import sys
+import json
+import glob
+import math
+import time
+import sqlite3
+import hashlib
+from argparse import ArgumentParser
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH))
+sys.path.append(os.path.join(CURR_PATH, "../operation/benchmarks/drivers"))
+import phase_analyzer
+import result_log
+
+DEFAULT_DB = "flagperf_results.db"
+SOURCES = ["training", "base", "operation", "inference"]
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    run_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    vendor TEXT NOT NULL,
+    chip TEXT,
+    case_name TEXT NOT NULL,
+    config_hash TEXT,
+    metric TEXT NOT NULL,
+    sample INTEGER NOT NULL,
+    value REAL NOT NULL,
+    ingest_time REAL
+);
+CREATE INDEX IF NOT EXISTS results_metric
+    ON results (case_name, metric, run_id);
+CREATE UNIQUE INDEX IF NOT EXISTS results_unique
+    ON results (run_id, source, vendor, case_name, config_hash, metric,
+                sample);
+'''
+# Metrics measured in these units, or whose names without the unit end with
+# LOWER_IS_BETTER_SUFFIXES, contain "latency" or start with "sys_", are
+# better when lower, e.g. e2e_time, p_infer_time(s), warmup_latency,
+# kerneltime, sys_pwr_mean. The others, e.g. throughput(sps),
+# tokens_per_second, ctflops, bandwidth(GB/s), capacity(GiB), accuracy, are
+# better when higher.
+LOWER_IS_BETTER_UNITS = ["s", "ms", "us", "ns", "j", "w"]
+LOWER_IS_BETTER_SUFFIXES = ("time", "power", "energy", "usage")
+METRIC_UNIT = re.compile(r"\(([^)]*)\)")
+# Result lines printed by base benchmarks, e.g.
+# [FlagPerf Result]Rank 0's computation-FP16=312.5TFLOPS
+BASE_RESULT = re.compile(r"FlagPerf Result\].*?([\w\-]+)=\s*"
+                         r"([-+\d.eE]+)\s*([A-Za-z/%]*)")
+# Items of the inference Finish Info that are configs, not results.
+INFERENCE_CONFIGS = ["vendor", "compiler", "precision", "batchsize", "flops"]
+
+
+def config_hash(config):
+    '''Return a short hash of a json serializable case config.'''
+    return hashlib.sha1(json.dumps(config,
+                                   sort_keys=True).encode()).hexdigest()[:12]
+
+
+def connect(db_path=DEFAULT_DB):
+    '''Open the result store, create the schema if it's new.'''
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def insert_rows(conn, rows):
+    '''Insert rows of (run_id, source, vendor, chip, case_name, config_hash,
+       metric, sample, value). Values ingested again replace the old ones.
+       Return the number of rows.'''
+    now = time.time()
+    conn.executemany(
+        "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [tuple(row) + (now, ) for row in rows])
+    conn.commit()
+    return len(rows)
+
+
+def numeric_items(info):
+    '''Yield (name, float) of the numeric items of a dict, numbers in
+       strings like "45.1%" included.'''
+    for key, value in info.items():
+        if isinstance(value, bool):
+            continue
+        if isinstance(value, str):
+            try:
+                value = float(value.rstrip("%"))
+            except ValueError:
+                continue
+        if isinstance(value, (int, float)) and math.isfinite(value):
+            yield key, float(value)
+
+
+def training_rows(run_dir, vendor, chip=None, run_id=None):
+    '''Return rows of the FINISHED PerfLog events of a training run, one
+       sample per round and rank log. Cases are model:framework:nnodes:nproc,
+       so that runs on different chips can be compared.'''
+    run_id = run_id or os.path.basename(os.path.normpath(run_dir))
+    rows = []
+    for case_dir in sorted(glob.glob(os.path.join(run_dir, "*:*"))):
+        case_info = os.path.basename(case_dir).split(":")
+        if len(case_info) < 5:
+            continue
+        case = ":".join(case_info[0:2] + case_info[3:5])
+        case_chip = chip or case_info[2]
+        # The repeat count doesn't change the case config.
+        case_hash = config_hash(case.split(":"))
+        sample = 0
+        for round_dir in sorted(glob.glob(os.path.join(case_dir, "round*"))):
+            for log_file in sorted(
+                    glob.glob(os.path.join(round_dir, "*", "rank*.out.log"))):
+                for _, name, value in phase_analyzer.parse_perf_events(
+                        log_file, ["FINISHED"]):
+                    if name != "FINISHED" or not isinstance(value, dict):
+                        continue
+                    for metric, number in numeric_items(value):
+                        rows.append((run_id, "training", vendor, case_chip,
+                                     case, case_hash, metric, sample, number))
+                    sample += 1
+    return rows
+
+
+def base_rows(detail_file, vendor, chip=None, run_id=None):
+    '''Return rows of detail_result.json of base/run.py, one sample per
+       rank of every host.'''
+    run_id = run_id or os.path.basename(os.path.dirname(
+        os.path.abspath(detail_file)))
+    with open(detail_file, "r") as file_d:
+        detail = json.load(file_d)
+    rows = []
+    sample = 0
+    for host, host_result in detail.items():
+        case = None
+        for line in host_result.get("flagperf", []):
+            match = BASE_RESULT.search(line)
+            if match is None:
+                continue
+            case, value, unit = match.groups()
+            metric = case + ("(" + unit + ")" if unit else "")
+            rows.append((run_id, "base", vendor, chip, case,
+                         config_hash([case]), metric, sample, float(value)))
+            sample += 1
+        if case is None:
+            continue
+        for channel in ["pwr", "cpu", "mem"]:
+            mean = host_result.get(channel, {}).get("mean")
+            if mean is not None and math.isfinite(mean):
+                rows.append((run_id, "base", vendor, chip, case,
+                             config_hash([case]), "sys_" + channel + "_mean",
+                             sample, mean))
+    return rows
+
+
+def operation_rows(result_file, vendor, chip=None, run_id=None):
+    '''Return rows of result.json of the operation benchmarks, one case per
+       op and dtype, one config per shape. Every record appended with a
+       metric is a sample of it, so ops run again into the log are
+       repeats.'''
+    run_id = run_id or os.path.basename(os.path.dirname(
+        os.path.abspath(result_file)))
+    rows = []
+    samples = {}
+    for item in result_log.iter_records(result_file):
+        case = str(item.get("op_name")) + "_" + str(item.get("dtype"))
+        shape_hash = config_hash([case, item.get("shape_detail")])
+        for metric, value in numeric_items(item):
+            key = (case, shape_hash, metric)
+            samples[key] = samples.get(key, -1) + 1
+            rows.append((run_id, "operation", vendor, chip, case, shape_hash,
+                         metric, samples[key], value))
+    return rows
+
+
+def inference_rows(run_dir, vendor, chip=None, run_id=None):
+    '''Return rows of the "Finish Info" of the inference cases of a run.'''
+    run_id = run_id or os.path.basename(os.path.normpath(run_dir))
+    rows = []
+    for log_file in sorted(
+            glob.glob(os.path.join(run_dir, "*", "*", "container.out.log"))):
+        case = os.path.basename(os.path.dirname(os.path.dirname(log_file)))
+        with open(log_file, "r", errors="replace") as file_d:
+            for line in file_d:
+                if "Finish Info" not in line or "{" not in line:
+                    continue
+                try:
+                    info = ast.literal_eval("{" + line.split("{", 1)[1])
+                except (ValueError, SyntaxError):
+                    continue
+                case_hash = config_hash([
+                    case,
+                    info.get("compiler"),
+                    info.get("precision"),
+                    info.get("batchsize")
+                ])
+                for metric, value in numeric_items(info):
+                    if metric in INFERENCE_CONFIGS:
+                        continue
+                    rows.append((run_id, "inference", vendor, chip, case,
+                                 case_hash, metric.lstrip("*"), 0, value))
+                break
+    return rows
+
+
+INGESTORS = {
+    "training": training_rows,
+    "base": base_rows,
+    "operation": operation_rows,
+    "inference": inference_rows,
+}
+
+
+def ingest(conn, source, path, vendor, chip=None, run_id=None):
+    '''Ingest results of a source at path. Return the number of rows.'''
+    return insert_rows(conn, INGESTORS[source](path, vendor, chip, run_id))
+
+
+def _parse_selector(selector):
+    '''Return the sql condition and args of "run:<id>" or "vendor:<name>".'''
+    kind, _, value = selector.partition(":")
+    if kind not in ["run", "vendor"] or value == "":
+        raise ValueError("Selector should be run:<run id> or vendor:<name>")
+    return ("run_id" if kind == "run" else "vendor") + " = ?", value
+
+
+def samples_of(conn, selector, case=None):
+    '''Return {(case, config hash, metric): [value, ...]} of the selected
+       results.'''
+    condition, value = _parse_selector(selector)
+    sql = "SELECT case_name, config_hash, metric, value FROM results " \
+          "WHERE " + condition
+    args = [value]
+    if case is not None:
+        sql += " AND case_name = ?"
+        args.append(case)
+    samples = {}
+    for case_name, case_hash, metric, number in conn.execute(sql, args):
+        samples.setdefault((case_name, case_hash, metric), []).append(number)
+    return samples
+
+
+def _betacf(a, b, x):
+    '''Continued fraction of the incomplete beta function.'''
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, 201):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < 1e-12:
+            break
+    return h
+
+
+def _betainc(a, b, x):
+    '''Regularized incomplete beta function I_x(a, b).'''
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+        a * math.log(x) + b * math.log(1.0 - x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def t_pvalue(t, dof):
+    '''Return the two-sided p value of t in Student's t distribution.'''
+    return _betainc(dof / 2.0, 0.5, dof / (dof + t * t))
+
+
+def welch_test(base, new):
+    '''Return (t, two-sided p value) of Welch's t-test, p is None if a side
+       has less than 2 samples.'''
+    n1, n2 = len(base), len(new)
+    if n1 < 2 or n2 < 2:
+        return None, None
+    m1, m2 = sum(base) / n1, sum(new) / n2
+    v1 = sum((v - m1)**2 for v in base) / (n1 - 1)
+    v2 = sum((v - m2)**2 for v in new) / (n2 - 1)
+    se2 = v1 / n1 + v2 / n2
+    if se2 == 0:
+        return None, 0.0 if m1 != m2 else 1.0
+    t = (m2 - m1) / math.sqrt(se2)
+    dof = se2**2 / ((v1 / n1)**2 / (n1 - 1) + (v2 / n2)**2 / (n2 - 1))
+    return t, t_pvalue(t, dof)
+
+
+def lower_is_better(metric):
+    '''Return whether smaller values of metric are better.'''
+    metric = metric.lower()
+    unit = METRIC_UNIT.search(metric)
+    if unit is not None and unit.group(1) in LOWER_IS_BETTER_UNITS:
+        return True
+    name = METRIC_UNIT.sub("", metric)
+    return name.startswith("sys_") or "latency" in name or \
+        name.endswith(LOWER_IS_BETTER_SUFFIXES)
+
+
+def compare(conn, base, new, case=None, threshold=0.05, alpha=0.05):
+    '''Compare the metrics measured by both selections. Return a list of
+       dicts of case, config hash, metric, base/new means and samples, change(relative,
+       positive is better), p value, status and regression. A metric
+       regresses if it is worse by more than threshold, and the change is
+       significant at alpha. The change of a metric with a single sample
+       on a side can't be tested, its status is "untested" and it isn't
+       reported as a regression.'''
+    base_samples = samples_of(conn, base, case)
+    new_samples = samples_of(conn, new, case)
+    report = []
+    for key in sorted(set(base_samples) & set(new_samples)):
+        base_values, new_values = base_samples[key], new_samples[key]
+        base_mean = sum(base_values) / len(base_values)
+        new_mean = sum(new_values) / len(new_values)
+        if base_mean == 0:
+            continue
+        change = (new_mean - base_mean) / abs(base_mean)
+        if lower_is_better(key[2]):
+            change = -change
+        _, p_value = welch_test(base_values, new_values)
+        if p_value is None:
+            status = "untested"
+        elif change < -threshold and p_value < alpha:
+            status = "regression"
+        else:
+            status = "ok"
+        report.append({
+            "case": key[0],
+            "config_hash": key[1],
+            "metric": key[2],
+            "base_mean": base_mean,
+            "new_mean": new_mean,
+            "base_samples": len(base_values),
+            "new_samples": len(new_values),
+            "change": change,
+            "p_value": p_value,
+            "status": status,
+            "regression": status == "regression"
+        })
+    return report
+
+
+def _parse_args():
+    '''Get command args from input. '''
+    parser = ArgumentParser(description="FlagPerf result store. ")
+    parser.add_argument("-o",
+                        type=str,
+                        required=True,
+                        choices=["ingest", "query", "compare"],
+                        help="Operation:"
+                        "ingest Add results of a run to the store;"
+                        "query Print results in the store;"
+                        "compare Find regressions between two runs/vendors.")
+    parser.add_argument("-d", type=str, default=DEFAULT_DB, help="store file")
+    parser.add_argument("-s", type=str, choices=SOURCES, help="source")
+    parser.add_argument("-p",
+                        type=str,
+                        help="run log dir(training/inference) or result "
+                        "file(base/operation) to ingest")
+    parser.add_argument("-v", type=str, default="nvidia", help="vendor")
+    parser.add_argument("-c", type=str, default=None, help="chip")
+    parser.add_argument("-r", type=str, default=None, help="run id")
+    parser.add_argument("-k", type=str, default=None, help="case")
+    parser.add_argument("-b", type=str, help="base: run:<id>|vendor:<name>")
+    parser.add_argument("-n", type=str, help="new: run:<id>|vendor:<name>")
+    parser.add_argument("-t",
+                        type=float,
+                        default=0.05,
+                        help="relative slowdown threshold")
+    parser.add_argument("-a",
+                        type=float,
+                        default=0.05,
+                        help="significance level")
+    return parser.parse_args()
+
+
+def main():
+    '''Support command line for ingesting, querying and comparing.'''
+    args = _parse_args()
+    conn = connect(args.d)
+    if args.o == "ingest":
+        if args.s is None or args.p is None:
+            print("-s and -p are needed to ingest.")
+            sys.exit(1)
+        count = ingest(conn, args.s, args.p, args.v, args.c, args.r)
+        print("Ingested", count, "values from", args.p)
+    elif args.o == "query":
+        sql = "SELECT run_id, source, vendor, chip, case_name, metric, " \
+              "COUNT(*), AVG(value) FROM results WHERE 1 = 1"
+        sql_args = []
+        for column, value in [("run_id", args.r), ("case_name", args.k)]:
+            if value is not None:
+                sql += " AND " + column + " = ?"
+                sql_args.append(value)
+        sql += " GROUP BY run_id, source, vendor, chip, case_name, metric"
+        for row in conn.execute(sql, sql_args):
+            print("\t".join(str(item) for item in row))
+    elif args.o == "compare":
+        if args.b is None or args.n is None:
+            print("-b and -n are needed to compare.")
+            sys.exit(1)
+        report = compare(conn, args.b, args.n, args.k, args.t, args.a)
+        regressions = [item for item in report if item["regression"]]
+        for item in report:
+            print("{}[{}]\t{}\t{:.6g} -> {:.6g}\t{:+.2%}\tp={}{}".format(
+                item["case"], item["config_hash"], item["metric"],
+                item["base_mean"],
+                item["new_mean"], item["change"],
+                "n/a" if item["p_value"] is None else
+                "{:.4f}".format(item["p_value"]),
+                "" if item["status"] == "ok" else
+                "\t" + item["status"].upper()))
+        untested = [item for item in report if item["status"] == "untested"]
+        print(len(regressions), "regression(s) in", len(report), "metrics,",
+              len(untested), "untested with a single sample on a side.")
+        if untested and "run:" in args.b + args.n:
+            print("Some metrics, e.g. of operations, have one sample per "
+                  "run. Ingest several runs and compare vendor:<name>.")
+        conn.close()
+        sys.exit(2 if regressions else 0)
+    conn.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Persistent journal of a benchmark run, for resuming it.
+
+Every state change of a case or a case round is appended as one json line
+to run_journal.jsonl in the log dir of the run, and synced to disk, so
+the journal survives the runner being killed at any point. The last
+state recorded for a unit wins. A truncated last line is ignored.
+Case states:  image_ready, logs_collected
+Round states: container_up, started, finished, failed
+usage:
+run_journal.py -d [log dir of the run]
+'''
+
+import os
+import sys
+import json
+import time
+import threading
+from argparse import ArgumentParser
+
+JOURNAL_FILE = "run_journal.jsonl"
+
+IMAGE_READY = "image_ready"
+CONTAINER_UP = "container_up"
+STARTED = "started"
+FINISHED = "finished"
+FAILED = "failed"
+LOGS_COLLECTED = "logs_collected"
+
+
+class RunJournal:
+    '''States of the cases and rounds of a run, backed by a journal file.
+       Safe to record from the threads of concurrent cases.'''
+
+    def __init__(self):
+        self.journal_file = None
+        self.lock = threading.Lock()
+        self.states = {}
+        self.entries = []
+
+    def init(self, log_path):
+        '''Use the journal of the run in log_path, states recorded there
+           before are loaded.'''
+        self.journal_file = os.path.join(log_path, JOURNAL_FILE)
+        self.states = {}
+        self.entries = []
+        if os.path.exists(self.journal_file):
+            self._load()
+
+    def _load(self):
+        line = "\n"
+        with open(self.journal_file, "r") as file_d:
+            for line in file_d:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(entry)
+        # End a line truncated by a kill, so new entries start on their own.
+        if not line.endswith("\n"):
+            with open(self.journal_file, "a") as file_d:
+                file_d.write("\n")
+
+    def _apply(self, entry):
+        self.entries.append(entry)
+        self.states[(entry["case"], entry.get("round"))] = entry["state"]
+
+    def record(self, case, state, round_num=None, **extra):
+        '''Append the state of a case, or of a round of it.'''
+        entry = {
+            "time": time.time(),
+            "case": case,
+            "round": round_num,
+            "state": state
+        }
+        entry.update(extra)
+        with self.lock:
+            os.makedirs(os.path.dirname(self.journal_file), exist_ok=True)
+            with open(self.journal_file, "a") as file_d:
+                file_d.write(json.dumps(entry) + "\n")
+                file_d.flush()
+                os.fsync(file_d.fileno())
+            self._apply(entry)
+
+    def state_of(self, case, round_num=None):
+        '''Return the last state of a case or a round, None if unknown.'''
+        with self.lock:
+            return self.states.get((case, round_num))
+
+    def round_finished(self, case, round_num):
+        '''Return whether a round of the case finished in the run.'''
+        return self.state_of(case, round_num) == FINISHED
+
+    def case_finished(self, case, repeat):
+        '''Return whether all the rounds of the case finished.'''
+        return all(
+            self.round_finished(case, count)
+            for count in range(1, repeat + 1))
+
+    def last_round(self, case):
+        '''Return the last round of the case recorded, 0 if none.'''
+        with self.lock:
+            return max((round_num for (unit, round_num) in self.states
+                        if unit == case and round_num is not None),
+                       default=0)
+
+    def last_run(self, case, round_num):
+        '''Return (container_up entry, end time) of the last run of a round,
+           end time None if it didn't end. None if no container came up.'''
+        with self.lock:
+            entries = [
+                entry for entry in self.entries
+                if entry["case"] == case and entry.get("round") == round_num
+            ]
+        ups = [entry for entry in entries if entry["state"] == CONTAINER_UP]
+        if len(ups) == 0:
+            return None
+        ends = [
+            entry["time"] for entry in entries
+            if entry["state"] in (FINISHED, FAILED)
+            and entry["time"] >= ups[-1]["time"]
+        ]
+        return ups[-1], ends[-1] if ends else None
+
+    def summary(self):
+        '''Return {case: {round: state}}, round None for case states.'''
+        result = {}
+        with self.lock:
+            for (case, round_num), state in self.states.items():
+                result.setdefault(case, {})[round_num] = state
+        return result
+
+
+def _parse_args():
+    '''Get command args from input. '''
+    parser = ArgumentParser(description="Show the journal of a run. ")
+    parser.add_argument("-d",
+                        type=str,
+                        required=True,
+                        help="log dir of the run")
+    return parser.parse_args()
+
+
+def main():
+    '''Print the last states of the cases and rounds of a run.'''
+    args = _parse_args()
+    journal = RunJournal()
+    journal.init(args.d)
+    if len(journal.entries) == 0:
+        print("No journal found in", args.d)
+        sys.exit(1)
+    for case, states in journal.summary().items():
+        print(case)
+        for round_num, state in sorted(states.items(),
+                                       key=lambda item: item[0] or 0):
+            print("\t" + ("case" if round_num is None else "round" +
+                          str(round_num)) + "\t" + state)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,14 +10,164 @@ Usage:  python3 sys-monitor.py -o operation -l [log_path]
 import os
 import sys
 import time
+import glob
 import signal
 import atexit
 import argparse
-import schedule
 import datetime
-from multiprocessing import Process
+import threading
+from array import array
+
+CURR_PATH = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.join(CURR_PATH))
 from run_cmd import run_cmd_wait as rcw
 
+# Columns of one sample in sys_monitor.bin, each is a native float64.
+# Values that are not sampled at that moment are NaN.
+COLUMNS = ["timestamp", "cpu", "mem", "pwr"]
+RECORD_SIZE = len(COLUMNS)
+# Samples kept in memory before they are appended to sys_monitor.bin.
+RING_SAMPLES = 256
+# Max seconds between two appends, so that a crashed run keeps its logs.
+FLUSH_SECONDS = 10
+# Max seconds that stop() waits for the daemon to write its last samples.
+STOP_TIMEOUT = 60
+BIN_FILE = "sys_monitor.bin"
+HWMON_PATH = "/sys/class/hwmon"
+# The hwmon device that meters the power of the whole system. Power sensors
+# of other hwmon devices meter a component, e.g. a cpu package or a gpu.
+SYSTEM_POWER_HWMON = "acpi_power_meter"
+NAN = float("nan")
+
+
+def read_cpu_times():
+    '''Return (idle, total) jiffies of all the cpus from /proc/stat.'''
+    with open("/proc/stat", "r") as file_d:
+        fields = file_d.readline().split()
+    # user nice system idle iowait irq softirq steal, guest is in user.
+    times = [int(item) for item in fields[1:9]]
+    return times[3], sum(times)
+
+
+def read_mem_usage():
+    '''Return used/total of the system memory from /proc/meminfo.'''
+    meminfo = {}
+    with open("/proc/meminfo", "r") as file_d:
+        for line in file_d:
+            key, value = line.split(":", 1)
+            meminfo[key] = int(value.split()[0])
+    available = meminfo.get("MemAvailable", meminfo["MemFree"])
+    return (meminfo["MemTotal"] - available) / meminfo["MemTotal"]
+
+
+def find_power_sensors(hwmon_path=HWMON_PATH):
+    '''Return power sensor files(in microwatts) of the acpi power meter of
+       the whole system, averages first. Empty if there is no such meter.'''
+    sensors = []
+    for device in sorted(glob.glob(os.path.join(hwmon_path, "hwmon*"))):
+        try:
+            with open(os.path.join(device, "name"), "r") as file_d:
+                name = file_d.read().strip()
+        except OSError:
+            continue
+        if name != SYSTEM_POWER_HWMON:
+            continue
+        sensors += sorted(glob.glob(os.path.join(device, "power*_average")))
+        sensors += sorted(glob.glob(os.path.join(device, "power*_input")))
+    return sensors
+
+
+def read_power(sensors):
+    '''Return the first reading of sensors in watts, NaN if none can be
+       read.'''
+    for sensor in sensors:
+        try:
+            with open(sensor, "r") as file_d:
+                return int(file_d.read()) / 1000000.0
+        except (OSError, ValueError):
+            continue
+    return NAN
+
+
+def read_ipmi_power():
+    '''Return system power in watts read by ipmitool, NaN if failed. The
+       DCMI power reading of the whole system is preferred, the max Watts
+       sensor of the SDR is only a fallback.'''
+    cmd = "ipmitool dcmi power reading | grep -i 'Instantaneous power reading' | awk -F': *' '{sub(/[^0-9]+/,\"\",$2); print $2}'"
+    res, out = rcw(cmd, 10)
+    if res != 0 or out[0].strip() == "":
+        cmd = "ipmitool sdr list|grep -i Watts|awk 'BEGIN{FS = \"|\"}{for (f=1; f <= NF; f+=1) {if ($f ~ /Watts/)" \
+              " {print $f}}}'|awk '{print $1}'|sort -n -r|head -n1"
+        res, out = rcw(cmd, 10)
+    try:
+        return float(out[0].strip())
+    except ValueError:
+        return NAN
+
+
+def read_samples(log_path):
+    '''Return all samples in log_path/sys_monitor.bin as a flat array of
+       float64, RECORD_SIZE values per sample.'''
+    samples = array("d")
+    bin_file = os.path.join(log_path, BIN_FILE)
+    with open(bin_file, "rb") as file_d:
+        data = file_d.read()
+    samples.frombytes(data[0:len(data) - len(data) % (8 * RECORD_SIZE)])
+    return samples
+
+
+def read_series(log_path, index):
+    '''Return [(timestamp, value), ...] of index(cpu, mem or pwr) in
+       log_path/sys_monitor.bin, samples without the value are skipped.'''
+    samples = read_samples(log_path)
+    column = COLUMNS.index(index)
+    series = []
+    for i in range(0, len(samples), RECORD_SIZE):
+        value = samples[i + column]
+        if value == value:
+            series.append((samples[i], value))
+    return series
+
+
+def read_monitor_log(log_path, index):
+    '''Return the values of index(cpu, mem or pwr) sampled in log_path.
+       Read sys_monitor.bin if exists, or the text <index>_monitor.log.
+    '''
+    if os.path.exists(os.path.join(log_path, BIN_FILE)):
+        return [value for _, value in read_series(log_path, index)]
+    monitor_path = os.path.join(log_path, index + "_monitor.log")
+    with open(monitor_path, 'r') as file:
+        return [
+            float(line.split("\t")[1][:-1]) for line in file if "\t" in line
+        ]
+
+
+def append_text_logs(log_path, samples):
+    '''Append samples, a flat array of RECORD_SIZE values per sample, to
+       the <index>_monitor.log text files, in the format of the former shell
+       monitors.'''
+    for column, index in enumerate(COLUMNS[1:], 1):
+        lines = []
+        for i in range(0, len(samples), RECORD_SIZE):
+            value = samples[i + column]
+            if value == value:
+                lines.append(
+                    datetime.datetime.fromtimestamp(samples[i]).strftime(
+                        '%Y-%m-%d-%H:%M:%S') + "\t" + str(value) + "\n")
+        with open(os.path.join(log_path, index + "_monitor.log"), "a") as f:
+            f.writelines(lines)
+
+
+def export_text_logs(log_path):
+    '''Write <index>_monitor.log text files from sys_monitor.bin.'''
+    if not os.path.exists(os.path.join(log_path, BIN_FILE)):
+        return
+    for index in COLUMNS[1:]:
+        text_log = os.path.join(log_path, index + "_monitor.log")
+        if os.path.exists(text_log):
+            os.remove(text_log)
+    append_text_logs(log_path, read_samples(log_path))
+
 
 class Daemon:
     '''
@@ -32,7 +182,7 @@ class Daemon:
                  log_file,
                  err_file,
                  log_path,
-                 rate1=5,
+                 rate1=0.5,
                  rate2=120,
                  stdin=os.devnull,
                  stdout=os.devnull,
@@ -54,6 +204,7 @@ class Daemon:
         self.cpulog = str(log_path + '/cpu_monitor.log')
         self.memlog = str(log_path + '/mem_monitor.log')
         self.pwrlog = str(log_path + '/pwr_monitor.log')
+        self.binlog = os.path.join(log_path, BIN_FILE)
         self.rate1 = rate1
         self.rate2 = rate2
         self.umask = umask
@@ -77,68 +228,67 @@ class Daemon:
 
     def run(self):
         '''
-        NOTE: override the method in subclass
+        Sample cpu and memory usage and power every rate1 seconds in this
+        process. If there is no acpi power meter in sysfs, power is read by
+        ipmitool every rate2 seconds in a thread. Samples are kept in a
+        preallocated ring and appended to sys_monitor.bin and the text logs
+        when it is full or every FLUSH_SECONDS, and when stopped.
         '''
+        ring = array("d", [NAN] * (RING_SAMPLES * RECORD_SIZE))
+        state = {
+            "count": 0,
+            "ipmi_pwr": NAN,
+            "stop": False,
+            "flush_time": time.time()
+        }
+
+        def flush():
+            count = state["count"]
+            state["flush_time"] = time.time()
+            if count == 0:
+                return
+            samples = ring[0:count * RECORD_SIZE]
+            with open(self.binlog, "ab") as f:
+                samples.tofile(f)
+            append_text_logs(self.log_path, samples)
+            state["count"] = 0
+
+        def on_term(signum, frame):
+            state["stop"] = True
 
-        def cpu_mon(file):
-            TIMESTAMP = datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S')
-            cmd = "mpstat -P ALL 1 1|grep -v Average|grep all|awk '{print (100-$NF)/100}'"
-            res, out = rcw(cmd, 10)
-            if res:
-                result = "error"
-            result = TIMESTAMP + "\t" + out[0]
-            with open(file, 'a') as f:
-                f.write(result)
-
-        def mem_mon(file):
-            TIMESTAMP = datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S')
-            cmd = "free -g|grep -i mem|awk '{print $3/$2}'"
-            res, out = rcw(cmd, 10)
-            if res:
-                result = "error"
-            result = TIMESTAMP + "\t" + out[0]
-            with open(file, 'a') as f:
-                f.write(result)
-
-        def pwr_mon(file):
-            TIMESTAMP = datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S')
-            cmd = "ipmitool sdr list|grep -i Watts|awk 'BEGIN{FS = \"|\"}{for (f=1; f <= NF; f+=1) {if ($f ~ /Watts/)" \
-                  " {print $f}}}'|awk '{print $1}'|sort -n -r|head -n1"
-#             # support cambriocn mlu
-#             if "cambricon" in self.vendor:
-#                 cmd = "echo $(( $(ipmitool sdr list | grep -i Watts | awk 'BEGIN{FS=\"|\"} {for (f=1; f<=NF; f++) {if ($f ~ /Watts/) print $f}}' | awk '{print $1}' | sort -n -r | head -n 1) + $(cnmon info -c 0 | grep 'Machine' | awk '{print $3}') ))"
-            
-            res, out = rcw(cmd, 10)
-            if res:
-                result = "error"
-
-            if (out[0] == ""):
-                cmd = "ipmitool dcmi power reading | grep -i 'Instantaneous power reading' | awk -F': *' '{sub(/[^0-9]+/,\"\",$2); print $2}'"
-                res, out = rcw(cmd, 10)
-
-            result = TIMESTAMP + "\t" + out[0]
-            with open(file, 'a') as f:
-                f.write(result)
-
-        def timer_cpu_mon():
-            cpu_process = Process(target=cpu_mon, args=(self.cpulog, ))
-            cpu_process.start()
-
-        def timer_mem_mon():
-            mem_process = Process(target=mem_mon, args=(self.memlog, ))
-            mem_process.start()
-
-        def timer_pwr_mon():
-            pwr_process = Process(target=pwr_mon, args=(self.pwrlog, ))
-            pwr_process.start()
-
-        schedule.every(self.rate1).seconds.do(timer_cpu_mon)
-        schedule.every(self.rate1).seconds.do(timer_mem_mon)
-        schedule.every(self.rate2).seconds.do(timer_pwr_mon)
-        schedule.run_all()
-        while True:
-            schedule.run_pending()
-            time.sleep(5)
+        def ipmi_pwr_mon():
+            while True:
+                state["ipmi_pwr"] = read_ipmi_power()
+                time.sleep(self.rate2)
+
+        signal.signal(signal.SIGTERM, on_term)
+        sensors = find_power_sensors()
+        if len(sensors) == 0:
+            threading.Thread(target=ipmi_pwr_mon, daemon=True).start()
+
+        last_idle, last_total = read_cpu_times()
+        next_time = time.time()
+        while not state["stop"]:
+            next_time += self.rate1
+            time.sleep(max(0.0, next_time - time.time()))
+            idle, total = read_cpu_times()
+            cpu = NAN
+            if total > last_total:
+                cpu = 1.0 - (idle - last_idle) / (total - last_total)
+            last_idle, last_total = idle, total
+            if len(sensors) != 0:
+                pwr = read_power(sensors)
+            else:
+                pwr, state["ipmi_pwr"] = state["ipmi_pwr"], NAN
+            offset = state["count"] * RECORD_SIZE
+            ring[offset:offset + RECORD_SIZE] = array(
+                "d", [time.time(), cpu, read_mem_usage(), pwr])
+            state["count"] += 1
+            if state["count"] == RING_SAMPLES or \
+                    time.time() - state["flush_time"] >= FLUSH_SECONDS:
+                flush()
+        flush()
+        sys.exit(0)
 
     def daemonize(self):
         if self.verbose >= 1:
@@ -182,7 +332,7 @@ class Daemon:
         if not os.path.exists(self.log_path):
             os.makedirs(self.log_path)
         else:
-            for i in self.cpulog, self.memlog, self.pwrlog:
+            for i in self.cpulog, self.memlog, self.pwrlog, self.binlog:
                 if os.path.exists(i):
                     os.remove(i)
         if self.verbose >= 1:
@@ -207,15 +357,19 @@ class Daemon:
             if os.path.exists(self.pidfile):
                 os.remove(self.pidfile)
             return
-        # try to kill the daemon process
+        # try to kill the daemon process. It writes its last samples when
+        # terminated, so it is killed only if it doesn't exit in time.
         try:
-            i = 0
+            os.kill(pid, signal.SIGTERM)
+            deadline = time.time() + STOP_TIMEOUT
             while 1:
-                os.kill(pid, signal.SIGTERM)
-                time.sleep(1)
-                i = i + 1
-                if i % 10 == 0:
-                    os.kill(pid, signal.SIGHUP)
+                time.sleep(0.1)
+                if time.time() >= deadline:
+                    sys.stderr.write('daemon process [%d] did not exit in %d '
+                                     'seconds, killing it\n' %
+                                     (pid, STOP_TIMEOUT))
+                    os.kill(pid, signal.SIGKILL)
+                os.kill(pid, 0)
         except OSError as err:
             err = str(err)
             if err.find('No such process') > 0:
@@ -267,7 +421,7 @@ def parse_args():
 
 
 def main():
-    sample_rate1 = 5
+    sample_rate1 = 0.5
     sample_rate2 = 120
     args = parse_args()
     operation = args.o
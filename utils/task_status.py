@@ -0,0 +1,117 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Task status records written by the in-container launchers.
+
+A launcher writes <pid file name>.status next to its pid file, once with
+state "running" when it starts and once with state "finished" when it
+exits. The log dir is usually bind-mounted at the same path, so the record
+is polled on the host without docker exec. The files are also read as the
+task sees them, e.g. by docker exec, at each pid check, so a log dir
+mounted at another path only delays the end of the wait till the next one.
+'''
+
+import os
+import json
+import time
+
+STATE_RUNNING = "running"
+STATE_FINISHED = "finished"
+
+# Return codes of wait_for_finish(), and exit codes of "waitfinish".
+# argparse exits with 2 and ssh with 255, they mustn't look like a wait.
+FINISHED = 0
+STILL_RUNNING = 3
+NOT_STARTED = 4
+
+
+def status_file_of(pid_file_path):
+    '''Return the status file path that belongs to the pid file.'''
+    return os.path.splitext(pid_file_path)[0] + ".status"
+
+
+def write_status_file(status_dir, status_file, state, **extra):
+    '''Write the status record of the task for the host waiting on it.
+       The record is replaced atomically, so the host never reads a partial
+       one.
+    '''
+    status_file_path = os.path.join(status_dir, status_file)
+    record = {"state": state, "pid": os.getpid(), "time": time.time()}
+    record.update(extra)
+    tmp_file_path = status_file_path + ".tmp"
+    with open(tmp_file_path, "w") as file_d:
+        json.dump(record, file_d)
+    os.replace(tmp_file_path, status_file_path)
+
+
+def read_text(file_path):
+    '''Return the text of a file, None if it can't be read.'''
+    try:
+        with open(file_path, "r") as file_d:
+            return file_d.read()
+    except OSError:
+        return None
+
+
+def parse_status(text):
+    '''Return the status record in text as a dict, None if it is none.'''
+    if text is None:
+        return None
+    try:
+        record = json.loads(text)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def read_status(status_file_path):
+    '''Return the status record as a dict, None if it can't be read.'''
+    return parse_status(read_text(status_file_path))
+
+
+def wait_for_finish(pid_file_path,
+                    is_pid_running,
+                    timeout=600,
+                    poll_interval=0.5,
+                    pid_check_interval=30,
+                    start_timeout=600,
+                    read_task_file=read_text):
+    '''Block until the launcher that owns pid_file_path finished.
+       The status record is polled on the host every poll_interval seconds.
+       Every pid_check_interval seconds the status and pid files are read
+       by read_task_file(path) as the launcher sees them, and launchers
+       that don't write status records, or die without writing "finished",
+       are detected by is_pid_running(pid_file_path) once their pid file
+       exists.
+       Return (FINISHED, record), (STILL_RUNNING, record) after timeout,
+       or (NOT_STARTED, None) if the launcher didn't start in start_timeout.
+    '''
+    status_file_path = status_file_of(pid_file_path)
+    start = time.time()
+    last_pid_check = start
+    record = None
+    while True:
+        record = read_status(status_file_path)
+        if record is not None and record.get("state") == STATE_FINISHED:
+            return FINISHED, record
+
+        now = time.time()
+        if now - last_pid_check >= pid_check_interval:
+            last_pid_check = now
+            if record is None:
+                record = parse_status(read_task_file(status_file_path))
+                if record is not None and \
+                        record.get("state") == STATE_FINISHED:
+                    return FINISHED, record
+            if read_task_file(pid_file_path) is not None:
+                if not is_pid_running(pid_file_path):
+                    # Read again in case it finished between two polls.
+                    return FINISHED, parse_status(
+                        read_task_file(status_file_path))
+            elif record is None and now - start >= start_timeout:
+                print("Task didn't start in", start_timeout, "seconds.")
+                return NOT_STARTED, None
+
+        if now - start >= timeout:
+            return STILL_RUNNING, record
+        time.sleep(poll_interval)
@@ -0,0 +1,378 @@
+# Copyright  2022 BAAI. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License")
+'''Accelerator telemetry sampler used by the vendor monitors.
+
+A backend keeps one query session open to the driver and yields typed
+records, a recorder appends them to a compact time-series file
+(<vendor>_telemetry.bin, native float64 values, FIELDS per record).
+Backends:
+    nvidia-smi  one long-running "nvidia-smi --query-gpu ... -lms" process
+    nvml        pynvml in this process, if installed
+    replay      records from a csv or .bin file, for tests without devices
+usage:
+telemetry.py -o record -b replay -i [csv/bin file] -f [telemetry file]
+telemetry.py -o dump -f [telemetry file]
+'''
+
+import os
+import sys
+import time
+import subprocess
+from array import array
+from argparse import ArgumentParser
+
+# Fields of one record. mem and mem_total are in MiB, power in watts,
+# temp in celsius, util in percent. Unknown values are NaN.
+FIELDS = ["timestamp", "device", "temp", "power", "mem", "mem_total", "util"]
+RECORD_SIZE = len(FIELDS)
+# Records kept in memory before they are appended to the file, they are
+# also appended every FLUSH_SECONDS.
+RING_RECORDS = 512
+FLUSH_SECONDS = 10
+NAN = float("nan")
+
+NVIDIA_SMI_QUERY = "index,temperature.gpu,power.draw,memory.used," \
+                   "memory.total,utilization.gpu"
+
+
+def telemetry_file_of(log_path, vendor):
+    '''Return the telemetry file path of vendor in log_path.'''
+    return os.path.join(log_path, vendor + "_telemetry.bin")
+
+
+def _to_float(value):
+    '''Parse a field printed by a vendor tool, NaN if it isn't a number.'''
+    try:
+        return float(value.strip().rstrip("CWiBM%"))
+    except ValueError:
+        return NAN
+
+
+class TelemetryBackend:
+    '''Base class of telemetry backends.
+    usage: subclass it and override records(). records() yields tuples
+    of FIELDS until close() is called or the source is exhausted.
+    '''
+
+    name = None
+
+    def records(self):
+        '''Yield records of all the devices, one tuple per device.'''
+        raise NotImplementedError
+
+    def close(self):
+        '''Stop the query session.'''
+        pass
+
+
+class NvidiaSmiBackend(TelemetryBackend):
+    '''Sample all the gpus with a single "nvidia-smi -lms" process.'''
+
+    name = "nvidia-smi"
+
+    def __init__(self, interval=0.5):
+        self.interval_ms = max(1, int(interval * 1000))
+        self.process = None
+
+    def records(self):
+        cmd = [
+            "nvidia-smi", "--query-gpu=" + NVIDIA_SMI_QUERY,
+            "--format=csv,noheader,nounits", "-lms",
+            str(self.interval_ms)
+        ]
+        self.process = subprocess.Popen(cmd,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL,
+                                        encoding="utf-8")
+        timestamp = None
+        last_device = None
+        for line in self.process.stdout:
+            values = line.split(",")
+            if len(values) != RECORD_SIZE - 1:
+                continue
+            values = [_to_float(v) for v in values]
+            # The devices of one -lms sample share its timestamp, a sample
+            # starts where the device index wraps.
+            if last_device is None or not values[0] > last_device:
+                timestamp = time.time()
+            last_device = values[0]
+            yield tuple([timestamp] + values)
+        self.process.wait()
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class NvmlBackend(TelemetryBackend):
+    '''Sample all the gpus through NVML in this process.'''
+
+    name = "nvml"
+
+    def __init__(self, interval=0.5):
+        import pynvml
+        self.nvml = pynvml
+        self.interval = interval
+        self.stopped = False
+
+    def _read(self, handle, func, scale=1.0):
+        try:
+            return func(handle) * scale
+        except self.nvml.NVMLError:
+            return NAN
+
+    def records(self):
+        nvml = self.nvml
+        nvml.nvmlInit()
+        try:
+            handles = [
+                nvml.nvmlDeviceGetHandleByIndex(i)
+                for i in range(nvml.nvmlDeviceGetCount())
+            ]
+            next_time = time.time()
+            while not self.stopped:
+                now = time.time()
+                for index, handle in enumerate(handles):
+                    try:
+                        mem_info = nvml.nvmlDeviceGetMemoryInfo(handle)
+                        mem = mem_info.used / 1048576.0
+                        mem_total = mem_info.total / 1048576.0
+                    except nvml.NVMLError:
+                        mem, mem_total = NAN, NAN
+                    temp = self._read(
+                        handle, lambda h: nvml.nvmlDeviceGetTemperature(
+                            h, nvml.NVML_TEMPERATURE_GPU))
+                    power = self._read(handle, nvml.nvmlDeviceGetPowerUsage,
+                                       0.001)
+                    util = self._read(
+                        handle,
+                        lambda h: nvml.nvmlDeviceGetUtilizationRates(h).gpu)
+                    yield (now, index, temp, power, mem, mem_total, util)
+                next_time += self.interval
+                time.sleep(max(0.0, next_time - time.time()))
+        finally:
+            nvml.nvmlShutdown()
+
+    def close(self):
+        self.stopped = True
+
+
+class ReplayBackend(TelemetryBackend):
+    '''Replay records of a telemetry .bin file, or of a csv file with
+       FIELDS per line. If realtime is set, records are yielded with the
+       recorded intervals.'''
+
+    name = "replay"
+
+    def __init__(self, replay_file, realtime=False):
+        self.replay_file = replay_file
+        self.realtime = realtime
+        self.stopped = False
+
+    def _load(self):
+        if self.replay_file.endswith(".bin"):
+            values = read_records(self.replay_file)
+            return [
+                tuple(values[i:i + RECORD_SIZE])
+                for i in range(0, len(values), RECORD_SIZE)
+            ]
+        records = []
+        with open(self.replay_file, "r") as file_d:
+            for line in file_d:
+                values = line.split(",")
+                if len(values) == RECORD_SIZE:
+                    records.append(tuple(_to_float(v) for v in values))
+        return records
+
+    def records(self):
+        last_timestamp = None
+        for record in self._load():
+            if self.stopped:
+                break
+            if self.realtime and last_timestamp is not None:
+                time.sleep(max(0.0, record[0] - last_timestamp))
+            last_timestamp = record[0]
+            yield record
+
+    def close(self):
+        self.stopped = True
+
+
+BACKENDS = {
+    NvidiaSmiBackend.name: NvidiaSmiBackend,
+    NvmlBackend.name: NvmlBackend,
+    ReplayBackend.name: ReplayBackend,
+}
+
+# Backend tried first for a vendor when "auto" is asked for.
+VENDOR_BACKENDS = {"nvidia": ["nvml", "nvidia-smi"]}
+
+
+def register_backend(backend_class, vendor=None):
+    '''Add a backend class, and make it the first choice of vendor.'''
+    BACKENDS[backend_class.name] = backend_class
+    if vendor is not None:
+        VENDOR_BACKENDS.setdefault(vendor, []).insert(0, backend_class.name)
+
+
+def create_backend(name, vendor="nvidia", **kwargs):
+    '''Return a backend instance. name "auto" picks the first backend of
+       vendor that can be created.'''
+    if name != "auto":
+        return BACKENDS[name](**kwargs)
+    for candidate in VENDOR_BACKENDS.get(vendor, []):
+        try:
+            return BACKENDS[candidate](**kwargs)
+        except ImportError:
+            continue
+    raise ValueError("No telemetry backend for vendor " + vendor)
+
+
+class TelemetryRecorder:
+    '''Append records of a backend to a telemetry file through a
+       preallocated ring buffer. on_flush(records) is called with the flat
+       array of the records appended by each flush, e.g. to append them to
+       a text log too.'''
+
+    def __init__(self,
+                 backend,
+                 telemetry_file,
+                 ring_records=RING_RECORDS,
+                 flush_seconds=FLUSH_SECONDS,
+                 on_flush=None):
+        self.backend = backend
+        self.telemetry_file = telemetry_file
+        self.ring = array("d", [NAN] * (ring_records * RECORD_SIZE))
+        self.ring_records = ring_records
+        self.flush_seconds = flush_seconds
+        self.on_flush = on_flush
+        self.flush_time = time.time()
+        self.count = 0
+        self.stopped = False
+
+    def flush(self):
+        '''Append buffered records to the telemetry file.'''
+        self.flush_time = time.time()
+        if self.count == 0:
+            return
+        records = self.ring[0:self.count * RECORD_SIZE]
+        with open(self.telemetry_file, "ab") as file_d:
+            records.tofile(file_d)
+        self.count = 0
+        if self.on_flush is not None:
+            self.on_flush(records)
+
+    def run(self):
+        '''Record until stop() is called or the backend is exhausted.'''
+        try:
+            for record in self.backend.records():
+                offset = self.count * RECORD_SIZE
+                self.ring[offset:offset + RECORD_SIZE] = array("d", record)
+                self.count += 1
+                if self.count == self.ring_records or time.time() - \
+                        self.flush_time >= self.flush_seconds:
+                    self.flush()
+                if self.stopped:
+                    break
+        finally:
+            self.backend.close()
+            self.flush()
+
+    def stop(self):
+        '''Ask run() to return after the record being read. Safe to call
+           from a signal handler.'''
+        self.stopped = True
+        self.backend.close()
+
+
+def read_records(telemetry_file):
+    '''Return all records in telemetry_file as a flat array of float64,
+       RECORD_SIZE values per record.'''
+    records = array("d")
+    with open(telemetry_file, "rb") as file_d:
+        data = file_d.read()
+    records.frombytes(data[0:len(data) - len(data) % (8 * RECORD_SIZE)])
+    return records
+
+
+def read_device_series(telemetry_file, field):
+    '''Return {device: [value, ...]} of field, NaN values are skipped.'''
+    records = read_records(telemetry_file)
+    column = FIELDS.index(field)
+    series = {}
+    for i in range(0, len(records), RECORD_SIZE):
+        value = records[i + column]
+        if value == value:
+            series.setdefault(int(records[i + 1]), []).append(value)
+    return series
+
+
+def analysis_result(telemetry_file, nproc):
+    '''Return temp/power/mem series of devices 0..nproc-1 and max_mem,
+       in the format of the vendor analysis_log().'''
+    result = {"temp": {}, "power": {}, "mem": {}}
+    for index, field in [("temp", "temp"), ("power", "power"),
+                         ("mem", "mem")]:
+        series = read_device_series(telemetry_file, field)
+        for device in range(nproc):
+            result[index][device] = series.get(device, [])
+    mem_total = read_device_series(telemetry_file, "mem_total")
+    for device in range(nproc):
+        if len(mem_total.get(device, [])) != 0:
+            result["max_mem"] = mem_total[device][0]
+            break
+    return result
+
+
+def _parse_args():
+    '''Get command args from input. '''
+    parser = ArgumentParser(description="Accelerator telemetry sampler. ")
+    parser.add_argument("-o",
+                        type=str,
+                        required=True,
+                        choices=["record", "dump"],
+                        help="Operation:"
+                        "record Record telemetry to file until interrupted;"
+                        "dump Print records of file as csv.")
+    parser.add_argument("-f", type=str, required=True, help="telemetry file")
+    parser.add_argument("-b",
+                        type=str,
+                        default="auto",
+                        help="backend: auto|" + "|".join(BACKENDS.keys()))
+    parser.add_argument("-v", type=str, default="nvidia", help="vendor")
+    parser.add_argument("-i", type=str, default=None, help="replay file")
+    parser.add_argument("-r",
+                        type=float,
+                        default=0.5,
+                        help="sample interval in seconds")
+    return parser.parse_args()
+
+
+def main():
+    '''Support command line for telemetry recording and dumping.'''
+    args = _parse_args()
+    if args.o == "record":
+        if args.b == ReplayBackend.name:
+            backend = ReplayBackend(args.i)
+        else:
+            backend = create_backend(args.b, args.v, interval=args.r)
+        recorder = TelemetryRecorder(backend, args.f)
+        try:
+            recorder.run()
+        except KeyboardInterrupt:
+            recorder.flush()
+    elif args.o == "dump":
+        records = read_records(args.f)
+        print(",".join(FIELDS))
+        for i in range(0, len(records), RECORD_SIZE):
+            print(",".join(str(v) for v in records[i:i + RECORD_SIZE]))
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()